@@ -0,0 +1,70 @@
+import asyncio
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import JSONResponse
+from app.models.embeddings import embedding_pool_stats
+from app.services.readiness import get_readiness
+from app.services.retrieval_service import RetrievalService, get_retrieval_service
+from app.utils.config import get_service_config
+
+router = APIRouter(tags=["health"])
+
+@router.get("/healthz")
+async def healthz():
+    """存活检查：进程能响应请求即返回200，不依赖检索器是否已加载"""
+    return {"status": "ok"}
+
+@router.get("/readyz")
+async def readyz(retrieval_service: RetrievalService = Depends(get_retrieval_service)):
+    """就绪检查：预热阶段结束且必需的检索器（ready_required_retrievers）可用时返回200，否则返回503
+    
+    按检索器报告是否可用（ready）、是否必需、预热结果和耗时、是否已加载、文档数、嵌入模型加载耗时
+    和最近一次请求耗时；可选检索器不可用不影响整体就绪。探测结果缓存 health_probe_ttl_s 秒，
+    缓存有效期内的调用不访问向量库。
+    """
+    service_config = get_service_config()
+    readiness = get_readiness()
+    snapshot = readiness.snapshot()
+    warmup = snapshot.pop("retrievers")
+    # 缓存过期时的探测会访问向量库，放到线程中执行；模型池统计同样在线程中读取，不在事件循环上等锁
+    health, embedding_models = await asyncio.to_thread(
+        lambda: (retrieval_service.health(service_config.health_probe_ttl_s), embedding_pool_stats())
+    )
+    required = set(service_config.ready_required_retrievers)
+    for name, item in health.items():
+        if name in warmup:
+            item["warmup"] = warmup[name]
+        item["ready"] = _retriever_ready(item)
+        item["required"] = name in required
+    # 必需但未启用的检索器同样视为未就绪
+    missing = sorted(required - health.keys())
+    ready = readiness.ready and not missing and all(health[name]["ready"] for name in required)
+    body = {**snapshot, "ready": ready, "retrievers": health, "embedding_models": embedding_models}
+    if missing:
+        body["missing_required"] = missing
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+def _retriever_ready(item: dict) -> bool:
+    """单个检索器是否可用：依赖探测正常，且预热过时已成功（失败后由后台重试更新）"""
+    if item.get("status") == "error":
+        return False
+    warmup = item.get("warmup")
+    return warmup is None or warmup.get("status") == "ready"
+
+def _not_ready_response() -> JSONResponse:
+    return JSONResponse(
+        {"detail": "Service is warming up", "state": get_readiness().state},
+        status_code=503,
+        headers={"Retry-After": "5"}
+    )
+
+async def readiness_middleware(request: Request, call_next):
+    """后台预热期间按 not_ready_policy 处理 /api 请求：直接处理、拒绝（503）或排队等待预热完成"""
+    readiness = get_readiness()
+    if readiness.warming and request.url.path.startswith("/api/"):
+        service_config = get_service_config()
+        if service_config.not_ready_policy == "reject":
+            return _not_ready_response()
+        if (service_config.not_ready_policy == "queue"
+                and not await readiness.wait(service_config.not_ready_queue_timeout_s)):
+            return _not_ready_response()
+    return await call_next(request)
@@ -1,7 +1,9 @@
 from .agent import router as agent_router
 from .retrieval import router as retrieval_router
+from .ingest import router as ingest_router
 
 __all__ = [
     "agent_router",
-    "retrieval_router"
+    "retrieval_router",
+    "ingest_router"
 ]
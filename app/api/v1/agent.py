@@ -1,6 +1,10 @@
+import json
+from typing import Any, AsyncIterator
 from fastapi import APIRouter, Depends, HTTPException
-from app.services.retrieval_service import RetrievalService
+from fastapi.responses import StreamingResponse
+from app.services.retrieval_service import RetrievalService, get_retrieval_service
 from app.schemas.agent import AgentRequest, AgentResponse
+from app.utils.metrics import request_scope, rounded, serialize_response
 
 router = APIRouter(prefix="/agent", tags=["agent"])
 
@@ -35,25 +39,69 @@ router = APIRouter(prefix="/agent", tags=["agent"])
              })
 async def agent_query(
     request: AgentRequest,
-    retrieval_service: RetrievalService = Depends()
+    retrieval_service: RetrievalService = Depends(get_retrieval_service)
 ):
-    """执行Agent查询请求"""
+    """执行Agent查询请求，include_timings 为真时在响应中返回各阶段耗时"""
     try:
         # 执行检索
-        retrieval_result = retrieval_service.retrieve(
-            retriever_name=request.retriever_name,
-            query=request.query,
-            **request.kwargs
-        )
+        with request_scope("/api/v1/agent/query", collect=request.include_timings) as timings:
+            retrieval_result = await retrieval_service.aretrieve(
+                retriever_name=request.retriever_name,
+                query=request.query,
+                **request.kwargs
+            )
         
         # 这里可以添加LLM调用逻辑，整合检索结果生成最终回答
         # 目前简单返回检索结果
-        return AgentResponse(
+        response = AgentResponse(
             query=request.query,
             retriever=request.retriever_name,
-            result=retrieval_result
+            result=retrieval_result,
+            timings=rounded(timings) if request.include_timings else None
         )
+        return serialize_response(response, request.retriever_name, "/api/v1/agent/query")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Agent查询失败: {str(e)}")
+
+
+def _sse_event(event: str, data: Any) -> str:
+    """格式化为一条SSE消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/stream",
+             response_class=StreamingResponse,
+             responses={200: {"content": {"text/event-stream": {}},
+                              "description": "SSE事件流：sources → token... → done，出错时发送 error 事件"}})
+async def agent_stream(
+    request: AgentRequest,
+    retrieval_service: RetrievalService = Depends(get_retrieval_service)
+):
+    """以SSE流式执行Agent查询：先推送检索来源，再逐token推送答案，最后推送耗时信息"""
+    try:
+        # 在开始推送前确认检索器可用，便于返回正确的HTTP状态码
+        await retrieval_service.aget_retriever(request.retriever_name)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Agent查询失败: {str(e)}")
+    
+    async def event_stream() -> AsyncIterator[str]:
+        try:
+            with request_scope("/api/v1/agent/stream"):
+                async for event in retrieval_service.astream(
+                    retriever_name=request.retriever_name,
+                    query=request.query,
+                    **request.kwargs
+                ):
+                    yield _sse_event(event["event"], event["data"])
+        except Exception as e:
+            # 响应头已发送，只能通过事件通知客户端
+            yield _sse_event("error", {"detail": f"Agent查询失败: {str(e)}"})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,164 @@
+import asyncio
+import os
+import re
+import shutil
+import uuid
+from typing import Any, BinaryIO, Dict, List
+from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
+from app.services.ingestion_jobs import (
+    IngestionJobManager,
+    IngestionQueueFull,
+    get_ingestion_manager,
+    resolve_ingest_path
+)
+from app.services.ingestion_service import SUPPORTED_SUFFIXES, IngestionService
+from app.services.retrieval_service import RetrievalService, get_retrieval_service
+from app.schemas.ingest import IngestRequest, IngestJobResponse
+from app.utils.config import get_service_config
+
+router = APIRouter(prefix="/ingest", tags=["ingest"])
+
+def _check_retriever(retrieval_service: RetrievalService, retriever_name: str) -> None:
+    if retriever_name not in retrieval_service.list_retrievers():
+        raise HTTPException(status_code=400, detail=f"Retriever {retriever_name} not found")
+
+def _submit(manager: IngestionJobManager, retrieval_service: RetrievalService,
+            retriever_name: str, paths: List[str], force: bool) -> IngestJobResponse:
+    _check_retriever(retrieval_service, retriever_name)
+    try:
+        job = manager.submit(retriever_name, paths, force=force)
+    except IngestionQueueFull as e:
+        # 背压：队列满时拒绝，提示客户端稍后重试
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+    return IngestJobResponse(**job.to_dict())
+
+@router.post("/files", response_model=IngestJobResponse, status_code=202,
+             openapi_extra={
+                 "requestBody": {
+                     "content": {
+                         "application/json": {
+                             "examples": {
+                                 "导入目录示例": {
+                                     "summary": "导入服务器上的目录",
+                                     "description": "递归导入目录下的 pdf/txt/md 文件，未变化的文件自动跳过",
+                                     "value": {
+                                         "retriever_name": "langchain_rag",
+                                         "paths": ["./data/docs"],
+                                         "force": False
+                                     }
+                                 }
+                             }
+                         }
+                     }
+                 }
+             })
+async def ingest_files(
+    request: IngestRequest,
+    manager: IngestionJobManager = Depends(get_ingestion_manager),
+    retrieval_service: RetrievalService = Depends(get_retrieval_service)
+):
+    """提交服务器本地文件的后台导入任务"""
+    try:
+        paths = [resolve_ingest_path(path) for path in request.paths]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _submit(manager, retrieval_service, request.retriever_name, paths, request.force)
+
+def _safe_name(name: str) -> str:
+    """只保留基本名称，替换路径分隔符和特殊字符；无法得到有效文件名时返回400"""
+    name = re.sub(r"[^\w.\- ]", "_", os.path.basename((name or "").replace("\\", "/"))).strip()
+    if not name.strip("."):
+        raise HTTPException(status_code=400, detail=f"无效的文件名: {name}")
+    return name
+
+def _upload_path(retriever_name: str, filename: str) -> str:
+    """上传文件按 检索器/文件名 保存在固定位置：重新上传同名文件会替换原文件，导入时按内容哈希增量更新"""
+    return os.path.abspath(os.path.join(
+        get_service_config().ingest_upload_dir, _safe_name(retriever_name), _safe_name(filename)
+    ))
+
+def _save_upload(source: BinaryIO, path: str) -> None:
+    """先写入临时文件再原子替换，正在读取旧文件的导入任务不受影响；失败时删除临时文件"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.part"
+    try:
+        with open(tmp_path, "wb") as f:
+            shutil.copyfileobj(source, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+@router.post("/upload", response_model=IngestJobResponse, status_code=202)
+async def ingest_upload(
+    files: List[UploadFile] = File(..., description="要导入的 pdf/txt/md 文件"),
+    retriever_name: str = Form(default="langchain_rag", description="目标检索器名称"),
+    force: bool = Form(default=False, description="忽略内容哈希，重新处理全部文件"),
+    manager: IngestionJobManager = Depends(get_ingestion_manager),
+    retrieval_service: RetrievalService = Depends(get_retrieval_service)
+):
+    """上传文件并提交后台导入任务
+    
+    文件保存在 ingest_upload_dir/检索器/文件名，重新上传修改后的同名文件时替换原文件及其块，
+    未变化的文件按内容哈希跳过；不再需要的上传文件通过 DELETE /ingest/uploads 删除。
+    """
+    _check_retriever(retrieval_service, retriever_name)
+    paths = []
+    for upload in files:
+        if not (upload.filename or "").lower().endswith(SUPPORTED_SUFFIXES):
+            raise HTTPException(status_code=400, detail=f"不支持的文件格式: {upload.filename}")
+        path = _upload_path(retriever_name, upload.filename)
+        if path in paths:
+            raise HTTPException(status_code=400, detail=f"同一请求中的文件重名: {upload.filename}")
+        paths.append(path)
+    
+    # 写盘放到线程中执行，大文件上传不阻塞事件循环
+    for upload, path in zip(files, paths):
+        await asyncio.to_thread(_save_upload, upload.file, path)
+    return _submit(manager, retrieval_service, retriever_name, paths, force)
+
+@router.delete("/uploads/{retriever_name}/{filename}", response_model=Dict[str, Any])
+async def delete_upload(
+    retriever_name: str,
+    filename: str,
+    retrieval_service: RetrievalService = Depends(get_retrieval_service)
+):
+    """删除上传的文件，并从检索器的向量库中移除该文件的全部块"""
+    _check_retriever(retrieval_service, retriever_name)
+    path = _upload_path(retriever_name, filename)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail=f"上传文件不存在: {filename}")
+    
+    def remove() -> int:
+        # 与该检索器向量库上的导入任务依次执行，正在导入时等待其完成
+        ingestion = IngestionService.for_retriever(retrieval_service.get_retriever(retriever_name))
+        deleted = ingestion.delete_files([path])
+        if deleted:
+            retrieval_service.invalidate_cache()
+        return deleted
+    
+    try:
+        deleted = await asyncio.to_thread(remove)
+    except FileNotFoundError:
+        # 等待期间已被其他请求删除
+        raise HTTPException(status_code=404, detail=f"上传文件不存在: {filename}")
+    return {"file": path, "chunks_deleted": deleted}
+
+@router.get("/jobs", response_model=List[IngestJobResponse])
+async def list_jobs(
+    manager: IngestionJobManager = Depends(get_ingestion_manager)
+):
+    """列出最近的导入任务，最新的在前"""
+    return [IngestJobResponse(**job.to_dict()) for job in manager.list_jobs()]
+
+@router.get("/jobs/{job_id}", response_model=IngestJobResponse)
+async def get_job(
+    job_id: str,
+    manager: IngestionJobManager = Depends(get_ingestion_manager)
+):
+    """查询导入任务的状态和进度"""
+    job = manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return IngestJobResponse(**job.to_dict())
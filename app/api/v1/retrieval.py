@@ -1,7 +1,15 @@
+import asyncio
 from fastapi import APIRouter, Depends, HTTPException
-from typing import Dict
-from app.services.retrieval_service import RetrievalService
-from app.schemas.retrieval import RetrievalRequest, RetrievalResponse
+from typing import Any, Dict, Optional
+from app.services.retrieval_service import RetrievalService, get_retrieval_service
+from app.utils.metrics import request_scope, rounded, serialize_response
+from app.schemas.retrieval import (
+    RetrievalRequest,
+    RetrievalResponse,
+    BatchRetrievalRequest,
+    BatchRetrievalItem,
+    BatchRetrievalResponse
+)
 
 router = APIRouter(prefix="/retrieval", tags=["retrieval"])
 
@@ -28,6 +36,29 @@ router = APIRouter(prefix="/retrieval", tags=["retrieval"])
                                          "query": "介绍一下Chroma DB",
                                          "kwargs": {"top_k": 5}
                                      }
+                                 },
+                                 "仅检索示例": {
+                                     "summary": "只返回文档不生成答案",
+                                     "description": "返回 top_k 个文档的正文、元数据和相关度，不调用LLM",
+                                     "value": {
+                                         "retriever_name": "langchain_rag",
+                                         "query": "什么是向量数据库？",
+                                         "kwargs": {"top_k": 10, "search_type": "similarity"},
+                                         "retrieval_only": True
+                                     }
+                                 },
+                                 "搜索参数示例": {
+                                     "summary": "按请求调整搜索方式和过滤条件",
+                                     "description": "kwargs 支持 top_k、search_type(similarity/mmr/threshold)、fetch_k、lambda_mult、score_threshold、filter",
+                                     "value": {
+                                         "retriever_name": "langchain_rag",
+                                         "query": "介绍一下Chroma DB",
+                                         "kwargs": {
+                                             "top_k": 3,
+                                             "search_type": "similarity",
+                                             "filter": {"source": "docs/chroma.pdf"}
+                                         }
+                                     }
                                  }
                              }
                          }
@@ -36,28 +67,93 @@ router = APIRouter(prefix="/retrieval", tags=["retrieval"])
              })
 async def retrieve(
     request: RetrievalRequest,
-    retrieval_service: RetrievalService = Depends()
+    retrieval_service: RetrievalService = Depends(get_retrieval_service)
 ):
-    """执行检索请求"""
+    """执行检索请求，retrieval_only 为真时仅返回文档不调用LLM，include_timings 为真时返回各阶段耗时"""
     try:
-        result = retrieval_service.retrieve(
-            retriever_name=request.retriever_name,
-            query=request.query,
-            **request.kwargs
-        )
-        return RetrievalResponse(
+        run = retrieval_service.asearch if request.retrieval_only else retrieval_service.aretrieve
+        with request_scope("/api/v1/retrieval/query", collect=request.include_timings) as timings:
+            result = await run(
+                retriever_name=request.retriever_name,
+                query=request.query,
+                **request.kwargs
+            )
+        response = RetrievalResponse(
             query=request.query,
             retriever=request.retriever_name,
-            result=result
+            result=result,
+            timings=rounded(timings) if request.include_timings else None
         )
+        return serialize_response(response, request.retriever_name, "/api/v1/retrieval/query")
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"检索失败: {str(e)}")
 
+@router.post("/batch", response_model=BatchRetrievalResponse,
+             openapi_extra={
+                 "requestBody": {
+                     "content": {
+                         "application/json": {
+                             "examples": {
+                                 "批量检索示例": {
+                                     "summary": "一次提交多条检索请求",
+                                     "description": "同一检索器的查询一次批量向量化，结果按请求顺序返回，单条失败不影响其他条目",
+                                     "value": {
+                                         "items": [
+                                             {"retriever_name": "langchain_rag", "query": "什么是向量数据库？", "kwargs": {}},
+                                             {"retriever_name": "langchain_rag", "query": "介绍一下Chroma DB", "kwargs": {"top_k": 3}}
+                                         ],
+                                         "max_concurrency": 8
+                                     }
+                                 }
+                             }
+                         }
+                     }
+                 }
+             })
+async def batch_retrieve(
+    request: BatchRetrievalRequest,
+    retrieval_service: RetrievalService = Depends(get_retrieval_service)
+):
+    """执行批量检索请求"""
+    # 各条检索并发执行、分别计时，只写入直方图
+    with request_scope("/api/v1/retrieval/batch"):
+        outcomes = await retrieval_service.abatch_retrieve(
+            [item.model_dump() for item in request.items],
+            max_concurrency=request.max_concurrency
+        )
+    return BatchRetrievalResponse(results=[
+        BatchRetrievalItem(
+            index=index,
+            query=item.query,
+            retriever=item.retriever_name,
+            result=outcome["result"],
+            error=outcome["error"]
+        )
+        for index, (item, outcome) in enumerate(zip(request.items, outcomes))
+    ])
+
 @router.get("/retrievers", response_model=Dict[str, str])
 async def list_retrievers(
-    retrieval_service: RetrievalService = Depends()
+    retrieval_service: RetrievalService = Depends(get_retrieval_service)
 ):
     """列出所有可用的检索器"""
     return retrieval_service.list_retrievers()
+
+
+@router.get("/cache/stats", response_model=Dict[str, Any])
+async def cache_stats(
+    retrieval_service: RetrievalService = Depends(get_retrieval_service)
+):
+    """查看结果缓存的命中统计（精确命中、语义命中、未命中、命中率）"""
+    # 统计需要获取缓存和模型池的锁，放到线程中执行，避免在模型加载期间阻塞事件循环
+    return await asyncio.to_thread(retrieval_service.cache_stats)
+
+@router.delete("/cache", response_model=Dict[str, int])
+async def invalidate_cache(
+    retriever_name: Optional[str] = None,
+    retrieval_service: RetrievalService = Depends(get_retrieval_service)
+):
+    """清除结果缓存，未指定检索器时清除全部"""
+    return {"invalidated": retrieval_service.invalidate_cache(retriever_name)}
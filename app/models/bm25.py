@@ -0,0 +1,254 @@
+import math
+import os
+import re
+import threading
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 英文单词、数字和产品编号（如 SKU-1024、v2.1）整体作为一个词，同时拆出各部分
+_WORD_PATTERN = re.compile(r"[a-z0-9]+(?:[-_.][a-z0-9]+)*")
+_WORD_PART_PATTERN = re.compile(r"[a-z0-9]+")
+_CJK_PATTERN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+
+def _load_jieba():
+    try:
+        import jieba
+    except ImportError:
+        return None
+    jieba.setLogLevel(60)
+    return jieba
+
+def resolve_tokenizer(name: str = "auto") -> str:
+    """解析分词器名称：auto 时安装了 jieba 则使用 jieba，否则使用字二元组"""
+    if name == "auto":
+        return "jieba" if _load_jieba() is not None else "bigram"
+    if name == "jieba" and _load_jieba() is None:
+        raise ValueError("tokenizer 'jieba' requires the jieba package")
+    if name not in ("jieba", "bigram"):
+        raise ValueError(f"Unknown tokenizer: {name}")
+    return name
+
+def tokenize(text: str, tokenizer: str = "bigram") -> List[str]:
+    """中英文混合分词
+    
+    英文和数字按单词切分并转为小写；连续的中文用 jieba 搜索引擎模式切分，
+    未安装 jieba 时切为相邻两字组成的二元组（单字保持原样）。
+    """
+    text = text.lower()
+    tokens = []
+    for word in _WORD_PATTERN.findall(text):
+        tokens.append(word)
+        parts = _WORD_PART_PATTERN.findall(word)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    jieba = _load_jieba() if tokenizer == "jieba" else None
+    for run in _CJK_PATTERN.findall(text):
+        if jieba is not None:
+            tokens.extend(token for token in jieba.lcut_for_search(run) if token.strip())
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+class BM25Index:
+    """可增量更新的BM25倒排索引
+    
+    倒排表按词保存 (文档序号, 词频) 两个紧凑整型数组，新增文档直接追加；删除文档只做标记，
+    在删除比例较高或保存时压缩。以 .npz 格式持久化（词表 + CSR 形式的倒排表，不使用pickle），
+    启动时直接加载，不需要重新分词。
+    """
+    
+    def __init__(self, tokenizer: str = "auto", k1: float = 1.5, b: float = 0.75,
+                 path: Optional[str] = None):
+        self.tokenizer = resolve_tokenizer(tokenizer)
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.doc_ids: List[Optional[str]] = []
+        self.doc_index: Dict[str, int] = {}
+        self.doc_lengths = array("i")
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        self.total_length = 0
+        self.deleted = 0
+        self.dirty = False
+        self._lock = threading.RLock()
+    
+    def __len__(self) -> int:
+        return len(self.doc_index)
+    
+    def _remove(self, doc_id: str) -> None:
+        row = self.doc_index.pop(doc_id, None)
+        if row is None:
+            return
+        self.total_length -= self.doc_lengths[row]
+        self.doc_lengths[row] = 0
+        self.doc_ids[row] = None
+        self.deleted += 1
+    
+    def add(self, ids: List[str], texts: List[str]) -> None:
+        """新增或替换文档"""
+        tokenized = [Counter(tokenize(text, self.tokenizer)) for text in texts]
+        with self._lock:
+            for doc_id, counts in zip(ids, tokenized):
+                self._remove(doc_id)
+                row = len(self.doc_ids)
+                self.doc_ids.append(doc_id)
+                self.doc_index[doc_id] = row
+                length = sum(counts.values())
+                self.doc_lengths.append(length)
+                self.total_length += length
+                for term, tf in counts.items():
+                    rows, tfs = self.postings.setdefault(term, (array("i"), array("i")))
+                    rows.append(row)
+                    tfs.append(tf)
+            self.dirty = True
+    
+    def remove(self, ids: Iterable[str]) -> None:
+        """删除文档，倒排表中的记录在压缩时清除"""
+        with self._lock:
+            for doc_id in ids:
+                self._remove(doc_id)
+            self.dirty = True
+            if self.deleted > 1000 and self.deleted > len(self.doc_ids) // 4:
+                self.compact()
+    
+    def compact(self) -> None:
+        """去掉已删除文档，重新编号"""
+        import numpy as np
+        
+        with self._lock:
+            if not self.deleted:
+                return
+            lengths = np.frombuffer(self.doc_lengths, dtype=np.int32).copy()
+            alive = np.array([doc_id is not None for doc_id in self.doc_ids], dtype=bool)
+            remap = np.cumsum(alive, dtype=np.int64) - 1
+            postings = {}
+            for term, (rows, tfs) in self.postings.items():
+                rows_np = np.frombuffer(rows, dtype=np.int32)
+                keep = alive[rows_np]
+                if keep.any():
+                    postings[term] = (
+                        array("i", remap[rows_np[keep]].astype(np.int32).tobytes()),
+                        array("i", np.frombuffer(tfs, dtype=np.int32)[keep].tobytes())
+                    )
+                del rows_np
+            self.postings = postings
+            self.doc_ids = [doc_id for doc_id in self.doc_ids if doc_id is not None]
+            self.doc_index = {doc_id: row for row, doc_id in enumerate(self.doc_ids)}
+            self.doc_lengths = array("i", lengths[alive].tobytes())
+            self.deleted = 0
+    
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """返回BM25得分最高的 k 个 (文档ID, 得分)，耗时与查询词的倒排表长度相关"""
+        import numpy as np
+        
+        terms = set(tokenize(query, self.tokenizer))
+        with self._lock:
+            count = len(self.doc_index)
+            if not count or not terms:
+                return []
+            lengths = np.frombuffer(self.doc_lengths, dtype=np.int32)
+            avg_length = self.total_length / count or 1.0
+            all_rows, all_scores = [], []
+            for term in terms:
+                entry = self.postings.get(term)
+                if entry is None:
+                    continue
+                rows = np.array(entry[0], dtype=np.int32)
+                tfs = np.array(entry[1], dtype=np.float32)
+                doc_lengths = lengths[rows]
+                alive = doc_lengths > 0
+                rows, tfs, doc_lengths = rows[alive], tfs[alive], doc_lengths[alive]
+                if not len(rows):
+                    continue
+                idf = math.log(1 + (count - len(rows) + 0.5) / (len(rows) + 0.5))
+                all_rows.append(rows)
+                all_scores.append(idf * tfs * (self.k1 + 1) / (
+                    tfs + self.k1 * (1 - self.b + self.b * doc_lengths / avg_length)
+                ))
+            del lengths
+            if not all_rows:
+                return []
+            rows, inverse = np.unique(np.concatenate(all_rows), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(all_scores))
+            top = np.argsort(-scores)[:k] if len(scores) <= k else np.argpartition(-scores, k)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(self.doc_ids[rows[i]], float(scores[i])) for i in top]
+    
+    def save(self, path: Optional[str] = None) -> None:
+        """压缩后以 .npz 格式原子写入：词表、CSR 倒排表、文档ID和长度；未指定路径时写入 self.path"""
+        import numpy as np
+        
+        path = path or self.path
+        if not path:
+            return
+        with self._lock:
+            self.compact()
+            terms = list(self.postings)
+            offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+            for i, term in enumerate(terms):
+                offsets[i + 1] = offsets[i] + len(self.postings[term][0])
+            rows = np.empty(offsets[-1], dtype=np.int32)
+            tfs = np.empty(offsets[-1], dtype=np.int32)
+            for i, term in enumerate(terms):
+                rows[offsets[i]:offsets[i + 1]] = self.postings[term][0]
+                tfs[offsets[i]:offsets[i + 1]] = self.postings[term][1]
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            tmp_path = f"{path}.tmp.npz"
+            np.savez_compressed(
+                tmp_path,
+                tokenizer=np.array(self.tokenizer),
+                params=np.array([self.k1, self.b]),
+                terms=np.array(terms, dtype=str),
+                offsets=offsets,
+                rows=rows,
+                tfs=tfs,
+                doc_ids=np.array(self.doc_ids, dtype=str),
+                doc_lengths=np.frombuffer(self.doc_lengths, dtype=np.int32)
+            )
+            os.replace(tmp_path, path)
+            self.dirty = False
+        logger.info("BM25索引已保存: %s (%d 篇文档，%d 个词)", path, len(self.doc_ids), len(terms))
+    
+    @classmethod
+    def load(cls, path: str, tokenizer: str = "auto", k1: float = 1.5,
+             b: float = 0.75) -> Optional["BM25Index"]:
+        """从 .npz 文件加载索引；文件不存在、损坏或分词器不一致时返回None
+        
+        k1、b 只影响打分，不影响倒排表，按传入的配置计分；与文件中保存的参数不同时不需要重建，
+        下次保存时写入新参数。
+        """
+        import numpy as np
+        
+        if not os.path.exists(path):
+            return None
+        tokenizer = resolve_tokenizer(tokenizer)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if str(data["tokenizer"]) != tokenizer:
+                    logger.info("BM25索引 %s 使用其他分词器，需要重建", path)
+                    return None
+                saved_params = data["params"].tolist()
+                index = cls(tokenizer, k1=k1, b=b, path=path)
+                offsets, rows, tfs = data["offsets"], data["rows"], data["tfs"]
+                for i, term in enumerate(data["terms"].tolist()):
+                    start, end = offsets[i], offsets[i + 1]
+                    index.postings[term] = (array("i", rows[start:end].tobytes()),
+                                            array("i", tfs[start:end].tobytes()))
+                index.doc_ids = data["doc_ids"].tolist()
+                index.doc_lengths = array("i", data["doc_lengths"].astype(np.int32).tobytes())
+        except Exception as e:
+            logger.warning("加载BM25索引 %s 失败: %s", path, e)
+            return None
+        index.doc_index = {doc_id: row for row, doc_id in enumerate(index.doc_ids)}
+        index.total_length = sum(index.doc_lengths)
+        if saved_params != [k1, b]:
+            logger.info("BM25索引 %s 的参数 k1=%s, b=%s 已改为 k1=%s, b=%s", path, *saved_params, k1, b)
+            index.dirty = True
+        logger.info("已加载BM25索引: %s (%d 篇文档)", path, len(index.doc_ids))
+        return index
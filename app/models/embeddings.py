@@ -0,0 +1,548 @@
+import asyncio
+import os
+import queue
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+from langchain_core.embeddings import Embeddings
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+class CachedEmbeddings(Embeddings):
+    """查询向量LRU缓存
+    
+    包装任意 LangChain Embeddings，以模型名 + 规范化文本为键缓存 embed_query 的结果，
+    向量以 float32 数组保存。文档向量化（建库）直接透传，不进入缓存。
+    可选地在关闭时持久化到 .npz 文件，重启后加载。
+    """
+    
+    _WHITESPACE = re.compile(r"\s+")
+    
+    def __init__(self, inner: Embeddings, model_name: str, max_entries: int = 10000,
+                 persist_path: Optional[str] = None):
+        self.inner = inner
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.persist_path = persist_path
+        self._cache: "OrderedDict[Tuple[str, str], Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        if persist_path and os.path.exists(persist_path):
+            self.load(persist_path)
+    
+    @classmethod
+    def normalize_text(cls, text: str) -> str:
+        """规范化文本：全半角统一、合并空白"""
+        return cls._WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+    
+    def _get(self, key: Tuple[str, str]) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._cache.get(key)
+            if vector is None:
+                self._misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self._hits += 1
+        return vector.tolist()
+    
+    def _put(self, key: Tuple[str, str], embedding: List[float]) -> List[float]:
+        """写入缓存，返回 float32 精度的向量，保证命中与未命中时结果一致"""
+        import numpy as np
+        
+        vector = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            self._cache[key] = vector
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return vector.tolist()
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.inner.embed_documents(texts)
+    
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.inner.aembed_documents(texts)
+    
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """批量向量化查询：命中缓存的直接返回，其余一次批量计算后写入缓存
+        
+        批量计算使用被包装模型的 embed_documents，要求其与 embed_query 的编码方式一致。
+        """
+        keys = [(self.model_name, self.normalize_text(text)) for text in texts]
+        results: List[Optional[List[float]]] = [self._get(key) for key in keys]
+        missing = list(dict.fromkeys(key for key, result in zip(keys, results) if result is None))
+        if missing:
+            vectors = self.inner.embed_documents([text for _, text in missing])
+            computed = {key: self._put(key, vector) for key, vector in zip(missing, vectors)}
+            results = [result if result is not None else computed[key] for key, result in zip(keys, results)]
+        return results
+    
+    def embed_query(self, text: str) -> List[float]:
+        normalized = self.normalize_text(text)
+        key = (self.model_name, normalized)
+        embedding = self._get(key)
+        if embedding is None:
+            embedding = self._put(key, self.inner.embed_query(normalized))
+        return embedding
+    
+    async def aembed_query(self, text: str) -> List[float]:
+        normalized = self.normalize_text(text)
+        key = (self.model_name, normalized)
+        embedding = self._get(key)
+        if embedding is None:
+            embedding = self._put(key, await self.inner.aembed_query(normalized))
+        return embedding
+    
+    def close(self) -> None:
+        """持久化缓存（如已配置）；被包装的嵌入模型由模型池释放"""
+        self.save()
+    
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存命中统计"""
+        with self._lock:
+            hits, misses, entries = self._hits, self._misses, len(self._cache)
+        lookups = hits + misses
+        return {
+            "entries": entries,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / lookups if lookups else 0.0
+        }
+    
+    def save(self, path: Optional[str] = None) -> None:
+        """将缓存写入 .npz 文件（向量矩阵 + 文本键），不使用pickle"""
+        import numpy as np
+        
+        path = path or self.persist_path
+        if not path:
+            return
+        with self._lock:
+            items = [(text, vector) for (model, text), vector in self._cache.items()
+                     if model == self.model_name]
+        if not items:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            model=np.array(self.model_name),
+            keys=np.array([text for text, _ in items]),
+            vectors=np.stack([vector for _, vector in items])
+        )
+        os.replace(tmp_path, path)
+        logger.info("查询向量缓存已保存: %s (%d 条)", path, len(items))
+    
+    def load(self, path: str) -> None:
+        """从 .npz 文件加载缓存，模型名不一致时忽略"""
+        import numpy as np
+        
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if str(data["model"]) != self.model_name:
+                    logger.info("查询向量缓存 %s 属于其他模型，已忽略", path)
+                    return
+                keys, vectors = data["keys"], data["vectors"]
+                with self._lock:
+                    for text, vector in zip(keys[-self.max_entries:], vectors[-self.max_entries:]):
+                        self._cache[(self.model_name, str(text))] = vector
+        except Exception as e:
+            logger.warning("加载查询向量缓存 %s 失败: %s", path, e)
+            return
+        logger.info("已加载查询向量缓存: %s (%d 条)", path, len(self._cache))
+
+class BatchingEmbeddings(Embeddings):
+    """查询向量化微批调度器
+    
+    并发的 embed_query 调用先进入队列，后台线程取出队列中已有的请求（最多 max_batch_size 条），
+    用一次批量前向计算得到全部向量，再分发给各个等待的调用方。队列中只有一条请求时立即计算，
+    单独的查询不承担等待时间；已有多条并发请求时才再最多等待 max_wait_ms 凑批。
+    计算期间到达的请求在队列中累积，由下一批一并处理。
+    批量计算使用被包装模型的 embed_documents，要求其与 embed_query 的编码方式一致
+    （HuggingFaceEmbeddings 未设置 query_encode_kwargs 时即如此）。
+    """
+    
+    def __init__(self, inner: Embeddings, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.inner = inner
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: "queue.Queue[Optional[Tuple[str, Future]]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+    
+    def _ensure_worker(self) -> None:
+        if self._worker is None:
+            with self._worker_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(
+                        target=self._run, name="embedding-batcher", daemon=True
+                    )
+                    self._worker.start()
+    
+    def _submit(self, text: str) -> Future:
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future
+    
+    def _collect(self, first: Tuple[str, Future]) -> Tuple[List[Tuple[str, Future]], bool]:
+        """从第一条请求开始凑批，返回 (批次, 是否收到停止信号)"""
+        batch = [first]
+        deadline: Optional[float] = None
+        while len(batch) < self.max_batch_size:
+            try:
+                # 已在队列中的请求直接取出，开始凑批后等待到截止时间
+                remaining = 0.0 if deadline is None else deadline - time.monotonic()
+                item = self._queue.get_nowait() if remaining <= 0 else self._queue.get(timeout=remaining)
+            except queue.Empty:
+                # 队列已空：没有并发请求时立即计算，否则最多再等待 max_wait 凑批
+                if deadline is not None or len(batch) == 1 or self.max_wait <= 0:
+                    break
+                deadline = time.monotonic() + self.max_wait
+                continue
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+    
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch, stopping = self._collect(first)
+            texts = [text for text, _ in batch]
+            try:
+                vectors = self.inner.embed_documents(texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self._batches += 1
+            self._items += len(batch)
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.inner.embed_documents(texts)
+    
+    def embed_query(self, text: str) -> List[float]:
+        return self._submit(text).result()
+    
+    async def aembed_query(self, text: str) -> List[float]:
+        return await asyncio.wrap_future(self._submit(text))
+    
+    def close(self) -> None:
+        """停止后台线程，队列中已提交的请求会先处理完；被包装的嵌入模型由模型池释放"""
+        if self._worker is not None:
+            self._queue.put(None)
+            self._worker.join(timeout=5)
+            self._worker = None
+    
+    def stats(self) -> Dict[str, Any]:
+        """返回批处理统计"""
+        batches, items = self._batches, self._items
+        return {
+            "batches": batches,
+            "items": items,
+            "avg_batch_size": items / batches if batches else 0.0
+        }
+
+class RemoteEmbeddings(Embeddings):
+    """独立嵌入进程的客户端
+    
+    通过本地 Unix 套接字（multiprocessing.connection，authkey 认证）调用 embedding_worker 进程，
+    多个 uvicorn worker 共用该进程中加载的一份模型。连接不能跨线程共用，按需创建并放回连接池复用；
+    连接断开时丢弃空闲连接并重连重试一次。
+    """
+    
+    def __init__(self, address: str, authkey: bytes, model_name: str, max_idle_connections: int = 8):
+        self.address = address
+        self.authkey = authkey
+        self.model_name = model_name
+        self._idle: "queue.LifoQueue" = queue.LifoQueue(maxsize=max_idle_connections)
+    
+    def _connect(self):
+        from multiprocessing.connection import Client
+        return Client(self.address, family="AF_UNIX", authkey=self.authkey)
+    
+    def _call(self, method: str, payload: Any) -> Any:
+        for attempt in range(2):
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+            try:
+                conn.send((method, self.model_name, payload))
+                status, result = conn.recv()
+            except (EOFError, OSError):
+                # 嵌入进程重启后空闲连接全部失效，一并丢弃后重连
+                conn.close()
+                self.close()
+                if attempt:
+                    raise
+                continue
+            try:
+                self._idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+            if status != "ok":
+                raise RuntimeError(f"Embedding worker error: {result}")
+            return result
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self._call("embed_documents", list(texts)).tolist()
+    
+    def embed_query(self, text: str) -> List[float]:
+        return self._call("embed_query", text).tolist()
+    
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+class EmbeddingPool:
+    """进程内嵌入模型池
+    
+    按 后端 + 模型路径 + 选项 缓存已加载的模型，每次 acquire 引用计数加一，release 减一，
+    计数归零时关闭并卸载模型。所有检索器实例和同进程内的 RAGSystem 共用，同一模型只加载一次。
+    """
+    
+    def __init__(self, log_loads: bool = True):
+        # 键 -> [模型, 引用数]
+        self._entries: Dict[Tuple, List[Any]] = {}
+        self._keys: Dict[int, Tuple] = {}
+        self._lock = threading.Lock()
+        self._load_seconds: Dict[Tuple, float] = {}
+        # 正在加载的键 -> 加载锁
+        self._loading: Dict[Tuple, threading.Lock] = {}
+        self.log_loads = log_loads
+    
+    def acquire(self, key: Tuple, factory) -> Embeddings:
+        """获取键对应的模型，不存在时调用 factory() 创建
+        
+        加载在池锁之外进行（每个键一把加载锁），加载期间 stats/info/release 和其他模型的获取不被阻塞；
+        同一模型的并发获取等待首次加载完成后共用。
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[1] += 1
+                return entry[0]
+            load_lock = self._loading.setdefault(key, threading.Lock())
+        with load_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry[1] += 1
+                    return entry[0]
+            start = time.perf_counter()
+            try:
+                model = factory()
+            except BaseException:
+                with self._lock:
+                    self._loading.pop(key, None)
+                raise
+            load_seconds = time.perf_counter() - start
+            with self._lock:
+                self._entries[key] = [model, 1]
+                self._keys[id(model)] = key
+                self._load_seconds[key] = load_seconds
+                self._loading.pop(key, None)
+        if self.log_loads:
+            logger.info("嵌入模型 %s 加载完成，耗时 %.2fs", key[1], load_seconds)
+        return model
+    
+    def release(self, model: Embeddings) -> None:
+        """释放一次引用，引用归零时关闭模型"""
+        with self._lock:
+            key = self._keys.get(id(model))
+            entry = self._entries.get(key) if key is not None else None
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] > 0:
+                return
+            del self._entries[key], self._keys[id(model)]
+            self._load_seconds.pop(key, None)
+        if hasattr(model, "close"):
+            model.close()
+        if self.log_loads:
+            logger.info("嵌入模型 %s 已卸载", key[1])
+    
+    def _describe(self, key: Tuple, refs: int) -> Dict[str, Any]:
+        return {"backend": key[0], "model": key[1], "refs": refs,
+                "load_seconds": round(self._load_seconds.get(key, 0.0), 3)}
+    
+    def info(self, model: Embeddings) -> Optional[Dict[str, Any]]:
+        """返回模型池中某个模型的信息，不在池中时返回None"""
+        with self._lock:
+            key = self._keys.get(id(model))
+            if key is None:
+                return None
+            return self._describe(key, self._entries[key][1])
+    
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [self._describe(key, refs) for key, (_, refs) in self._entries.items()]
+
+# 进程内共享的嵌入模型池；包装层组合（缓存、微批调度）单独计数，共用底层模型
+_embedding_pool = EmbeddingPool()
+_stack_pool = EmbeddingPool(log_loads=False)
+
+def get_embedding_pool() -> EmbeddingPool:
+    """获取进程内共享的嵌入模型池"""
+    return _embedding_pool
+
+def _worker_authkey() -> bytes:
+    authkey = os.getenv("EMBED_WORKER_AUTHKEY")
+    if not authkey:
+        raise ValueError("EMBED_WORKER_AUTHKEY is required when EMBED_WORKER_ADDRESS is set")
+    return authkey.encode()
+
+def embedding_backend_modules(backend: Optional[str] = None) -> Tuple[str, ...]:
+    """返回嵌入后端依赖的重量级模块，供预热时提前导入并计时；使用独立嵌入进程时无需导入"""
+    if os.getenv("EMBED_WORKER_ADDRESS"):
+        return ()
+    backend = backend or os.getenv("EMBED_BACKEND", "huggingface")
+    if backend == "onnx":
+        return ("onnxruntime", "tokenizers")
+    if backend == "hash":
+        return ()
+    return ("sentence_transformers", "langchain_huggingface.embeddings")
+
+def acquire_embedding_model(model_name: Optional[str] = None, device: str = "cpu",
+                            normalize: bool = True, allow_remote: bool = True,
+                            backend: Optional[str] = None) -> Embeddings:
+    """从模型池获取未包装的嵌入模型，用完后调用 release_embeddings 释放
+    
+    backend 为空时使用环境变量 EMBED_BACKEND：huggingface（默认，PyTorch 全精度）或
+    onnx（model_name 为 onnx_embeddings 导出目录，EMBED_ONNX_QUANTIZED 选择 int8 量化模型，
+    EMBED_ONNX_THREADS 设置推理线程数），或 hash（确定性哈希向量，不加载模型，用于离线性能测试；
+    EMBED_HASH_DIM 为维度，EMBED_HASH_LATENCY_MS 模拟每次调用的耗时）。
+    设置环境变量 EMBED_WORKER_ADDRESS 时返回独立嵌入进程的客户端，不在本进程加载模型
+    （allow_remote 为假时除外，供嵌入进程自身使用）。
+    """
+    model_name = model_name or os.getenv("EMBED_MODEL_PATH", "bge-large-zh-v1.5")
+    address = os.getenv("EMBED_WORKER_ADDRESS") if allow_remote else None
+    if address:
+        return _embedding_pool.acquire(
+            ("remote", model_name, address),
+            lambda: RemoteEmbeddings(address, _worker_authkey(), model_name)
+        )
+    
+    backend = backend or os.getenv("EMBED_BACKEND", "huggingface")
+    if backend == "onnx":
+        from app.models.onnx_embeddings import OnnxEmbeddings, onnx_model_file
+        
+        model_file = onnx_model_file()
+        threads = int(os.getenv("EMBED_ONNX_THREADS", "0"))
+        return _embedding_pool.acquire(
+            ("onnx", model_name, model_file, threads, normalize),
+            lambda: OnnxEmbeddings(model_name, model_file, intra_op_threads=threads, normalize=normalize)
+        )
+    if backend == "hash":
+        from app.models.hash_embeddings import HashEmbeddings
+        
+        dim = int(os.getenv("EMBED_HASH_DIM", "256"))
+        latency_ms = float(os.getenv("EMBED_HASH_LATENCY_MS", "0"))
+        return _embedding_pool.acquire(
+            ("hash", model_name, dim, latency_ms, normalize),
+            lambda: HashEmbeddings(dim, latency_ms=latency_ms, normalize=normalize)
+        )
+    if backend != "huggingface":
+        raise ValueError(f"Unknown embedding backend: {backend}")
+    
+    def load() -> Embeddings:
+        from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(
+            model_name=model_name,
+            model_kwargs={'device': device},
+            encode_kwargs={'normalize_embeddings': normalize}
+        )
+    
+    return _embedding_pool.acquire(("huggingface", model_name, device, normalize), load)
+
+def build_embeddings(config: Dict[str, Any]) -> Embeddings:
+    """根据检索器配置从模型池获取嵌入模型，按需包装微批调度器和查询向量缓存
+    
+    包装顺序为 缓存 -> 微批调度 -> 模型，缓存命中的查询不进入调度队列。
+    模型由配置项 embed_model / embed_backend 指定，为空时使用环境变量 EMBED_MODEL_PATH / EMBED_BACKEND；
+    模型和包装参数都相同的检索器共用同一实例，用完后调用 release_embeddings 释放。
+    """
+    model_name = config.get("embed_model") or os.getenv("EMBED_MODEL_PATH", "bge-large-zh-v1.5")
+    backend = config.get("embed_backend") or os.getenv("EMBED_BACKEND", "huggingface")
+    batching = config.get("embedding_batching", False)
+    cache_size = config.get("embedding_cache_size", 0)
+    key = (
+        "stack", model_name, backend, os.getenv("EMBED_WORKER_ADDRESS"),
+        batching and (config.get("embedding_batch_size", 32), config.get("embedding_batch_wait_ms", 5.0)),
+        cache_size > 0 and (cache_size, config.get("embedding_cache_path"))
+    )
+    
+    def wrap() -> Embeddings:
+        embedding = acquire_embedding_model(model_name, backend=backend)
+        if batching:
+            embedding = BatchingEmbeddings(
+                embedding,
+                max_batch_size=config.get("embedding_batch_size", 32),
+                max_wait_ms=config.get("embedding_batch_wait_ms", 5.0)
+            )
+        if cache_size > 0:
+            embedding = CachedEmbeddings(
+                embedding,
+                model_name=model_name,
+                max_entries=cache_size,
+                persist_path=config.get("embedding_cache_path")
+            )
+        return _StackedEmbeddings(embedding)
+    
+    return _stack_pool.acquire(key, wrap).embedding
+
+def release_embeddings(embedding: Embeddings) -> None:
+    """释放 build_embeddings 或 acquire_embedding_model 获取的嵌入模型"""
+    stack = _stacks.get(id(embedding))
+    if stack is not None:
+        _stack_pool.release(stack)
+    else:
+        _embedding_pool.release(embedding)
+
+class _StackedEmbeddings:
+    """模型池中的包装层组合：关闭时逐层关闭包装层，再释放底层模型"""
+    
+    def __init__(self, embedding: Embeddings):
+        self.embedding = embedding
+        _stacks[id(embedding)] = self
+    
+    def close(self) -> None:
+        _stacks.pop(id(self.embedding), None)
+        layer = self.embedding
+        while isinstance(layer, (CachedEmbeddings, BatchingEmbeddings)):
+            layer.close()
+            layer = layer.inner
+        _embedding_pool.release(layer)
+
+# 包装后的嵌入模型 -> 模型池中的包装层组合
+_stacks: Dict[int, _StackedEmbeddings] = {}
+
+def embedding_model_info(embedding: Embeddings) -> Optional[Dict[str, Any]]:
+    """返回包装后的嵌入模型所用底层模型的后端、模型名和加载耗时，不在模型池中时返回None"""
+    while isinstance(embedding, (CachedEmbeddings, BatchingEmbeddings)):
+        embedding = embedding.inner
+    return _embedding_pool.info(embedding)
+
+def embedding_pool_stats() -> List[Dict[str, Any]]:
+    """返回模型池中已加载的模型及引用数"""
+    return _embedding_pool.stats()
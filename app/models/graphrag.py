@@ -0,0 +1,380 @@
+import glob
+import os
+import threading
+from collections import defaultdict
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from app.models.retrieval import (
+    RetrievalInterface,
+    agenerate_answer,
+    astream_answer,
+    build_generate_chain,
+    generate_answer,
+    llm_invoke_params
+)
+from app.schemas.retrieval import GraphSearchOptions
+from app.utils.concurrency import run_in_threadpool
+from app.utils.logger import get_logger
+from app.utils.metrics import stage
+
+logger = get_logger(__name__)
+
+# 各表需要读入内存映射缓存的列（向量列留在 LanceDB 中用于相似度搜索）
+ENTITY_COLUMNS = ["id", "title", "type", "description"]
+RELATIONSHIP_COLUMNS = ["source", "target", "description", "weight"]
+COMMUNITY_COLUMNS = ["id", "title", "level", "summary", "rank", "entity_ids"]
+
+def load_mmap_table(table, columns: List[str], cache_dir: str):
+    """以内存映射方式读取 LanceDB 表的指定列
+    
+    首次读取时把所需列流式导出为 Arrow IPC 文件（文件名包含表版本，表更新后重新导出），
+    之后直接内存映射打开：读取为零拷贝，描述等文本列只在被访问时按页载入内存。
+    """
+    import pyarrow as pa
+    
+    columns = [column for column in columns if column in table.schema.names]
+    path = os.path.join(cache_dir, f"{table.name}_v{table.version}.arrow")
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        reader = table.search().select(columns).limit(None).to_batches()
+        tmp_path = f"{path}.tmp"
+        with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, reader.schema) as writer:
+            for batch in reader:
+                writer.write_batch(batch)
+        os.replace(tmp_path, path)
+        # 清理旧版本的缓存文件
+        for stale in glob.glob(os.path.join(cache_dir, f"{table.name}_v*.arrow")):
+            if stale != path:
+                os.remove(stale)
+    return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+class GraphIndex:
+    """知识图谱的内存索引
+    
+    实体、关系、社区表以内存映射的 Arrow 表保存，只有ID映射和邻接表常驻内存：
+    邻接表按关系权重降序保存每个实体的 (邻居行号, 关系行号)，邻域扩展只访问种子实体的前若干个邻居，
+    耗时与邻域大小相关，与图规模无关。
+    """
+    
+    def __init__(self, entities, relationships, communities=None):
+        self.entities = entities
+        self.relationships = relationships
+        self.communities = communities
+        
+        self.entity_rows: Dict[str, int] = {
+            entity_id: row for row, entity_id in enumerate(entities.column("id").to_pylist())
+        }
+        # GraphRAG 的关系表以实体名称（title）关联实体
+        rows_by_title = {title: row for row, title in enumerate(entities.column("title").to_pylist())}
+        weights = (
+            relationships.column("weight").to_pylist()
+            if "weight" in relationships.column_names else [1.0] * relationships.num_rows
+        )
+        adjacency = defaultdict(list)
+        for row, (source, target, weight) in enumerate(zip(
+            relationships.column("source").to_pylist(), relationships.column("target").to_pylist(), weights
+        )):
+            source_row, target_row = rows_by_title.get(source), rows_by_title.get(target)
+            if source_row is None or target_row is None:
+                continue
+            adjacency[source_row].append((weight or 0.0, target_row, row))
+            adjacency[target_row].append((weight or 0.0, source_row, row))
+        self.adjacency: Dict[int, List[Tuple[int, int]]] = {
+            entity: [(neighbor, row) for _, neighbor, row in sorted(edges, key=lambda edge: -edge[0])]
+            for entity, edges in adjacency.items()
+        }
+        self.relationship_weights = weights
+        
+        # 实体所属社区，以及按 rank 降序排列的社区（global 模式没有社区向量时使用）
+        self.entity_communities: Dict[int, List[int]] = defaultdict(list)
+        self.community_rows: Dict[str, int] = {}
+        self.ranked_communities: List[int] = []
+        self.community_levels: List[Optional[int]] = []
+        self.community_ranks: List[float] = []
+        if communities is not None:
+            self.community_rows = {
+                community_id: row for row, community_id in enumerate(communities.column("id").to_pylist())
+            }
+            self.community_levels = (
+                communities.column("level").to_pylist()
+                if "level" in communities.column_names else [None] * communities.num_rows
+            )
+            self.community_ranks = [
+                rank or 0.0 for rank in (
+                    communities.column("rank").to_pylist()
+                    if "rank" in communities.column_names else [0.0] * communities.num_rows
+                )
+            ]
+            if "entity_ids" in communities.column_names:
+                for row, entity_ids in enumerate(communities.column("entity_ids").to_pylist()):
+                    for entity_id in entity_ids or ():
+                        entity_row = self.entity_rows.get(entity_id)
+                        if entity_row is not None:
+                            self.entity_communities[entity_row].append(row)
+            self.ranked_communities = sorted(
+                range(communities.num_rows), key=lambda row: -self.community_ranks[row]
+            )
+    
+    def neighborhood(self, seeds: List[Tuple[int, float]], options: GraphSearchOptions
+                     ) -> Tuple[Dict[int, float], Dict[int, float], Dict[int, float]]:
+        """从种子实体出发扩展一跳邻域，返回 实体/关系/社区 行号到相关度的映射（按插入顺序排列）"""
+        entities: Dict[int, float] = {}
+        for row, score in seeds:
+            entities.setdefault(row, score)
+        
+        relationships: Dict[int, float] = {}
+        for row, score in seeds:
+            for neighbor, relationship in self.adjacency.get(row, ())[:options.max_neighbors]:
+                entities.setdefault(neighbor, score)
+                relationships.setdefault(relationship, score)
+        ranked = sorted(relationships, key=lambda row: -(self.relationship_weights[row] or 0.0))
+        relationships = {row: relationships[row] for row in ranked[:options.max_relationships]}
+        
+        communities: Dict[int, float] = {}
+        for row, score in seeds:
+            for community in self.entity_communities.get(row, ()):
+                if options.community_level is None or self.community_levels[community] == options.community_level:
+                    communities[community] = max(score, communities.get(community, 0.0))
+        ranked = sorted(communities, key=lambda row: (-communities[row], -self.community_ranks[row]))
+        communities = {row: communities[row] for row in ranked[:options.top_k_communities]}
+        return entities, relationships, communities
+
+class GraphRAGRetriever(RetrievalInterface):
+    """基于 GraphRAG 知识图谱（LanceDB 存储）的检索器
+    
+    local 模式：用查询向量在实体表中召回种子实体，经邻接表扩展邻居、关系和所属社区，组成上下文后由LLM回答；
+    global 模式：按查询向量（社区表无向量列时按 rank）选取社区报告，组成上下文后由LLM回答。
+    实体数较多时建议在 LanceDB 中为实体表创建向量索引，种子召回不需要全表扫描。
+    """
+    
+    def __init__(self, config, name: str = "graphrag"):
+        self.config = config
+        self.name = name
+        import lancedb
+        from app.models.embeddings import build_embeddings, release_embeddings
+        
+        self.llm, self.prompt, self.generate_chain = build_generate_chain(self.config)
+        self.embedding = build_embeddings(self.config)
+        self.search_defaults = {
+            field: self.config[field]
+            for field in GraphSearchOptions.model_fields if field in self.config
+        }
+        self._lock = threading.Lock()
+        try:
+            self.db = lancedb.connect(self.config["lancedb_uri"])
+            self.load()
+        except Exception:
+            # 打开 LanceDB 或加载图索引失败时不会再调用 close，在此归还嵌入模型的引用
+            release_embeddings(self.embedding)
+            raise
+    
+    def load(self) -> None:
+        """打开 LanceDB 表并构建图索引；表有更新时再次调用即可重新加载"""
+        cache_dir = os.path.join(self.config["data_dir"], "arrow_cache")
+        entity_table = self.db.open_table(self.config.get("entity_table", "entities"))
+        relationship_table = self.db.open_table(self.config.get("relationship_table", "relationships"))
+        community_table = None
+        if self.config.get("community_table", "communities") in self.db.table_names():
+            community_table = self.db.open_table(self.config.get("community_table", "communities"))
+        
+        index = GraphIndex(
+            load_mmap_table(entity_table, ENTITY_COLUMNS, cache_dir),
+            load_mmap_table(relationship_table, RELATIONSHIP_COLUMNS, cache_dir),
+            load_mmap_table(community_table, COMMUNITY_COLUMNS, cache_dir) if community_table is not None else None
+        )
+        with self._lock:
+            self.entity_table = entity_table
+            self.community_table = community_table
+            self.index = index
+            self.version = tuple(
+                table.version for table in (entity_table, relationship_table, community_table)
+                if table is not None
+            )
+        logger.info("GraphRAG 图索引加载完成: 实体 %d，关系 %d，社区 %d",
+                    index.entities.num_rows, index.relationships.num_rows,
+                    index.communities.num_rows if index.communities is not None else 0)
+    
+    def _search_options(self, kwargs: Dict[str, Any]) -> GraphSearchOptions:
+        """合并默认检索参数和请求参数，参数非法时抛出 ValueError"""
+        return GraphSearchOptions.model_validate({**self.search_defaults, **kwargs})
+    
+    def _vector_search(self, table, embedding: List[float], limit: int,
+                       where: Optional[str] = None) -> List[Tuple[str, float]]:
+        """在 LanceDB 表中按余弦距离搜索，返回 (ID, 相关度) 列表"""
+        query = table.search(embedding).distance_type("cosine").limit(limit).select(["id", "_distance"])
+        if where:
+            query = query.where(where, prefilter=True)
+        return [(row["id"], 1.0 - row["_distance"]) for row in query.to_list()]
+    
+    def _collect(self, query: str, options: GraphSearchOptions,
+                 embedding: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        """按检索模式收集上下文，返回带类型、正文、元数据和相关度的条目列表"""
+        index = self.index
+        if embedding is None:
+            embedding = self.embed_query(query)
+        
+        with stage("graph_search", **{"graph.mode": options.search_mode, "graph.k": options.top_k}) as search_span:
+            items = self._collect_items(index, embedding, options)
+            search_span.set_attribute("graph.items", len(items))
+            return items
+    
+    def _collect_items(self, index: GraphIndex, embedding: List[float],
+                       options: GraphSearchOptions) -> List[Dict[str, Any]]:
+        if options.search_mode == "local":
+            seeds = [
+                (index.entity_rows[entity_id], score)
+                for entity_id, score in self._vector_search(self.entity_table, embedding, options.top_k)
+                if entity_id in index.entity_rows
+            ]
+            entities, relationships, communities = index.neighborhood(seeds, options)
+        else:
+            entities, relationships = {}, {}
+            communities = self._global_communities(index, embedding, options)
+        
+        items = []
+        if entities:
+            rows = index.entities.take(list(entities)).to_pylist()
+            for row, score, record in zip(entities, entities.values(), rows):
+                items.append({
+                    "content": f"{record['title']}（{record.get('type') or '实体'}）: {record.get('description') or ''}",
+                    "metadata": {"kind": "entity", "source": record["title"], "id": record["id"]},
+                    "score": score
+                })
+        if relationships:
+            rows = index.relationships.take(list(relationships)).to_pylist()
+            for score, record in zip(relationships.values(), rows):
+                items.append({
+                    "content": f"{record['source']} -> {record['target']}: {record.get('description') or ''}",
+                    "metadata": {"kind": "relationship", "source": f"{record['source']} -> {record['target']}"},
+                    "score": score
+                })
+        if communities:
+            rows = index.communities.take(list(communities)).to_pylist()
+            for score, record in zip(communities.values(), rows):
+                items.append({
+                    "content": f"{record.get('title') or ''}: {record.get('summary') or ''}",
+                    "metadata": {
+                        "kind": "community", "source": record.get("title") or record["id"],
+                        "id": record["id"], "level": record.get("level")
+                    },
+                    "score": score
+                })
+        return items
+    
+    def _global_communities(self, index: GraphIndex, embedding: List[float],
+                            options: GraphSearchOptions) -> Dict[int, float]:
+        if index.communities is None or options.top_k_communities == 0:
+            return {}
+        if self.community_table is not None and "vector" in self.community_table.schema.names:
+            where = f"level = {options.community_level}" if options.community_level is not None else None
+            return {
+                index.community_rows[community_id]: score
+                for community_id, score in self._vector_search(
+                    self.community_table, embedding, options.top_k_communities, where
+                )
+                if community_id in index.community_rows
+            }
+        # 没有社区向量时取 rank 最高的社区，相关度为 rank 归一化后的值
+        top_rank = max(index.community_ranks, default=0.0) or 1.0
+        rows = [
+            row for row in index.ranked_communities
+            if options.community_level is None or index.community_levels[row] == options.community_level
+        ][:options.top_k_communities]
+        return {row: index.community_ranks[row] / top_rank for row in rows}
+    
+    @staticmethod
+    def _prompt_inputs(query: str, items: List[Dict[str, Any]]) -> Dict[str, str]:
+        with stage("prompt", **{"prompt.documents": len(items)}):
+            sections = []
+            for kind, title in (("entity", "实体"), ("relationship", "关系"), ("community", "社区报告")):
+                lines = [item["content"] for item in items if item["metadata"]["kind"] == kind]
+                if lines:
+                    sections.append(f"-----{title}-----\n" + "\n".join(lines))
+            return {"context": "\n\n".join(sections), "question": query}
+    
+    @staticmethod
+    def _format_sources(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [
+            {"source": item["metadata"]["source"], "page": "N/A", "type": item["metadata"]["kind"]}
+            for item in items if item["metadata"]["kind"] != "relationship"
+        ]
+    
+    def _collect_for(self, query: str, kwargs: Dict[str, Any],
+                     query_embedding: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        # query_embedding 由上层（如语义缓存）预先计算时直接复用
+        return self._collect(query, self._search_options(kwargs), query_embedding)
+    
+    def retrieve(self, query: str, *, query_embedding: Optional[List[float]] = None, **kwargs) -> Dict[str, Any]:
+        """执行GraphRAG检索"""
+        items = self._collect_for(query, kwargs, query_embedding)
+        answer = generate_answer(
+            self.generate_chain, self._prompt_inputs(query, items), llm_invoke_params(kwargs)
+        )
+        return {"answer": answer, "sources": self._format_sources(items)}
+    
+    async def aretrieve(self, query: str, *, query_embedding: Optional[List[float]] = None,
+                        **kwargs) -> Dict[str, Any]:
+        """异步执行GraphRAG检索：图检索在有界线程池中执行，LLM调用使用原生异步接口"""
+        items = await run_in_threadpool(self._collect_for, query, kwargs, query_embedding)
+        answer = await agenerate_answer(
+            self.generate_chain, self._prompt_inputs(query, items), llm_invoke_params(kwargs)
+        )
+        return {"answer": answer, "sources": self._format_sources(items)}
+    
+    def search(self, query: str, *, query_embedding: Optional[List[float]] = None, **kwargs) -> Dict[str, Any]:
+        """仅执行图检索，不调用LLM"""
+        items = self._collect_for(query, kwargs, query_embedding)
+        return {"documents": items, "sources": self._format_sources(items)}
+    
+    async def astream(self, query: str, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """流式执行GraphRAG检索：先返回来源，再逐token返回LLM生成的答案"""
+        items = await run_in_threadpool(self._collect_for, query, kwargs)
+        yield {"event": "sources", "data": self._format_sources(items)}
+        
+        async for token in astream_answer(
+            self.generate_chain, self._prompt_inputs(query, items), llm_invoke_params(kwargs)
+        ):
+            yield {"event": "token", "data": token}
+    
+    def embed_query(self, query: str) -> List[float]:
+        with stage("embed", **{"embed.query_chars": len(query), "embed.model": self.config.get("embed_model")}):
+            return self.embedding.embed_query(query)
+    
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        if hasattr(self.embedding, "embed_queries"):
+            return self.embedding.embed_queries(queries)
+        return [self.embedding.embed_query(query) for query in queries]
+    
+    def get_collection_version(self) -> Tuple[int, ...]:
+        """以加载的各表版本号作为版本标识，重新加载更新后的表后缓存自动失效"""
+        return self.version
+    
+    def probe(self) -> Dict[str, Any]:
+        from app.models.embeddings import embedding_model_info
+        
+        # 实体表可读即认为 LanceDB 可用
+        return {
+            "documents": self.entity_table.count_rows(),
+            "table_versions": list(self.version),
+            "embedding": embedding_model_info(self.embedding)
+        }
+    
+    def get_stats(self) -> Dict[str, Any]:
+        index = self.index
+        return {
+            "entities": index.entities.num_rows,
+            "relationships": index.relationships.num_rows,
+            "communities": index.communities.num_rows if index.communities is not None else 0,
+            "table_versions": list(self.version)
+        }
+    
+    def warmup(self) -> None:
+        """执行一次查询向量化，确保嵌入模型已就绪"""
+        self.embedding.embed_query("warmup")
+    
+    def close(self) -> None:
+        """释放共享的嵌入模型，引用归零时持久化查询向量缓存并卸载模型"""
+        from app.models.embeddings import release_embeddings
+        release_embeddings(self.embedding)
+    
+    def get_name(self) -> str:
+        return self.name
@@ -0,0 +1,36 @@
+import hashlib
+import time
+from typing import List
+from langchain_core.embeddings import Embeddings
+
+class HashEmbeddings(Embeddings):
+    """确定性的哈希嵌入模型，用于离线性能测试和CI
+    
+    把文本的字符一元组和二元组哈希到 dim 维（特征哈希，带符号）后做 L2 归一化：相同文本总得到相同向量，
+    字面重合多的文本余弦相似度更高，检索结果可复现。不加载任何模型文件，latency_ms 模拟每次调用的计算耗时。
+    """
+    
+    def __init__(self, dim: int = 256, latency_ms: float = 0.0, normalize: bool = True):
+        self.dim = dim
+        self.latency_ms = latency_ms
+        self.normalize = normalize
+    
+    def _vector(self, text: str) -> List[float]:
+        vector = [0.0] * self.dim
+        features = list(text) + [text[i:i + 2] for i in range(len(text) - 1)]
+        for feature in features:
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dim
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        if self.normalize:
+            norm = sum(value * value for value in vector) ** 0.5 or 1.0
+            vector = [value / norm for value in vector]
+        return vector
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000)
+        return [self._vector(text) for text in texts]
+    
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
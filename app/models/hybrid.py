@@ -0,0 +1,231 @@
+import asyncio
+import os
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from app.models.bm25 import BM25Index
+from app.models.retrieval import (
+    LangChainRetriever,
+    RetrievalInterface,
+    agenerate_answer,
+    astream_answer,
+    generate_answer,
+    llm_invoke_params
+)
+from app.schemas.retrieval import HybridSearchOptions
+from app.utils.concurrency import run_in_threadpool
+from app.utils.logger import get_logger
+from app.utils.metrics import stage
+
+logger = get_logger(__name__)
+
+class HybridRetriever(RetrievalInterface):
+    """BM25 + 向量的混合检索器
+    
+    与 dense 指定的向量检索器共用 Chroma 向量库、嵌入模型和生成流水线，另在向量库目录中维护一份
+    BM25 倒排索引（启动时加载，与向量库的差异增量同步；导入时随向量库一起更新）。
+    稠密和稀疏检索各召回 fetch_k 个候选，用RRF（Reciprocal Rank Fusion）融合排名后取 top_k，
+    弥补纯向量检索对人名、编号等精确词匹配不敏感的问题。
+    """
+    
+    def __init__(self, dense: LangChainRetriever, config: Dict[str, Any], name: str = "hybrid"):
+        self.dense = dense
+        self.config = config
+        self.name = name
+        self.collection = dense.vectorstore._collection
+        index_path = config.get("index_path") or os.path.join(
+            dense.config["persist_dir"], f"bm25_{dense.config['collection_name']}.npz"
+        )
+        tokenizer = config.get("tokenizer", "auto")
+        params = {"k1": config.get("bm25_k1", 1.5), "b": config.get("bm25_b", 0.75)}
+        self.sparse = BM25Index.load(index_path, tokenizer, **params) or BM25Index(
+            tokenizer, **params, path=index_path
+        )
+        self.sync()
+        dense.index_listeners.append(self.sparse)
+        self.search_defaults = {
+            **dense.search_defaults,
+            **{field: config[field] for field in HybridSearchOptions.model_fields if field in config}
+        }
+    
+    def sync(self, page_size: int = 5000) -> None:
+        """按文档ID比对BM25索引与向量库，只补充缺失的文档、删除多余的文档"""
+        ids = set()
+        while True:
+            page = self.collection.get(limit=page_size, offset=len(ids), include=[])["ids"]
+            if not page:
+                break
+            ids.update(page)
+        missing = [doc_id for doc_id in ids if doc_id not in self.sparse.doc_index]
+        extra = [doc_id for doc_id in self.sparse.doc_index if doc_id not in ids]
+        if extra:
+            self.sparse.remove(extra)
+        for start in range(0, len(missing), page_size):
+            docs = self.collection.get(ids=missing[start:start + page_size], include=["documents"])
+            self.sparse.add(docs["ids"], docs["documents"])
+        if missing or extra:
+            self.sparse.save()
+        logger.info("BM25索引同步完成: 文档 %d，新增 %d，删除 %d", len(self.sparse), len(missing), len(extra))
+    
+    def _search_options(self, kwargs: Dict[str, Any]) -> HybridSearchOptions:
+        """合并默认搜索参数和请求参数，参数非法时抛出 ValueError"""
+        return HybridSearchOptions.model_validate({**self.search_defaults, **kwargs})
+    
+    @staticmethod
+    def _candidate_count(options: HybridSearchOptions) -> int:
+        # 每路召回 fetch_k 个候选，开启重排时至少召回 rerank_candidates 个
+        return max(options.fetch_k, options.rerank_candidates) if options.rerank else options.fetch_k
+    
+    @classmethod
+    def _dense_options(cls, options: HybridSearchOptions) -> HybridSearchOptions:
+        # 稠密检索按相似度召回候选，多样性由融合后的排序决定
+        return options.model_copy(update={"search_type": "similarity", "top_k": cls._candidate_count(options)})
+    
+    def _fuse(self, dense_hits: List[Tuple[Any, float]], sparse_hits: List[Tuple[str, float]],
+              options: HybridSearchOptions) -> List[Tuple[Any, float]]:
+        """RRF融合两路排名，返回 (文档, 融合得分) 列表；只由稀疏检索召回的文档从向量库读取正文"""
+        from langchain_core.documents import Document
+        
+        scores: Dict[str, float] = {}
+        docs: Dict[str, Any] = {}
+        for rank, (doc, _) in enumerate(dense_hits):
+            scores[doc.id] = scores.get(doc.id, 0.0) + 1.0 / (options.rrf_k + rank + 1)
+            docs[doc.id] = doc
+        sparse_only = []
+        for rank, (doc_id, _) in enumerate(sparse_hits):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (options.rrf_k + rank + 1)
+            if doc_id not in docs:
+                sparse_only.append(doc_id)
+        if sparse_only:
+            # 同时按请求的元数据过滤条件筛选，不满足条件的稀疏召回结果被丢弃
+            fetched = self.collection.get(
+                ids=sparse_only, where=options.filter or None, include=["documents", "metadatas"]
+            )
+            for doc_id, text, metadata in zip(fetched["ids"], fetched["documents"], fetched["metadatas"]):
+                docs[doc_id] = Document(id=doc_id, page_content=text, metadata=metadata or {})
+        ranked = sorted((doc_id for doc_id in scores if doc_id in docs), key=lambda doc_id: -scores[doc_id])
+        return [(docs[doc_id], scores[doc_id]) for doc_id in ranked[:options.top_k]]
+    
+    def _fuse_and_rerank(self, query: str, dense_hits: List[Tuple[Any, float]],
+                         sparse_hits: List[Tuple[str, float]], options: HybridSearchOptions
+                         ) -> List[Tuple[Any, float]]:
+        if not options.rerank:
+            return self._fuse(dense_hits, sparse_hits, options)
+        # 开启重排时融合结果保留 rerank_candidates 个候选，再由交叉编码器重排
+        candidates = options.model_copy(update={"top_k": options.rerank_candidates})
+        fused = self._fuse(dense_hits, sparse_hits, candidates)
+        return self.dense.rerank_hits(query, fused, options)
+    
+    def _sparse_search(self, query: str, options: HybridSearchOptions) -> List[Tuple[str, float]]:
+        with stage("bm25_search", **{"bm25.k": self._candidate_count(options)}) as search_span:
+            hits = self.sparse.search(query, self._candidate_count(options))
+            search_span.set_attribute("bm25.hits", len(hits))
+            return hits
+    
+    def _search(self, query: str, options: HybridSearchOptions, embedding: Optional[List[float]] = None,
+                vector_hits: Optional[List[Tuple[Any, float]]] = None) -> List[Tuple[Any, float]]:
+        dense_hits = vector_hits
+        if dense_hits is None:
+            dense_hits = self.dense._vector_search(query, self._dense_options(options), embedding)
+        sparse_hits = self._sparse_search(query, options)
+        return self._fuse_and_rerank(query, dense_hits, sparse_hits, options)
+    
+    async def _asearch(self, query: str, options: HybridSearchOptions, embedding: Optional[List[float]] = None,
+                       vector_hits: Optional[List[Tuple[Any, float]]] = None) -> List[Tuple[Any, float]]:
+        if vector_hits is not None:
+            # 稠密检索结果已由批量检索预先查询
+            sparse_hits = await run_in_threadpool(self._sparse_search, query, options)
+            return await run_in_threadpool(self._fuse_and_rerank, query, vector_hits, sparse_hits, options)
+        # 稠密和稀疏检索在有界线程池中并发执行
+        dense_hits, sparse_hits = await asyncio.gather(
+            run_in_threadpool(self.dense._vector_search, query, self._dense_options(options), embedding),
+            run_in_threadpool(self._sparse_search, query, options)
+        )
+        return await run_in_threadpool(self._fuse_and_rerank, query, dense_hits, sparse_hits, options)
+    
+    def retrieve(self, query: str, *, query_embedding: Optional[List[float]] = None,
+                 vector_hits: Optional[List[Tuple[Any, float]]] = None, **kwargs) -> Dict[str, Any]:
+        """执行混合检索并生成答案"""
+        hits = self._search(query, self._search_options(kwargs), query_embedding, vector_hits)
+        docs = [doc for doc, _ in hits]
+        answer = generate_answer(
+            self.dense.generate_chain, LangChainRetriever._prompt_inputs(query, docs), llm_invoke_params(kwargs)
+        )
+        return LangChainRetriever._format_result(answer, docs)
+    
+    async def aretrieve(self, query: str, *, query_embedding: Optional[List[float]] = None,
+                        vector_hits: Optional[List[Tuple[Any, float]]] = None, **kwargs) -> Dict[str, Any]:
+        """异步执行混合检索，LLM调用使用原生异步接口"""
+        hits = await self._asearch(query, self._search_options(kwargs), query_embedding, vector_hits)
+        docs = [doc for doc, _ in hits]
+        answer = await agenerate_answer(
+            self.dense.generate_chain, LangChainRetriever._prompt_inputs(query, docs), llm_invoke_params(kwargs)
+        )
+        return LangChainRetriever._format_result(answer, docs)
+    
+    def search(self, query: str, *, query_embedding: Optional[List[float]] = None,
+               vector_hits: Optional[List[Tuple[Any, float]]] = None, **kwargs) -> Dict[str, Any]:
+        """仅执行混合检索，不调用LLM，score 为RRF融合得分"""
+        hits = self._search(query, self._search_options(kwargs), query_embedding, vector_hits)
+        return LangChainRetriever._format_hits(hits)
+    
+    async def asearch(self, query: str, *, query_embedding: Optional[List[float]] = None,
+                      vector_hits: Optional[List[Tuple[Any, float]]] = None, **kwargs) -> Dict[str, Any]:
+        hits = await self._asearch(query, self._search_options(kwargs), query_embedding, vector_hits)
+        return LangChainRetriever._format_hits(hits)
+    
+    async def astream(self, query: str, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """流式执行混合检索：先返回检索到的来源，再逐token返回LLM生成的答案"""
+        hits = await self._asearch(query, self._search_options(kwargs))
+        docs = [doc for doc, _ in hits]
+        yield {"event": "sources", "data": LangChainRetriever._format_sources(docs)}
+        
+        async for token in astream_answer(
+            self.dense.generate_chain, LangChainRetriever._prompt_inputs(query, docs), llm_invoke_params(kwargs)
+        ):
+            yield {"event": "token", "data": token}
+    
+    def embed_query(self, query: str) -> List[float]:
+        return self.dense.embed_query(query)
+    
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        return self.dense.embed_queries(queries)
+    
+    def vector_search_batch(self, queries: List[str], kwargs_list: List[Dict[str, Any]],
+                            embeddings: List[List[float]]) -> List[Optional[List[Tuple[Any, float]]]]:
+        """批量检索时一次查询稠密向量库，稀疏检索仍按条目执行"""
+        options_list: List[Any] = []
+        indices: List[int] = []
+        for index, kwargs in enumerate(kwargs_list):
+            try:
+                options_list.append(self._dense_options(self._search_options(kwargs)))
+            except ValueError:
+                continue
+            indices.append(index)
+        hits: List[Optional[List[Tuple[Any, float]]]] = [None] * len(queries)
+        dense_hits = self.dense._vector_search_many(options_list, [embeddings[i] for i in indices])
+        for index, item_hits in zip(indices, dense_hits):
+            hits[index] = item_hits
+        return hits
+    
+    def get_collection_version(self) -> Tuple[int, Optional[int]]:
+        return self.dense.get_collection_version()
+    
+    def probe(self) -> Dict[str, Any]:
+        return {**self.dense.probe(), "bm25_documents": len(self.sparse)}
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {"bm25_documents": len(self.sparse), "bm25_tokenizer": self.sparse.tokenizer}
+    
+    def warmup(self) -> None:
+        """预热嵌入模型和分词器"""
+        self.dense.warmup()
+        self.sparse.search("warmup")
+    
+    def close(self) -> None:
+        """保存有未持久化修改的BM25索引；共用的向量检索器由检索服务单独关闭"""
+        if self.sparse in self.dense.index_listeners:
+            self.dense.index_listeners.remove(self.sparse)
+        if self.sparse.dirty:
+            self.sparse.save()
+    
+    def get_name(self) -> str:
+        return self.name
@@ -0,0 +1,167 @@
+import os
+import threading
+from typing import Any, Dict, List, Optional
+from langchain_core.embeddings import Embeddings
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 导出目录中的文件名：全精度模型、int8 动态量化模型和分词器
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_QUANTIZED_FILE = "model_int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+
+class OnnxEmbeddings(Embeddings):
+    """基于 onnxruntime 的 CPU 嵌入模型
+    
+    运行由 export_onnx 导出的 BERT 类模型（全精度或 int8 量化），用 tokenizers 分词，
+    池化方式与 bge 系列一致：取 [CLS] 位置的隐状态（也可选 mean），再做 L2 归一化。
+    批量计算前按文本长度排序，减少同一批内的填充；线程数由 intra_op_threads/inter_op_threads 控制，
+    0 表示使用 onnxruntime 默认值（物理核数）。
+    """
+    
+    def __init__(self, model_dir: str, model_file: str = ONNX_MODEL_FILE, max_length: int = 512,
+                 batch_size: int = 32, intra_op_threads: int = 0, inter_op_threads: int = 1,
+                 pooling: str = "cls", normalize: bool = True):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+        
+        if pooling not in ("cls", "mean"):
+            raise ValueError(f"Unknown pooling: {pooling}")
+        self.model_path = os.path.join(model_dir, model_file)
+        self.batch_size = batch_size
+        self.pooling = pooling
+        self.normalize = normalize
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+        
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {item.name for item in self.session.get_inputs()}
+        # Tokenizer 的 padding/truncation 状态不是线程安全的，分词加锁；推理本身可并发
+        self._tokenizer_lock = threading.Lock()
+    
+    def _encode(self, texts: List[str]):
+        import numpy as np
+        
+        with self._tokenizer_lock:
+            encodings = self.tokenizer.encode_batch(texts)
+        feeds = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64)
+        }
+        feeds = {name: value for name, value in feeds.items() if name in self.input_names}
+        hidden = self.session.run(None, feeds)[0]
+        if self.pooling == "cls":
+            vectors = hidden[:, 0]
+        else:
+            mask = feeds["attention_mask"][..., None].astype(hidden.dtype)
+            vectors = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        if self.normalize:
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors.astype(np.float32)
+    
+    def embed_array(self, texts: List[str]):
+        """返回 (条数, 维度) 的 float32 数组，结果与输入顺序一致"""
+        import numpy as np
+        
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        result = None
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            vectors = self._encode([texts[i] for i in batch])
+            if result is None:
+                result = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+            result[batch] = vectors
+        return result if result is not None else np.empty((0, 0), dtype=np.float32)
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self.embed_array(list(texts)).tolist()
+    
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_array([text])[0].tolist()
+    
+    def info(self) -> Dict[str, Any]:
+        options = self.session.get_session_options()
+        return {
+            "model": self.model_path,
+            "pooling": self.pooling,
+            "intra_op_threads": options.intra_op_num_threads,
+            "inter_op_threads": options.inter_op_num_threads
+        }
+
+def onnx_model_file(quantized: Optional[bool] = None) -> str:
+    """按环境变量 EMBED_ONNX_QUANTIZED 选择导出目录中的模型文件，默认使用 int8 量化模型"""
+    if quantized is None:
+        quantized = os.getenv("EMBED_ONNX_QUANTIZED", "true").lower() in ("1", "true", "yes")
+    return ONNX_QUANTIZED_FILE if quantized else ONNX_MODEL_FILE
+
+def quantize_onnx(model_path: str, output_path: str) -> None:
+    """int8 动态量化（权重按通道量化，激活运行时量化），适合 CPU 推理"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    
+    quantize_dynamic(model_path, output_path, weight_type=QuantType.QInt8, per_channel=True)
+
+def export_onnx(model_name: str, output_dir: str, quantize: bool = True, opset: int = 17) -> Dict[str, str]:
+    """把 HuggingFace 模型导出为 ONNX（可选再做 int8 量化），同时保存 tokenizer.json
+    
+    导出需要 torch 和 transformers（HuggingFace 后端本身的依赖），运行时只需要 onnxruntime 和 tokenizers。
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+    
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    tokenizer.save_pretrained(output_dir)
+    if not os.path.exists(os.path.join(output_dir, TOKENIZER_FILE)):
+        raise ValueError(f"{model_name} has no fast tokenizer, {TOKENIZER_FILE} was not written")
+    
+    sample = tokenizer(["导出示例文本", "sample"], padding=True, return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    model_path = os.path.join(output_dir, ONNX_MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            model, tuple(sample[name] for name in input_names), model_path,
+            input_names=input_names, output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes, opset_version=opset
+        )
+    files = {"model": model_path, "tokenizer": os.path.join(output_dir, TOKENIZER_FILE)}
+    if quantize:
+        files["quantized"] = os.path.join(output_dir, ONNX_QUANTIZED_FILE)
+        quantize_onnx(model_path, files["quantized"])
+    logger.info("ONNX 模型已导出: %s", files)
+    return files
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    
+    parser = argparse.ArgumentParser(
+        description="导出 ONNX 嵌入模型（可选 int8 量化）",
+        epilog="""
+使用示例:
+    python -m app.models.onnx_embeddings /models/bge-large-zh-v1.5 /models/bge-large-zh-v1.5-onnx
+    python -m app.models.onnx_embeddings /models/bge-large-zh-v1.5 /models/bge-onnx --no-quantize
+导出后设置 EMBED_BACKEND=onnx、EMBED_MODEL_PATH=<导出目录> 即可使用
+        """,
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("model", help="HuggingFace 模型名或本地路径")
+    parser.add_argument("output_dir", help="导出目录")
+    parser.add_argument("--no-quantize", action="store_true", help="只导出全精度模型")
+    parser.add_argument("--opset", type=int, default=17, help="ONNX opset 版本")
+    args = parser.parse_args()
+    
+    result = export_onnx(args.model, args.output_dir, quantize=not args.no_quantize, opset=args.opset)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
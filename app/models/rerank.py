@@ -0,0 +1,111 @@
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+class CrossEncoderReranker:
+    """基于本地 CPU 交叉编码器的重排器
+    
+    候选按向量检索顺序分批打分，每批计算前根据已用时间和上一批耗时判断是否会超出时间预算，
+    超出时停止打分：已打分的候选按交叉编码器得分排序，其余候选保持向量检索顺序排在其后。
+    同时执行的重排数由 max_concurrency 限制（等待时间同样计入预算），避免挤占检索和生成的CPU。
+    """
+    
+    def __init__(self, model_name: str, batch_size: int = 16, max_length: int = 512,
+                 max_concurrency: int = 1):
+        from sentence_transformers import CrossEncoder
+        
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.model = CrossEncoder(model_name, max_length=max_length, device="cpu")
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._stats_lock = threading.Lock()
+        self._calls = 0
+        self._scored = 0
+        self._budget_exhausted = 0
+        self._total_ms = 0.0
+    
+    def _score(self, query: str, texts: List[str]) -> List[float]:
+        return [float(score) for score in self.model.predict(
+            [(query, text) for text in texts], batch_size=len(texts), show_progress_bar=False
+        )]
+    
+    def rerank(self, query: str, hits: List[Tuple[Any, float]], top_n: int,
+               budget_ms: Optional[float] = None) -> List[Tuple[Any, float]]:
+        """对 (文档, 向量相关度) 列表重排，返回前 top_n 个 (文档, 得分)
+        
+        已打分的文档得分为交叉编码器得分，未打分的保留向量相关度；budget_ms 为空时不限时间。
+        """
+        start = time.perf_counter()
+        deadline = None if budget_ms is None else start + budget_ms / 1000
+        scored: List[Tuple[Any, float]] = []
+        exhausted = False
+        if not self._slots.acquire(timeout=None if budget_ms is None else budget_ms / 1000):
+            exhausted = True
+        else:
+            try:
+                last_batch = 0.0
+                for offset in range(0, len(hits), self.batch_size):
+                    now = time.perf_counter()
+                    if deadline is not None and now + last_batch > deadline:
+                        exhausted = True
+                        break
+                    batch = hits[offset:offset + self.batch_size]
+                    scores = self._score(query, [doc.page_content for doc, _ in batch])
+                    scored.extend((doc, score) for (doc, _), score in zip(batch, scores))
+                    last_batch = time.perf_counter() - now
+            finally:
+                self._slots.release()
+        
+        scored.sort(key=lambda hit: -hit[1])
+        result = (scored + hits[len(scored):])[:top_n]
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._stats_lock:
+            self._calls += 1
+            self._scored += len(scored)
+            self._budget_exhausted += int(exhausted)
+            self._total_ms += elapsed_ms
+        if exhausted:
+            logger.debug("重排超出时间预算，已打分 %d/%d 个候选，耗时 %.1fms", len(scored), len(hits), elapsed_ms)
+        return result
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "model": self.model_name,
+                "calls": self._calls,
+                "scored": self._scored,
+                "budget_exhausted": self._budget_exhausted,
+                "avg_ms": self._total_ms / self._calls if self._calls else 0.0
+            }
+
+# 进程内共享的重排模型，按模型名缓存，所有检索器共用
+_rerankers: Dict[str, CrossEncoderReranker] = {}
+_rerankers_lock = threading.Lock()
+
+def get_reranker(config: Dict[str, Any]) -> CrossEncoderReranker:
+    """按检索器配置获取共享的重排器，首次使用时加载模型（RERANK_MODEL_PATH 指定模型路径）"""
+    model_name = os.getenv("RERANK_MODEL_PATH", "bge-reranker-base")
+    reranker = _rerankers.get(model_name)
+    if reranker is None:
+        with _rerankers_lock:
+            reranker = _rerankers.get(model_name)
+            if reranker is None:
+                start = time.perf_counter()
+                reranker = CrossEncoderReranker(
+                    model_name,
+                    batch_size=config.get("rerank_batch_size", 16),
+                    max_length=config.get("rerank_max_length", 512),
+                    max_concurrency=config.get("rerank_max_concurrency", 1)
+                )
+                _rerankers[model_name] = reranker
+                logger.info("重排模型 %s 加载完成，耗时 %.2fs", model_name, time.perf_counter() - start)
+    return reranker
+
+def loaded_rerankers() -> List[CrossEncoderReranker]:
+    """返回已加载的重排器"""
+    with _rerankers_lock:
+        return list(_rerankers.values())
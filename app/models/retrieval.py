@@ -1,70 +1,544 @@
+import json
+import threading
+import time
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
+from app.schemas.retrieval import SearchOptions
+from app.utils.concurrency import run_in_threadpool
+from app.utils.config import get_service_config
+from app.utils.metrics import add_stage, stage
+from app.utils.tracing import tracing_enabled
 
 class RetrievalInterface(ABC):
     """检索器接口，定义检索器的基本方法"""
     
     @abstractmethod
-    def retrieve(self, query: str, **kwargs) -> Dict[str, Any]:
-        """执行检索操作"""
+    def retrieve(self, query: str, *, query_embedding: Optional[List[float]] = None, **kwargs) -> Dict[str, Any]:
+        """执行检索操作
+        
+        query_embedding 为服务内部（语义缓存、批量检索）预先计算的查询向量，提供时不再重复向量化；
+        kwargs 为请求参数，不会包含该字段。
+        """
         pass
     
+    async def aretrieve(self, query: str, *, query_embedding: Optional[List[float]] = None,
+                        **kwargs) -> Dict[str, Any]:
+        """异步执行检索操作，默认在有界线程池中运行同步实现"""
+        return await run_in_threadpool(self.retrieve, query, query_embedding=query_embedding, **kwargs)
+    
+    def search(self, query: str, *, query_embedding: Optional[List[float]] = None, **kwargs) -> Dict[str, Any]:
+        """仅检索不生成，返回带相关度、正文和元数据的文档列表"""
+        raise ValueError(f"Retriever {self.get_name()} does not support retrieval-only mode")
+    
+    async def asearch(self, query: str, *, query_embedding: Optional[List[float]] = None,
+                      **kwargs) -> Dict[str, Any]:
+        """异步仅检索，默认在有界线程池中运行同步实现"""
+        return await run_in_threadpool(self.search, query, query_embedding=query_embedding, **kwargs)
+    
+    async def astream(self, query: str, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """流式执行检索，依次产出 sources 和 token 事件
+        
+        默认实现等待完整结果后一次性产出答案，支持逐token生成的检索器应覆盖该方法。
+        """
+        result = await self.aretrieve(query, **kwargs)
+        yield {"event": "sources", "data": result.get("sources", [])}
+        yield {"event": "token", "data": result.get("answer", "")}
+    
     @abstractmethod
     def get_name(self) -> str:
         """获取检索器名称"""
         pass
+    
+    def embed_query(self, query: str) -> Optional[List[float]]:
+        """返回查询向量，供语义缓存复用；不基于向量检索的检索器返回None"""
+        return None
+    
+    def embed_queries(self, queries: List[str]) -> Optional[List[List[float]]]:
+        """批量返回查询向量，供批量检索一次性计算；默认逐条调用 embed_query"""
+        embeddings = [self.embed_query(query) for query in queries]
+        return None if any(embedding is None for embedding in embeddings) else embeddings
+    
+    def vector_search_batch(self, queries: List[str], kwargs_list: List[Dict[str, Any]],
+                            embeddings: List[List[float]]) -> Optional[List[Any]]:
+        """批量检索时一次查询向量库，结果作为 vector_hits 关键字参数传回各条目的检索调用；默认None，不预先查询
+        
+        返回非None的检索器，其 retrieve/aretrieve/search/asearch 需接受 vector_hits 关键字参数。
+        """
+        return None
+    
+    def get_collection_version(self) -> Any:
+        """返回底层数据的版本标识，数据变化后应不同，用于缓存失效；默认None"""
+        return None
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """返回检索器运行统计（如缓存命中率），默认为空"""
+        return {}
+    
+    def probe(self) -> Dict[str, Any]:
+        """探测底层依赖（向量库等）是否可用并返回文档数等状态，不可用时抛出异常；默认为空"""
+        return {}
+    
+    def warmup(self) -> None:
+        """预热检索器（加载模型、打开存储等），默认无操作"""
+        pass
+    
+    def close(self) -> None:
+        """释放检索器持有的资源，默认无操作"""
+        pass
+
+# 允许按请求覆盖的LLM参数
+LLM_INVOKE_FIELDS = ("temperature", "max_tokens")
+
+def build_generate_chain(config: Optional[Dict[str, Any]] = None):
+    """创建LLM和检索后生成的流水线，返回 (llm, prompt, chain)
+    
+    流水线只需构建一次，与 RetrievalQA 默认 stuff 链使用相同的提示词（输入为 context 和 question）；
+    按请求指定的 temperature/max_tokens 在调用时绑定到LLM步骤上。
+    检索器配置中的 llm_model/llm_base_url 为空时使用环境变量 MODEL/BASE_URL。
+    """
+    from langchain_openai import ChatOpenAI
+    import os
+    
+    config = config or {}
+    llm = ChatOpenAI(
+        model=config.get("llm_model") or os.getenv("MODEL", "qwen-plus"),
+        base_url=config.get("llm_base_url") or os.getenv("BASE_URL"),
+        api_key=os.getenv("API_KEY"),
+        # 开启追踪时在流式响应中请求token用量
+        stream_usage=tracing_enabled()
+    )
+    return (llm, *generate_chain_for(llm))
+
+def generate_chain_for(llm) -> Tuple[Any, Any]:
+    """为给定的聊天模型构建 prompt | llm | parser 流水线，返回 (prompt, chain)"""
+    from langchain_classic.chains.question_answering.stuff_prompt import PROMPT_SELECTOR
+    from langchain_core.output_parsers import StrOutputParser
+    
+    prompt = PROMPT_SELECTOR.get_prompt(llm)
+    return prompt, prompt | llm | StrOutputParser()
+
+def llm_invoke_params(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """从请求参数中提取调用时生效的LLM参数"""
+    return {
+        key: kwargs[key] for key in LLM_INVOKE_FIELDS
+        if kwargs.get(key) is not None
+    }
+
+def _with_llm_params(chain, params: Dict[str, Any]):
+    """请求未指定LLM参数时直接使用预构建的流水线，否则只把参数绑定到其中的LLM步骤（不复制模型）"""
+    if not params:
+        return chain
+    prompt, llm, parser = chain.steps
+    return prompt | llm.bind(**params) | parser
+
+def _llm_usage(llm_span: Any, config: Dict[str, Any]):
+    """开启追踪时附加统计token用量的回调，返回 (回调, 调用配置)"""
+    if not llm_span.is_recording():
+        return None, config
+    from langchain_core.callbacks import UsageMetadataCallbackHandler
+    
+    usage = UsageMetadataCallbackHandler()
+    return usage, {**config, "callbacks": [*config.get("callbacks", []), usage]}
+
+def _first_token(llm_span: Any, start: float) -> None:
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    add_stage("llm_first_token", elapsed_ms)
+    llm_span.set_attribute("llm.first_token_ms", round(elapsed_ms, 2))
+
+def _finish_llm_span(llm_span: Any, usage: Any, chunks: int) -> None:
+    llm_span.set_attribute("llm.output_chunks", chunks)
+    if usage is None:
+        return
+    for model, metadata in usage.usage_metadata.items():
+        llm_span.set_attributes({
+            "llm.model": model,
+            "llm.input_tokens": metadata.get("input_tokens"),
+            "llm.output_tokens": metadata.get("output_tokens")
+        })
+
+def _stream_for_first_token(llm_span: Any) -> bool:
+    """非流式接口是否以流式方式调用LLM：只在追踪记录或配置要求首token耗时时需要"""
+    return llm_span.is_recording() or get_service_config().llm_first_token_timing
+
+def generate_answer(chain, inputs: Dict[str, str], params: Dict[str, Any]) -> str:
+    """调用生成流水线返回完整答案
+    
+    默认直接 invoke，记录生成总耗时（llm）；开启追踪或 llm_first_token_timing 时以流式方式调用并拼接结果，
+    额外记录LLM首token耗时（llm_first_token），llm span 同时记录token用量。
+    """
+    chain = _with_llm_params(chain, params)
+    with stage("llm", **{"llm.context_chars": len(inputs.get("context", ""))}) as llm_span:
+        if not _stream_for_first_token(llm_span):
+            return chain.invoke(inputs)
+        chunks = []
+        usage, config = _llm_usage(llm_span, {})
+        start = time.perf_counter()
+        for chunk in chain.stream(inputs, config=config):
+            if chunk:
+                if not chunks:
+                    _first_token(llm_span, start)
+                chunks.append(chunk)
+        _finish_llm_span(llm_span, usage, len(chunks))
+    return "".join(chunks)
+
+async def _astream_in_span(chain, inputs: Dict[str, str], llm_span: Any) -> AsyncIterator[str]:
+    """在 llm span 内流式调用，记录首token耗时；开启追踪时 llm span 记录首token耗时和token用量"""
+    chunks = 0
+    usage, config = _llm_usage(llm_span, {})
+    start = time.perf_counter()
+    async for chunk in chain.astream(inputs, config=config):
+        if chunk:
+            if not chunks:
+                _first_token(llm_span, start)
+            chunks += 1
+            yield chunk
+    _finish_llm_span(llm_span, usage, chunks)
+
+async def astream_answer(chain, inputs: Dict[str, str], params: Dict[str, Any]) -> AsyncIterator[str]:
+    """逐token产出生成结果，计时和追踪与流式调用的 generate_answer 相同"""
+    with stage("llm", **{"llm.context_chars": len(inputs.get("context", ""))}) as llm_span:
+        async for chunk in _astream_in_span(_with_llm_params(chain, params), inputs, llm_span):
+            yield chunk
+
+async def agenerate_answer(chain, inputs: Dict[str, str], params: Dict[str, Any]) -> str:
+    """generate_answer 的异步版本，使用原生异步接口"""
+    chain = _with_llm_params(chain, params)
+    with stage("llm", **{"llm.context_chars": len(inputs.get("context", ""))}) as llm_span:
+        if not _stream_for_first_token(llm_span):
+            return await chain.ainvoke(inputs)
+        return "".join([chunk async for chunk in _astream_in_span(chain, inputs, llm_span)])
+
+class CollectionVersion:
+    """向量库集合的版本标识，用于结果缓存失效：(本进程写入次数, 集合文档数)
+    
+    注册为导入监听器，本进程导入写入或删除块后版本立即变化；文档数缓存 ttl_s 秒，
+    只用于发现其他进程的写入，缓存查找不必每次访问向量库。
+    """
+    
+    def __init__(self, count_fn, ttl_s: float):
+        self._count_fn = count_fn
+        self.ttl_s = ttl_s
+        self._writes = 0
+        self._count: Optional[int] = None
+        self._counted_at = float("-inf")
+        self._lock = threading.Lock()
+    
+    def bump(self) -> None:
+        with self._lock:
+            self._writes += 1
+            self._counted_at = float("-inf")
+    
+    def add(self, ids: List[str], texts: List[str]) -> None:
+        self.bump()
+    
+    def remove(self, ids: List[str]) -> None:
+        self.bump()
+    
+    def save(self) -> None:
+        pass
+    
+    def get(self) -> Tuple[int, Optional[int]]:
+        now = time.monotonic()
+        with self._lock:
+            if now - self._counted_at < self.ttl_s:
+                return self._writes, self._count
+        count = self._count_fn()
+        with self._lock:
+            self._count, self._counted_at = count, now
+            return self._writes, self._count
 
 class LangChainRetriever(RetrievalInterface):
     """基于LangChain的RAG检索器"""
     
-    def __init__(self, config):
+    def __init__(self, config, name: str = "langchain_rag"):
         self.config = config
-        from langchain_openai import ChatOpenAI
-        from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+        self.name = name
         from langchain_community.vectorstores import Chroma
-        from langchain_classic.chains import RetrievalQA
-        import os
+        from app.models.embeddings import build_embeddings, release_embeddings
         
-        self.llm = ChatOpenAI(
-            model=os.getenv("MODEL", "qwen-plus"),
-            base_url=os.getenv("BASE_URL"),
-            api_key=os.getenv("API_KEY")
-        )
-        self.embedding = HuggingFaceEmbeddings(
-            model_name=os.getenv("EMBED_MODEL_PATH", "bge-large-zh-v1.5"),
-            model_kwargs={'device': 'cpu'},
-            encode_kwargs={'normalize_embeddings': True}
+        self.llm, self.prompt, self.generate_chain = build_generate_chain(self.config)
+        self.embedding = build_embeddings(self.config)
+        try:
+            self.vectorstore = Chroma(
+                collection_name=self.config["collection_name"],
+                embedding_function=self.embedding,
+                persist_directory=self.config["persist_dir"]
+            )
+        except Exception:
+            # 向量库打开失败时不会再调用 close，在此归还嵌入模型的引用
+            release_embeddings(self.embedding)
+            raise
+        self.collection_version = CollectionVersion(
+            self.vectorstore._collection.count, get_service_config().answer_cache_version_ttl_s
         )
-        self.vectorstore = Chroma(
-            collection_name=self.config["collection_name"],
-            embedding_function=self.embedding,
-            persist_directory=self.config["persist_dir"]
+        # 与向量库同步更新的附加索引（如混合检索的BM25索引），导入时一并写入
+        self.index_listeners: List[Any] = [self.collection_version]
+        # 默认搜索参数，每次请求在此基础上覆盖，直接在共享的向量库上执行，不再创建检索器对象
+        self.search_defaults = {
+            field: self.config[field]
+            for field in SearchOptions.model_fields if field in self.config
+        }
+    
+    @staticmethod
+    def _prompt_inputs(query: str, docs) -> Dict[str, str]:
+        with stage("prompt", **{"prompt.documents": len(docs)}):
+            return {
+                "context": "\n\n".join(doc.page_content for doc in docs),
+                "question": query
+            }
+    
+    def _search_options(self, kwargs: Dict[str, Any]) -> SearchOptions:
+        """合并默认搜索参数和请求参数，参数非法时抛出 ValueError"""
+        return SearchOptions.model_validate({**self.search_defaults, **kwargs})
+    
+    @staticmethod
+    def _candidate_options(options: SearchOptions) -> SearchOptions:
+        """向量库查询使用的参数：开启重排时多召回 rerank_candidates 个候选"""
+        if not options.rerank:
+            return options
+        return options.model_copy(update={
+            "top_k": options.rerank_candidates,
+            "fetch_k": max(options.fetch_k, options.rerank_candidates)
+        })
+    
+    def _search(self, query: str, options: SearchOptions, embedding: Optional[List[float]] = None,
+                vector_hits: Optional[List[Tuple[Any, float]]] = None) -> List[Tuple[Any, float]]:
+        """按搜索参数检索，返回 (文档, 相关度) 列表；开启重排时先多召回候选再重排
+        
+        vector_hits 为批量检索预先查询的向量库结果，提供时不再查询向量库。
+        """
+        if vector_hits is None:
+            vector_hits = self._vector_search(query, self._candidate_options(options), embedding)
+        if not options.rerank:
+            return vector_hits
+        return self.rerank_hits(query, vector_hits, options)
+    
+    def rerank_hits(self, query: str, hits: List[Tuple[Any, float]],
+                    options: SearchOptions) -> List[Tuple[Any, float]]:
+        """用共享的交叉编码器重排候选，返回前 rerank_top_n 个"""
+        from app.models.rerank import get_reranker
+        
+        with stage("rerank", **{"rerank.candidates": len(hits), "rerank.top_n": options.rerank_top_n}):
+            return get_reranker(self.config).rerank(
+                query, hits, options.rerank_top_n, options.rerank_budget_ms
+            )
+    
+    def _vector_search(self, query: str, options: SearchOptions,
+                       embedding: Optional[List[float]] = None) -> List[Tuple[Any, float]]:
+        """按搜索参数查询向量库，返回 (文档, 相关度) 列表"""
+        if embedding is None:
+            embedding = self.embed_query(query)
+        return self._vector_search_many([options], [embedding])[0]
+    
+    def _vector_search_many(self, options_list: List[SearchOptions],
+                            embeddings: List[List[float]]) -> List[List[Tuple[Any, float]]]:
+        """批量查询向量库，返回与输入顺序一致的 (文档, 相关度) 列表
+        
+        召回数、过滤条件和是否需要向量（MMR）相同的查询合并为一次 collection.query，
+        MMR 在各查询返回的候选向量上分别计算。
+        """
+        groups: Dict[Tuple[Any, ...], List[int]] = {}
+        for index, options in enumerate(options_list):
+            mmr = options.search_type == "mmr"
+            key = (options.fetch_k if mmr else options.top_k, mmr,
+                   json.dumps(options.filter or None, sort_keys=True, default=str))
+            groups.setdefault(key, []).append(index)
+        
+        hits: List[List[Tuple[Any, float]]] = [[] for _ in options_list]
+        for (n_results, mmr, _), indices in groups.items():
+            options = options_list[indices[0]]
+            include = ["documents", "metadatas", "distances"]
+            if mmr:
+                include.append("embeddings")
+            with stage("vector_search", **{
+                "vector.k": n_results, "vector.search_type": options.search_type,
+                "vector.filtered": bool(options.filter), "vector.queries": len(indices)
+            }) as search_span:
+                results = self.vectorstore._collection.query(
+                    query_embeddings=[embeddings[index] for index in indices],
+                    n_results=n_results,
+                    where=options.filter or None,
+                    include=include
+                )
+                search_span.set_attribute("vector.hits", sum(len(ids) for ids in results["ids"]))
+            for row, index in enumerate(indices):
+                hits[index] = self._result_hits(results, row, embeddings[index], options_list[index])
+        return hits
+    
+    def _result_hits(self, results: Dict[str, Any], row: int, embedding: List[float],
+                     options: SearchOptions) -> List[Tuple[Any, float]]:
+        """把 collection.query 第 row 个查询的结果转换为 (文档, 相关度) 列表，按搜索方式做MMR或阈值过滤"""
+        import numpy as np
+        from langchain_core.documents import Document
+        from langchain_community.vectorstores.utils import maximal_marginal_relevance
+        
+        relevance = self.vectorstore._select_relevance_score_fn()
+        hits = [
+            (Document(id=doc_id, page_content=text, metadata=metadata or {}), relevance(distance))
+            for doc_id, text, metadata, distance in zip(
+                results["ids"][row], results["documents"][row], results["metadatas"][row], results["distances"][row]
+            )
+        ]
+        if options.search_type == "mmr" and hits:
+            with stage("mmr", **{"mmr.candidates": len(hits), "mmr.k": options.top_k}):
+                selected = maximal_marginal_relevance(
+                    np.asarray(embedding, dtype=np.float32),
+                    results["embeddings"][row],
+                    k=options.top_k,
+                    lambda_mult=options.lambda_mult
+                )
+            hits = [hits[i] for i in selected]
+        elif options.search_type == "threshold":
+            hits = [hit for hit in hits if hit[1] >= options.score_threshold]
+        return hits
+    
+    def vector_search_batch(self, queries: List[str], kwargs_list: List[Dict[str, Any]],
+                            embeddings: List[List[float]]) -> List[Optional[List[Tuple[Any, float]]]]:
+        """批量检索时一次查询向量库，返回各条目的向量库结果；参数非法的条目为None，留给逐条检索报错"""
+        options_list: List[SearchOptions] = []
+        indices: List[int] = []
+        for index, kwargs in enumerate(kwargs_list):
+            try:
+                options_list.append(self._candidate_options(self._search_options(kwargs)))
+            except ValueError:
+                continue
+            indices.append(index)
+        hits: List[Optional[List[Tuple[Any, float]]]] = [None] * len(queries)
+        for index, item_hits in zip(indices, self._vector_search_many(options_list, [embeddings[i] for i in indices])):
+            hits[index] = item_hits
+        return hits
+    
+    def _search_documents(self, query: str, kwargs: Dict[str, Any],
+                          query_embedding: Optional[List[float]] = None,
+                          vector_hits: Optional[List[Tuple[Any, float]]] = None):
+        # query_embedding、vector_hits 由上层（语义缓存、批量检索）预先计算时直接复用
+        hits = self._search(query, self._search_options(kwargs), query_embedding, vector_hits)
+        return [doc for doc, _ in hits]
+    
+    async def _asearch_documents(self, query: str, kwargs: Dict[str, Any],
+                                 query_embedding: Optional[List[float]] = None,
+                                 vector_hits: Optional[List[Tuple[Any, float]]] = None):
+        # Chroma 客户端是同步的，在有界线程池中执行向量化和查询
+        options = self._search_options(kwargs)
+        hits = await run_in_threadpool(self._search, query, options, query_embedding, vector_hits)
+        return [doc for doc, _ in hits]
+    
+    def retrieve(self, query: str, *, query_embedding: Optional[List[float]] = None,
+                 vector_hits: Optional[List[Tuple[Any, float]]] = None, **kwargs) -> Dict[str, Any]:
+        """执行LangChain RAG检索"""
+        docs = self._search_documents(query, kwargs, query_embedding, vector_hits)
+        answer = generate_answer(
+            self.generate_chain, self._prompt_inputs(query, docs), llm_invoke_params(kwargs)
         )
-        self.retriever = self.vectorstore.as_retriever(
-            search_type="mmr",
-            search_kwargs={"k": self.config.get("top_k", 5)}
+        return self._format_result(answer, docs)
+    
+    async def aretrieve(self, query: str, *, query_embedding: Optional[List[float]] = None,
+                        vector_hits: Optional[List[Tuple[Any, float]]] = None, **kwargs) -> Dict[str, Any]:
+        """异步执行LangChain RAG检索，LLM调用使用原生异步接口"""
+        docs = await self._asearch_documents(query, kwargs, query_embedding, vector_hits)
+        answer = await agenerate_answer(
+            self.generate_chain, self._prompt_inputs(query, docs), llm_invoke_params(kwargs)
         )
+        return self._format_result(answer, docs)
     
-    def retrieve(self, query: str, **kwargs) -> Dict[str, Any]:
-        """执行LangChain RAG检索"""
-        from langchain_classic.chains import RetrievalQA
+    def search(self, query: str, *, query_embedding: Optional[List[float]] = None,
+               vector_hits: Optional[List[Tuple[Any, float]]] = None, **kwargs) -> Dict[str, Any]:
+        """仅执行向量检索，不调用LLM"""
+        hits = self._search(query, self._search_options(kwargs), query_embedding, vector_hits)
+        return self._format_hits(hits)
+    
+    async def asearch(self, query: str, *, query_embedding: Optional[List[float]] = None,
+                      vector_hits: Optional[List[Tuple[Any, float]]] = None, **kwargs) -> Dict[str, Any]:
+        options = self._search_options(kwargs)
+        hits = await run_in_threadpool(self._search, query, options, query_embedding, vector_hits)
+        return self._format_hits(hits)
+    
+    async def astream(self, query: str, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """流式执行LangChain RAG检索：先返回检索到的来源，再逐token返回LLM生成的答案"""
+        docs = await self._asearch_documents(query, kwargs)
+        yield {"event": "sources", "data": self._format_sources(docs)}
         
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=self.llm,
-            retriever=self.retriever,
-            return_source_documents=True
-        )
-        result = qa_chain.invoke({"query": query})
+        async for token in astream_answer(
+            self.generate_chain, self._prompt_inputs(query, docs), llm_invoke_params(kwargs)
+        ):
+            yield {"event": "token", "data": token}
+    
+    @staticmethod
+    def _format_sources(docs) -> List[Dict[str, Any]]:
+        return [
+            {
+                "source": doc.metadata.get("source", "unknown"),
+                "page": doc.metadata.get("page", "N/A")
+            }
+            for doc in docs
+        ]
+    
+    @classmethod
+    def _format_hits(cls, hits: List[Tuple[Any, float]]) -> Dict[str, Any]:
         return {
-            "answer": result["result"],
-            "sources": [
-                {
-                    "source": doc.metadata.get("source", "unknown"),
-                    "page": doc.metadata.get("page", "N/A")
-                }
-                for doc in result["source_documents"]
-            ]
+            "documents": [
+                {"content": doc.page_content, "metadata": doc.metadata, "score": score}
+                for doc, score in hits
+            ],
+            "sources": cls._format_sources([doc for doc, _ in hits])
         }
     
+    @classmethod
+    def _format_result(cls, answer: str, docs) -> Dict[str, Any]:
+        return {
+            "answer": answer,
+            "sources": cls._format_sources(docs)
+        }
+    
+    def embed_query(self, query: str) -> List[float]:
+        with stage("embed", **{"embed.query_chars": len(query), "embed.model": self.config.get("embed_model")}):
+            return self.embedding.embed_query(query)
+    
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        # 查询向量缓存提供批量接口时一次前向计算全部未命中的查询
+        if hasattr(self.embedding, "embed_queries"):
+            return self.embedding.embed_queries(queries)
+        return [self.embedding.embed_query(query) for query in queries]
+    
+    def get_collection_version(self) -> Tuple[int, Optional[int]]:
+        """以本进程导入写入次数和集合文档数（短时缓存）作为版本标识，导入后缓存自动失效"""
+        return self.collection_version.get()
+    
+    def probe(self) -> Dict[str, Any]:
+        from app.models.embeddings import embedding_model_info
+        
+        return {
+            "documents": self.vectorstore._collection.count(),
+            "embedding": embedding_model_info(self.embedding)
+        }
+    
+    def get_stats(self) -> Dict[str, Any]:
+        from app.models.embeddings import BatchingEmbeddings, CachedEmbeddings
+        
+        # 沿包装链收集查询向量缓存和微批调度器的统计
+        from app.models.rerank import loaded_rerankers
+        
+        stats = {}
+        rerankers = loaded_rerankers()
+        if rerankers:
+            stats["rerankers"] = [reranker.stats() for reranker in rerankers]
+        layer = self.embedding
+        while layer is not None:
+            if isinstance(layer, CachedEmbeddings):
+                stats["embedding_cache"] = layer.stats()
+            elif isinstance(layer, BatchingEmbeddings):
+                stats["embedding_batcher"] = layer.stats()
+            layer = getattr(layer, "inner", None)
+        return stats
+    
+    def warmup(self) -> None:
+        """执行一次查询向量化，确保嵌入模型和向量库已就绪"""
+        self.embedding.embed_query("warmup")
+    
+    def close(self) -> None:
+        """释放共享的嵌入模型，引用归零时持久化查询向量缓存并卸载模型"""
+        from app.models.embeddings import release_embeddings
+        release_embeddings(self.embedding)
+    
     def get_name(self) -> str:
-        return "langchain_rag"
+        return self.name
@@ -1,9 +1,27 @@
 from .agent import AgentRequest, AgentResponse
-from .retrieval import RetrievalRequest, RetrievalResponse
+from .ingest import IngestRequest, IngestJobResponse
+from .retrieval import (
+    RetrievalRequest,
+    RetrievalResponse,
+    BatchRetrievalRequest,
+    BatchRetrievalItem,
+    BatchRetrievalResponse,
+    SearchOptions,
+    HybridSearchOptions,
+    GraphSearchOptions
+)
 
 __all__ = [
     "AgentRequest",
     "AgentResponse",
+    "IngestRequest",
+    "IngestJobResponse",
     "RetrievalRequest",
-    "RetrievalResponse"
+    "RetrievalResponse",
+    "BatchRetrievalRequest",
+    "BatchRetrievalItem",
+    "BatchRetrievalResponse",
+    "SearchOptions",
+    "HybridSearchOptions",
+    "GraphSearchOptions"
 ]
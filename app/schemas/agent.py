@@ -1,14 +1,24 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 from typing import Dict, Any, Optional
+from app.schemas.retrieval import check_request_kwargs
 
 class AgentRequest(BaseModel):
     """Agent查询请求模型"""
     query: str = Field(..., description="查询内容")
     retriever_name: Optional[str] = Field(default="langchain_rag", description="检索器名称")
     kwargs: Optional[Dict[str, Any]] = Field(default={}, description="额外参数")
+    include_timings: bool = Field(default=False, description="在响应中返回各阶段耗时")
+    
+    @field_validator("kwargs")
+    @classmethod
+    def _check_kwargs(cls, value: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        return check_request_kwargs(value)
 
 class AgentResponse(BaseModel):
     """Agent查询响应模型"""
     query: str = Field(..., description="查询内容")
     retriever: str = Field(..., description="使用的检索器名称")
     result: Dict[str, Any] = Field(..., description="查询结果")
+    timings: Optional[Dict[str, float]] = Field(
+        default=None, description="各阶段耗时（ms）：embed、vector_search、rerank、prompt、llm_first_token、llm、total 等"
+    )
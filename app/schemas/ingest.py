@@ -0,0 +1,21 @@
+from pydantic import BaseModel, Field
+from typing import Dict, Any, List, Optional
+
+class IngestRequest(BaseModel):
+    """知识库导入请求模型（服务器本地路径）"""
+    retriever_name: str = Field(default="langchain_rag", description="目标检索器名称")
+    paths: List[str] = Field(..., min_length=1, description="要导入的文件或目录路径，需位于允许导入的目录中")
+    force: bool = Field(default=False, description="忽略内容哈希，重新处理全部文件")
+
+class IngestJobResponse(BaseModel):
+    """导入任务状态响应模型"""
+    job_id: str = Field(..., description="任务ID")
+    retriever_name: str = Field(..., description="目标检索器名称")
+    paths: List[str] = Field(..., description="导入的文件或目录路径")
+    status: str = Field(..., description="任务状态：queued/running/completed/failed")
+    created_at: float = Field(..., description="提交时间（Unix时间戳）")
+    started_at: Optional[float] = Field(default=None, description="开始时间")
+    finished_at: Optional[float] = Field(default=None, description="结束时间")
+    error: Optional[str] = Field(default=None, description="任务失败原因")
+    progress: Dict[str, Any] = Field(..., description="进度：文件数、块数、向量化速度（块/秒）等")
+    errors: List[Dict[str, Any]] = Field(default=[], description="处理失败的文件")
@@ -1,14 +1,100 @@
-from pydantic import BaseModel, Field
-from typing import Dict, Any, Optional
+from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
+from typing import Dict, Any, List, Literal, Optional
+
+# 服务内部传递预计算结果（查询向量、批量预查询的向量库结果）使用的参数名，不允许出现在请求的 kwargs 中，
+# 否则客户端可以替换检索使用的向量或文档并写入结果缓存
+RESERVED_KWARGS = ("query_embedding", "vector_hits")
+
+def check_request_kwargs(kwargs: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """校验请求的 kwargs 不包含保留参数，为空时返回空字典"""
+    reserved = sorted(key for key in (kwargs or {}) if key in RESERVED_KWARGS)
+    if reserved:
+        raise ValueError(f"kwargs 中不允许使用保留参数: {', '.join(reserved)}")
+    return kwargs or {}
 
 class RetrievalRequest(BaseModel):
     """检索请求模型"""
     retriever_name: str = Field(..., description="检索器名称")
     query: str = Field(..., description="检索查询语句")
     kwargs: Optional[Dict[str, Any]] = Field(default={}, description="额外参数")
+    retrieval_only: bool = Field(default=False, description="仅返回检索到的文档（含相关度），不调用LLM生成答案")
+    include_timings: bool = Field(default=False, description="在响应中返回各阶段耗时，批量检索中忽略")
+    
+    @field_validator("kwargs")
+    @classmethod
+    def _check_kwargs(cls, value: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        return check_request_kwargs(value)
 
 class RetrievalResponse(BaseModel):
     """检索响应模型"""
     query: str = Field(..., description="检索查询语句")
     retriever: str = Field(..., description="使用的检索器名称")
     result: Dict[str, Any] = Field(..., description="检索结果")
+    timings: Optional[Dict[str, float]] = Field(
+        default=None, description="各阶段耗时（ms）：embed、vector_search、rerank、prompt、llm_first_token、llm、total 等"
+    )
+
+
+class BatchRetrievalRequest(BaseModel):
+    """批量检索请求模型"""
+    items: List[RetrievalRequest] = Field(..., min_length=1, max_length=1000, description="检索请求列表")
+    max_concurrency: int = Field(default=8, ge=1, le=64, description="同时执行的检索数")
+
+class BatchRetrievalItem(BaseModel):
+    """批量检索中单条请求的结果"""
+    index: int = Field(..., description="在请求列表中的位置")
+    query: str = Field(..., description="检索查询语句")
+    retriever: str = Field(..., description="使用的检索器名称")
+    result: Optional[Dict[str, Any]] = Field(default=None, description="检索结果，失败时为空")
+    error: Optional[str] = Field(default=None, description="错误信息，成功时为空")
+
+class BatchRetrievalResponse(BaseModel):
+    """批量检索响应模型，结果与请求顺序一致"""
+    results: List[BatchRetrievalItem] = Field(..., description="各条检索结果")
+
+class SearchOptions(BaseModel):
+    """单次检索的向量搜索参数，从请求的 kwargs 中解析，未知字段忽略"""
+    model_config = ConfigDict(extra="ignore")
+    
+    top_k: int = Field(default=5, ge=1, le=100, description="返回的文档数")
+    search_type: Literal["similarity", "mmr", "threshold"] = Field(
+        default="mmr", description="搜索方式：相似度、最大边际相关性或相似度阈值"
+    )
+    fetch_k: int = Field(default=20, ge=1, le=1000, description="MMR重排前召回的候选数")
+    lambda_mult: float = Field(default=0.5, ge=0, le=1, description="MMR多样性系数，越小越多样")
+    score_threshold: float = Field(default=0.5, ge=0, le=1, description="threshold模式下的最低相关度")
+    filter: Optional[Dict[str, Any]] = Field(default=None, description="元数据过滤条件（Chroma where语法）")
+    rerank: bool = Field(default=False, description="是否用交叉编码器对候选重排")
+    rerank_top_n: Optional[int] = Field(default=None, ge=1, le=100, description="重排后送入生成的文档数，为空时等于top_k")
+    rerank_candidates: int = Field(default=20, ge=1, le=200, description="重排前召回的候选数")
+    rerank_budget_ms: Optional[float] = Field(
+        default=300, ge=0, description="重排的时间预算，超出后未打分的候选保持向量检索顺序；为空时不限"
+    )
+    
+    @model_validator(mode="after")
+    def _fetch_k_covers_top_k(self):
+        # MMR 至少需要 top_k 个候选，重排至少需要 rerank_top_n 个候选
+        if self.fetch_k < self.top_k:
+            self.fetch_k = self.top_k
+        if self.rerank_top_n is None:
+            self.rerank_top_n = self.top_k
+        if self.rerank_candidates < self.rerank_top_n:
+            self.rerank_candidates = self.rerank_top_n
+        return self
+
+class HybridSearchOptions(SearchOptions):
+    """混合检索参数：稠密和稀疏检索各召回 fetch_k 个候选，经RRF融合后返回 top_k 个"""
+    rrf_k: int = Field(default=60, ge=1, le=1000, description="RRF融合常数，越大排名靠后的结果权重越高")
+
+class GraphSearchOptions(BaseModel):
+    """单次GraphRAG检索的参数，从请求的 kwargs 中解析，未知字段忽略"""
+    model_config = ConfigDict(extra="ignore")
+    
+    search_mode: Literal["local", "global"] = Field(
+        default="local", description="检索模式：local 从相关实体出发扩展邻域，global 基于社区报告回答全局问题"
+    )
+    top_k: int = Field(default=10, ge=1, le=100, description="local模式召回的种子实体数")
+    max_neighbors: int = Field(default=10, ge=0, le=100, description="每个种子实体最多扩展的邻居数（按关系权重）")
+    max_relationships: int = Field(default=30, ge=0, le=500, description="上下文中最多包含的关系数")
+    top_k_communities: int = Field(default=5, ge=0, le=100, description="上下文中最多包含的社区报告数")
+    community_level: Optional[int] = Field(default=None, ge=0, description="只使用指定层级的社区，为空时不限")
@@ -1,5 +1,11 @@
-from .retrieval_service import RetrievalService
+from .retrieval_service import (
+    RetrievalService,
+    get_retrieval_service,
+    shutdown_retrieval_service
+)
 
 __all__ = [
-    "RetrievalService"
+    "RetrievalService",
+    "get_retrieval_service",
+    "shutdown_retrieval_service"
 ]
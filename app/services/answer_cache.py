@@ -0,0 +1,156 @@
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+@dataclass
+class _Entry:
+    scope: Hashable
+    result: Dict[str, Any]
+    expires_at: float
+    embedding: Any = None
+
+class AnswerCache:
+    """检索结果缓存
+    
+    两级查找：先按规范化后的查询精确匹配，未命中时在同一作用域（检索器、请求参数、
+    向量库版本）内按查询向量的余弦相似度查找，超过阈值即复用已有答案。
+    条目带TTL，超过容量时按LRU淘汰。
+    """
+    
+    _PUNCTUATION = re.compile(r"[\s?？!！。.,，;；:：]+$")
+    _WHITESPACE = re.compile(r"\s+")
+    
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 600,
+                 semantic_threshold: Optional[float] = 0.95):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.semantic_threshold = semantic_threshold
+        self._entries: "OrderedDict[Tuple[Hashable, str], _Entry]" = OrderedDict()
+        # 每个作用域的向量矩阵，条目变化时丢弃，查找时按需重建
+        self._matrices: Dict[Hashable, Tuple[Any, List[Tuple[Hashable, str]]]] = {}
+        self._lock = threading.Lock()
+        self._counters = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0}
+    
+    @classmethod
+    def normalize_query(cls, query: str) -> str:
+        """规范化查询：全半角统一、小写、合并空白、去掉结尾标点"""
+        text = unicodedata.normalize("NFKC", query).strip().lower()
+        text = cls._WHITESPACE.sub(" ", text)
+        return cls._PUNCTUATION.sub("", text)
+    
+    @staticmethod
+    def make_scope(retriever_name: str, options: Dict[str, Any], version: Any = None) -> Hashable:
+        """由检索器名称、请求参数和向量库版本构成缓存作用域"""
+        return (retriever_name, json.dumps(options, sort_keys=True, ensure_ascii=False, default=str), version)
+    
+    def get(self, scope: Hashable, query: str,
+            embed_fn: Optional[Callable[[], Any]] = None) -> Tuple[Optional[Dict[str, Any]], Optional[str], Any]:
+        """查找缓存，返回 (结果, 命中方式, 查询向量)
+        
+        命中方式为 exact、semantic 或 None。精确匹配未命中且提供了 embed_fn 时才计算查询向量，
+        计算结果一并返回，调用方可在后续检索中复用。
+        """
+        key = (scope, self.normalize_query(query))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self._counters["exact_hits"] += 1
+                return entry.result, "exact", None
+            if entry is not None:
+                self._remove(key)
+        
+        embedding = None
+        if embed_fn is not None and self.semantic_threshold is not None:
+            # 向量化耗时较长，不持有锁
+            embedding = embed_fn()
+        with self._lock:
+            if embedding is not None:
+                entry = self._semantic_lookup(scope, embedding, time.monotonic())
+                if entry is not None:
+                    self._counters["semantic_hits"] += 1
+                    return entry.result, "semantic", embedding
+            self._counters["misses"] += 1
+        return None, None, embedding
+    
+    def put(self, scope: Hashable, query: str, result: Dict[str, Any], embedding: Any = None) -> None:
+        """写入缓存，超过容量时淘汰最久未使用的条目"""
+        key = (scope, self.normalize_query(query))
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(
+                scope=scope,
+                result=result,
+                expires_at=time.monotonic() + self.ttl_seconds,
+                embedding=self._unit_vector(embedding) if embedding is not None else None
+            )
+            self._matrices.pop(scope, None)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._counters["evictions"] += 1
+    
+    def invalidate(self, retriever_name: Optional[str] = None) -> int:
+        """清除指定检索器（未指定时清除全部）的缓存，返回清除的条目数"""
+        with self._lock:
+            keys = [
+                key for key, entry in self._entries.items()
+                if retriever_name is None or entry.scope[0] == retriever_name
+            ]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+    
+    def stats(self) -> Dict[str, Any]:
+        """返回命中统计"""
+        with self._lock:
+            counters = dict(self._counters)
+            counters["entries"] = len(self._entries)
+        lookups = counters["exact_hits"] + counters["semantic_hits"] + counters["misses"]
+        counters["hit_ratio"] = (
+            (counters["exact_hits"] + counters["semantic_hits"]) / lookups if lookups else 0.0
+        )
+        return counters
+    
+    def _remove(self, key: Tuple[Hashable, str]) -> None:
+        entry = self._entries.pop(key)
+        self._matrices.pop(entry.scope, None)
+    
+    @staticmethod
+    def _unit_vector(embedding: Any):
+        import numpy as np
+        
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+    
+    def _semantic_lookup(self, scope: Hashable, embedding: Any, now: float) -> Optional[_Entry]:
+        import numpy as np
+        
+        cached = self._matrices.get(scope)
+        if cached is None:
+            keys = [
+                key for key, entry in self._entries.items()
+                if entry.scope == scope and entry.embedding is not None
+            ]
+            if not keys:
+                return None
+            cached = (np.stack([self._entries[key].embedding for key in keys]), keys)
+            self._matrices[scope] = cached
+        matrix, keys = cached
+        
+        similarities = matrix @ self._unit_vector(embedding)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.semantic_threshold:
+            return None
+        entry = self._entries[keys[best]]
+        if entry.expires_at <= now:
+            self._remove(keys[best])
+            return None
+        self._entries.move_to_end(keys[best])
+        return entry
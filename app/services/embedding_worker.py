@@ -0,0 +1,139 @@
+import os
+import threading
+from typing import Any, Dict, List, Optional
+from app.models.embeddings import BatchingEmbeddings, acquire_embedding_model, release_embeddings
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+class EmbeddingWorker:
+    """独立嵌入进程
+    
+    在本地 Unix 套接字上监听（multiprocessing.connection，authkey 认证），每个连接一个线程。
+    模型按客户端请求的模型名首次使用时加载，之后所有连接共用；并发的 embed_query 经微批调度合并为
+    一次批量计算。多个 uvicorn worker 设置 EMBED_WORKER_ADDRESS 后都连接到这里，只保留一份模型。
+    """
+    
+    def __init__(self, address: str, authkey: bytes, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.address = address
+        self.authkey = authkey
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.models: Dict[str, BatchingEmbeddings] = {}
+        self._models_lock = threading.Lock()
+        self._listener = None
+        self._stopped = threading.Event()
+    
+    def model(self, model_name: str) -> BatchingEmbeddings:
+        """获取已加载的模型，首次使用时加载"""
+        model = self.models.get(model_name)
+        if model is None:
+            with self._models_lock:
+                model = self.models.get(model_name)
+                if model is None:
+                    # 始终在本进程加载，不转发给其他嵌入进程
+                    model = BatchingEmbeddings(
+                        acquire_embedding_model(model_name, allow_remote=False),
+                        max_batch_size=self.max_batch_size,
+                        max_wait_ms=self.max_wait_ms
+                    )
+                    self.models[model_name] = model
+        return model
+    
+    def _dispatch(self, method: str, model_name: str, payload: Any) -> Any:
+        import numpy as np
+        
+        model = self.model(model_name)
+        if method == "embed_query":
+            return np.asarray(model.embed_query(payload), dtype=np.float32)
+        if method == "embed_documents":
+            return np.asarray(model.embed_documents(payload), dtype=np.float32)
+        raise ValueError(f"Unknown method: {method}")
+    
+    def _handle(self, conn) -> None:
+        with conn:
+            while not self._stopped.is_set():
+                try:
+                    method, model_name, payload = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    reply = ("ok", self._dispatch(method, model_name, payload))
+                except Exception as e:
+                    logger.warning("嵌入请求 %s 处理失败: %s", method, e)
+                    reply = ("error", str(e))
+                try:
+                    conn.send(reply)
+                except (EOFError, OSError):
+                    return
+    
+    def serve_forever(self, preload: Optional[List[str]] = None) -> None:
+        """预加载指定模型后开始监听，直到 close 被调用"""
+        from multiprocessing import AuthenticationError
+        from multiprocessing.connection import Listener
+        
+        for model_name in preload or []:
+            self.model(model_name).embed_query("warmup")
+        if os.path.exists(self.address):
+            # 上次进程异常退出时残留的套接字文件
+            os.unlink(self.address)
+        self._listener = Listener(self.address, family="AF_UNIX", authkey=self.authkey)
+        os.chmod(self.address, 0o600)
+        logger.info("嵌入进程已启动: %s，已加载模型 %s", self.address, list(self.models))
+        while not self._stopped.is_set():
+            try:
+                conn = self._listener.accept()
+            except AuthenticationError:
+                logger.warning("拒绝未通过认证的连接")
+                continue
+            except OSError:
+                break
+            threading.Thread(target=self._handle, args=(conn,), name="embedding-conn", daemon=True).start()
+    
+    def close(self) -> None:
+        """停止监听并释放模型"""
+        self._stopped.set()
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+        with self._models_lock:
+            models, self.models = list(self.models.values()), {}
+        for model in models:
+            model.close()
+            release_embeddings(model.inner)
+
+if __name__ == "__main__":
+    import argparse
+    from dotenv import load_dotenv
+    
+    load_dotenv()
+    parser = argparse.ArgumentParser(
+        description="独立嵌入进程，供多个服务进程共用一份嵌入模型",
+        epilog="""
+使用示例:
+    EMBED_WORKER_AUTHKEY=secret python -m app.services.embedding_worker --address /tmp/agent_embed.sock
+    服务进程设置相同的 EMBED_WORKER_ADDRESS 和 EMBED_WORKER_AUTHKEY 后不再在本进程加载嵌入模型:
+    EMBED_WORKER_ADDRESS=/tmp/agent_embed.sock EMBED_WORKER_AUTHKEY=secret uvicorn run:app --workers 4
+        """,
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--address", type=str,
+                        default=os.getenv("EMBED_WORKER_ADDRESS", "/tmp/agent_service_embed.sock"),
+                        help="Unix 套接字路径")
+    parser.add_argument("--model", type=str, nargs="*", default=None,
+                        help="启动时预加载的模型，默认为 EMBED_MODEL_PATH")
+    parser.add_argument("--batch-size", type=int, default=32, help="查询向量化微批大小")
+    parser.add_argument("--batch-wait-ms", type=float, default=5.0, help="查询向量化微批最长等待时间")
+    args = parser.parse_args()
+    
+    authkey = os.getenv("EMBED_WORKER_AUTHKEY")
+    if not authkey:
+        parser.error("environment variable EMBED_WORKER_AUTHKEY is required")
+    worker = EmbeddingWorker(args.address, authkey.encode(), args.batch_size, args.batch_wait_ms)
+    try:
+        worker.serve_forever(args.model if args.model is not None
+                             else [os.getenv("EMBED_MODEL_PATH", "bge-large-zh-v1.5")])
+    except KeyboardInterrupt:
+        pass
+    finally:
+        worker.close()
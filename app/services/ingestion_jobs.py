@@ -0,0 +1,174 @@
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+from app.services.ingestion_service import IngestionService
+from app.services.retrieval_service import get_retrieval_service
+from app.utils.config import get_service_config
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+class IngestionQueueFull(Exception):
+    """导入任务队列已满"""
+    pass
+
+@dataclass
+class IngestionJob:
+    """后台导入任务"""
+    job_id: str
+    retriever_name: str
+    paths: List[str]
+    force: bool = False
+    status: str = "queued"
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    stats: Dict[str, Any] = field(default_factory=IngestionService.new_stats)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """返回任务状态和进度"""
+        elapsed = 0.0
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+        stats = dict(self.stats)
+        return {
+            "job_id": self.job_id,
+            "retriever_name": self.retriever_name,
+            "paths": self.paths,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+            "progress": {
+                "files_total": stats["files_total"],
+                "files_done": stats["files_indexed"] + stats["files_skipped"] + len(stats["errors"]),
+                "files_skipped": stats["files_skipped"],
+                "files_removed": stats["files_removed"],
+                "chunks_total": stats["chunks_total"],
+                "chunks_embedded": stats["chunks_embedded"],
+                "chunks_deleted": stats["chunks_deleted"],
+                "embeddings_per_sec": stats["chunks_embedded"] / elapsed if elapsed > 0 else 0.0,
+                "elapsed_s": elapsed
+            },
+            "errors": list(stats["errors"])
+        }
+
+class IngestionJobManager:
+    """后台导入任务管理
+    
+    任务进入有界队列，由固定数量的后台线程依次执行；队列满时拒绝新任务（背压），
+    调用方应稍后重试。只保留最近 max_history 个任务的状态。
+    """
+    
+    def __init__(self, workers: int = 1, queue_size: int = 16, max_history: int = 100):
+        self.workers = workers
+        self.max_history = max_history
+        self._queue: "queue.Queue[Optional[IngestionJob]]" = queue.Queue(maxsize=queue_size)
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+    
+    def _ensure_workers(self) -> None:
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"ingest-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+    
+    def submit(self, retriever_name: str, paths: List[str], force: bool = False) -> IngestionJob:
+        """提交导入任务，队列已满时抛出 IngestionQueueFull"""
+        self._ensure_workers()
+        job = IngestionJob(job_id=uuid.uuid4().hex, retriever_name=retriever_name,
+                           paths=paths, force=force)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            raise IngestionQueueFull("导入任务队列已满，请稍后重试")
+        with self._lock:
+            self._jobs[job.job_id] = job
+            while len(self._jobs) > self.max_history:
+                oldest_id, oldest = next(iter(self._jobs.items()))
+                if oldest.status in ("queued", "running"):
+                    break
+                self._jobs.pop(oldest_id)
+        return job
+    
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+    
+    def list_jobs(self) -> List[IngestionJob]:
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+    
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                service = get_retrieval_service()
+                ingestion = IngestionService.for_retriever(service.get_retriever(job.retriever_name))
+                ingestion.ingest(job.paths, force=job.force, stats=job.stats)
+                if job.stats["chunks_embedded"] or job.stats["chunks_deleted"]:
+                    # 共用同一向量库的检索器（如 hybrid）缓存一并清除
+                    service.invalidate_cache()
+                job.status = "completed"
+            except Exception as e:
+                logger.exception("导入任务 %s 失败", job.job_id)
+                job.status = "failed"
+                job.error = str(e)
+            finally:
+                job.finished_at = time.time()
+    
+    def shutdown(self) -> None:
+        """通知后台线程退出，正在执行的任务会继续完成"""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._queue.put(None)
+
+def resolve_ingest_path(path: str) -> str:
+    """校验待导入路径位于允许的目录内，返回绝对路径；不允许时抛出 ValueError"""
+    real_path = os.path.realpath(path)
+    for allowed in get_service_config().ingest_allowed_dirs:
+        allowed_root = os.path.realpath(allowed)
+        if os.path.commonpath([real_path, allowed_root]) == allowed_root:
+            return real_path
+    raise ValueError(f"路径不在允许导入的目录中: {path}")
+
+# 进程内共享的导入任务管理器
+_ingestion_manager: Optional[IngestionJobManager] = None
+_ingestion_manager_lock = threading.Lock()
+
+def get_ingestion_manager() -> IngestionJobManager:
+    """获取进程内共享的导入任务管理器，可直接用作FastAPI依赖"""
+    global _ingestion_manager
+    if _ingestion_manager is None:
+        with _ingestion_manager_lock:
+            if _ingestion_manager is None:
+                service_config = get_service_config()
+                _ingestion_manager = IngestionJobManager(
+                    workers=service_config.ingest_job_workers,
+                    queue_size=service_config.ingest_queue_size
+                )
+    return _ingestion_manager
+
+def shutdown_ingestion_manager() -> None:
+    """关闭共享的导入任务管理器"""
+    global _ingestion_manager
+    with _ingestion_manager_lock:
+        if _ingestion_manager is not None:
+            _ingestion_manager.shutdown()
+            _ingestion_manager = None
@@ -0,0 +1,562 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, as_completed, wait
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from app.models.retrieval import LangChainRetriever
+from app.utils.concurrency import query_activity
+from app.utils.config import get_service_config
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+SUPPORTED_SUFFIXES = (".pdf", ".txt", ".md")
+# 流式读取文本文件时每次读入的字符数
+READ_BLOCK_CHARS = 1 << 20
+
+def iter_files(paths: Iterable[str]) -> Iterator[str]:
+    """展开文件和目录，逐个产出文件绝对路径；目录中只包含受支持格式的文件"""
+    for path in paths:
+        path = os.path.abspath(path)
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(SUPPORTED_SUFFIXES):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+def file_hash(path: str, block_size: int = 1 << 20) -> str:
+    """流式计算文件内容的 sha256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class ChunkIdSequence:
+    """为单个文件按顺序产出的文本块生成确定性ID
+    
+    ID由来源路径、块内容和前一个块的内容决定，与块的位置无关：文件局部修改后，
+    除紧随修改处的块外，未变化的块保持原ID，不需要重新向量化。生成时只保留前一个块的摘要，
+    内存占用与文件大小无关；上下文完全相同的重复块得到相同ID，入库时视为同一块。
+    """
+    
+    def __init__(self, source: str):
+        self.source = source
+        self._previous = ""
+    
+    def next(self, text: str) -> str:
+        chunk_id = hashlib.sha256(
+            f"{self.source}\x00{self._previous}\x00{text}".encode("utf-8")
+        ).hexdigest()[:40]
+        self._previous = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return chunk_id
+
+def _clean_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    # Chroma 元数据只接受标量值
+    return {
+        key: value for key, value in metadata.items()
+        if isinstance(value, (str, int, float, bool))
+    }
+
+def _make_splitter(chunk_size: int, chunk_overlap: int):
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len
+    )
+
+def iter_text_chunks(path: str, chunk_size: int, chunk_overlap: int,
+                     block_chars: int = READ_BLOCK_CHARS) -> Iterator[str]:
+    """按固定大小的块流式读取文本文件并切分，逐个产出文本块
+    
+    每次只切分“上一块末尾未完成的文本块 + 新读入的内容”，末尾的块留到下一轮与后续内容
+    一起切分，内存占用只与 block_chars 有关。产出的块同样满足 chunk_size 和 chunk_overlap，
+    但超过 block_chars 的文件在第一个读取边界之后的块边界与整体切分不同；结果只由文件内容和
+    block_chars 决定，修改 block_chars 会改变大文件的块及其ID，重新导入时需要重新向量化。
+    """
+    splitter = _make_splitter(chunk_size, chunk_overlap)
+    carry = ""
+    with open(path, "r", encoding="utf-8") as f:
+        while True:
+            block = f.read(block_chars)
+            text = carry + block
+            if not block:
+                if text.strip():
+                    yield from splitter.split_text(text)
+                return
+            chunks = splitter.split_text(text)
+            if len(chunks) <= 1:
+                carry = text
+                continue
+            yield from chunks[:-1]
+            carry = chunks[-1]
+
+def iter_chunks(path: str, chunk_size: int, chunk_overlap: int) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """流式加载并切分单个文件，逐个产出 (文本块, 元数据)
+    
+    PDF 逐页加载切分；文本文件按块流式读取，不会一次性读入整个文件。
+    """
+    if path.lower().endswith(".pdf"):
+        from langchain_community.document_loaders import PyPDFLoader
+        
+        splitter = _make_splitter(chunk_size, chunk_overlap)
+        for page in PyPDFLoader(path).lazy_load():
+            for chunk in splitter.split_documents([page]):
+                yield chunk.page_content, _clean_metadata(chunk.metadata)
+    else:
+        for text in iter_text_chunks(path, chunk_size, chunk_overlap):
+            yield text, {}
+
+def load_and_split(path: str, chunk_size: int, chunk_overlap: int) -> List[Tuple[str, Dict[str, Any]]]:
+    """加载并切分单个文件，返回 (文本块, 元数据) 列表；在进程池中执行，只用于较小的文件"""
+    return list(iter_chunks(path, chunk_size, chunk_overlap))
+
+def _lower_priority() -> None:
+    if hasattr(os, "nice"):
+        os.nice(10)
+
+def _iter_result(future: Future) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    # 子进程中的异常在迭代时抛出，与流式切分的错误统一处理
+    yield from future.result()
+
+def _put(target: "queue.Queue", item: Any, stop: threading.Event) -> bool:
+    """向有界队列放入数据，队列满时阻塞（背压）；流水线终止后返回 False"""
+    while not stop.is_set():
+        try:
+            target.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+class IngestionManifest:
+    """已入库文件清单：记录每个文件的内容哈希和块数，用于增量更新
+    
+    进程内同一清单文件通过 shared 共用一个实例；写入集合的操作（导入、移除文件）持有 write_lock
+    依次执行，开始前调用 refresh 读入其他进程（如命令行导入）保存的修改，避免互相覆盖对方的记录。
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.write_lock = threading.RLock()
+        self._mtime: Optional[float] = None
+        self.refresh()
+    
+    @classmethod
+    def shared(cls, path: str) -> "IngestionManifest":
+        """获取进程内该清单文件共用的实例"""
+        path = os.path.abspath(path)
+        with _manifests_lock:
+            manifest = _manifests.get(path)
+            if manifest is None:
+                manifest = _manifests[path] = cls(path)
+            return manifest
+    
+    def refresh(self) -> None:
+        """清单文件在上次读取或保存后被修改时重新读入"""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.files = json.load(f)
+            self._mtime = mtime
+    
+    def get(self, source: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self.files.get(source)
+    
+    def update(self, source: str, content_hash: str, chunks: int) -> None:
+        with self._lock:
+            self.files[source] = {"hash": content_hash, "chunks": chunks}
+    
+    def remove(self, source: str) -> None:
+        with self._lock:
+            self.files.pop(source, None)
+    
+    def sources(self) -> List[str]:
+        with self._lock:
+            return list(self.files)
+    
+    def save(self) -> None:
+        """原子写入清单文件"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with self._lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.files, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self._mtime = os.path.getmtime(self.path)
+
+# 清单文件绝对路径 -> 进程内共用的清单
+_manifests: Dict[str, IngestionManifest] = {}
+_manifests_lock = threading.Lock()
+
+class IngestionService:
+    """知识库增量构建
+    
+    文件按内容哈希判断是否变化，未变化的直接跳过。变化的文件经 加载/切分 → 向量化 → 写入
+    三级流水线处理：各级之间通过有界队列传递固定大小的批次，在途数据量与语料规模无关；
+    每个块以确定性ID写入 Chroma 并记录所属文件的哈希，已存在的块只更新元数据不重新向量化，
+    文件处理完成后删除哈希不一致（即文件中已不存在）的块；重新导入目录时，清单中位于该目录下但已被删除的文件
+    连同其全部块一并移除。
+    """
+    
+    def __init__(self, embedding: Any, collection: Any, manifest_path: str,
+                 chunk_size: int = 500, chunk_overlap: int = 50, workers: Optional[int] = None,
+                 embed_batch_size: Optional[int] = None, listeners: Optional[List[Any]] = None):
+        service_config = get_service_config()
+        self.embedding = embedding
+        self.collection = collection
+        # 与向量库同步更新的附加索引，需实现 add(ids, texts)、remove(ids) 和 save()
+        self.listeners = list(listeners or [])
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.workers = service_config.ingest_workers if workers is None else workers
+        self.embed_batch_size = embed_batch_size or service_config.ingest_embed_batch_size
+        self.max_inflight_batches = service_config.ingest_max_inflight_batches
+        self.stream_threshold = int(service_config.ingest_stream_threshold_mb * (1 << 20))
+        self.yield_timeout = service_config.ingest_yield_max_ms / 1000
+        # 同一集合的导入服务共用清单，并发写入时依次执行
+        self.manifest = IngestionManifest.shared(manifest_path)
+    
+    @classmethod
+    def for_retriever(cls, retriever: LangChainRetriever, **kwargs) -> "IngestionService":
+        """为检索器创建导入服务，写入其向量库，清单保存在向量库目录中"""
+        from app.models.hybrid import HybridRetriever
+        
+        # 混合检索器写入其共用的向量检索器
+        if isinstance(retriever, HybridRetriever):
+            retriever = retriever.dense
+        if not isinstance(retriever, LangChainRetriever):
+            raise ValueError(f"Retriever {retriever.get_name()} does not support ingestion")
+        kwargs.setdefault("listeners", retriever.index_listeners)
+        return cls(
+            retriever.embedding,
+            retriever.vectorstore._collection,
+            os.path.join(
+                retriever.config["persist_dir"],
+                f"ingest_manifest_{retriever.config['collection_name']}.json"
+            ),
+            chunk_size=retriever.config.get("chunk_size", 500),
+            chunk_overlap=retriever.config.get("chunk_overlap", 50),
+            **kwargs
+        )
+    
+    def _pending(self, paths: Iterable[str], force: bool, stats: Dict[str, Any]) -> Iterator[Tuple[str, str]]:
+        """产出内容有变化、需要重新处理的 (文件, 哈希)"""
+        for source in iter_files(paths):
+            stats["files_total"] += 1
+            if not source.lower().endswith(SUPPORTED_SUFFIXES):
+                stats["errors"].append({"file": source, "error": "不支持的文件格式"})
+                continue
+            try:
+                content_hash = file_hash(source)
+            except OSError as e:
+                stats["errors"].append({"file": source, "error": str(e)})
+                continue
+            previous = self.manifest.get(source)
+            if not force and previous and previous["hash"] == content_hash:
+                stats["files_skipped"] += 1
+                continue
+            yield source, content_hash
+    
+    def _iter_files_chunks(self, pending: Iterator[Tuple[str, str]]
+                           ) -> Iterator[Tuple[str, str, Iterator[Tuple[str, Dict[str, Any]]]]]:
+        """为每个待处理文件产出 (文件, 哈希, 块迭代器)
+        
+        较小的文件在进程池中并行加载切分（在途任务数限制为 workers 的两倍，子进程降低调度优先级）；
+        超过 ingest_stream_threshold_mb 的大文件在当前线程中流式切分，避免整体读入内存。
+        """
+        if self.workers <= 0:
+            for source, content_hash in pending:
+                yield source, content_hash, iter_chunks(source, self.chunk_size, self.chunk_overlap)
+            return
+        
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_lower_priority
+        ) as pool:
+            in_flight: Dict[Future, Tuple[str, str]] = {}
+            for source, content_hash in pending:
+                if os.path.getsize(source) > self.stream_threshold:
+                    yield source, content_hash, iter_chunks(source, self.chunk_size, self.chunk_overlap)
+                else:
+                    in_flight[pool.submit(
+                        load_and_split, source, self.chunk_size, self.chunk_overlap
+                    )] = (source, content_hash)
+                while in_flight:
+                    timeout = None if len(in_flight) >= self.workers * 2 else 0
+                    done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                    if not done:
+                        break
+                    for future in done:
+                        yield (*in_flight.pop(future), _iter_result(future))
+            for future in as_completed(list(in_flight)):
+                yield (*in_flight.pop(future), _iter_result(future))
+    
+    def _produce(self, pending: Iterator[Tuple[str, str]], output: "queue.Queue",
+                 stop: threading.Event) -> None:
+        """加载/切分阶段：把每个文件的块按 embed_batch_size 分批放入队列，文件结束时放入 done 标记"""
+        for source, content_hash, chunks in self._iter_files_chunks(pending):
+            ids = ChunkIdSequence(source)
+            batch: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+            try:
+                for text, metadata in chunks:
+                    # 同一批内ID重复的块只保留一个，Chroma 不接受重复ID
+                    batch[ids.next(text)] = (text, {**metadata, "source": source, "file_hash": content_hash})
+                    if len(batch) >= self.embed_batch_size:
+                        if not _put(output, ("chunks", source, batch), stop):
+                            return
+                        batch = {}
+                if batch and not _put(output, ("chunks", source, batch), stop):
+                    return
+                item = ("done", source, content_hash)
+            except Exception as e:
+                item = ("error", source, str(e))
+            if not _put(output, item, stop):
+                return
+    
+    def _embed(self, batch: Dict[str, Tuple[str, Dict[str, Any]]],
+               force: bool) -> Tuple[List[str], List[List[float]], List[str]]:
+        """向量化阶段：只为向量库中尚不存在的块计算向量，返回 (新块ID, 向量, 已存在块ID)
+        
+        计算前先等待进行中的检索请求结束（最多 ingest_yield_max_ms），让查询优先使用CPU。
+        """
+        ids = list(batch)
+        existing = [] if force else self.collection.get(ids=ids, include=[])["ids"]
+        existing_set = set(existing)
+        new_ids = [chunk_id for chunk_id in ids if chunk_id not in existing_set]
+        embeddings = []
+        if new_ids:
+            if query_activity.active:
+                query_activity.wait_idle(self.yield_timeout)
+            embeddings = self.embedding.embed_documents([batch[chunk_id][0] for chunk_id in new_ids])
+        return new_ids, embeddings, existing
+    
+    def _delete_stale(self, source: str, content_hash: str) -> int:
+        """分页删除属于该文件但哈希不一致的块，返回删除数量"""
+        return self._delete_where({"$and": [{"source": source}, {"file_hash": {"$ne": content_hash}}]})
+    
+    def _delete_where(self, where: Dict[str, Any]) -> int:
+        """分页删除满足条件的块并同步附加索引，返回删除数量"""
+        deleted = 0
+        while True:
+            stale = self.collection.get(where=where, limit=self.embed_batch_size * 16, include=[])["ids"]
+            if not stale:
+                return deleted
+            self.collection.delete(ids=stale)
+            for listener in self.listeners:
+                listener.remove(stale)
+            deleted += len(stale)
+    
+    def _write(self, input_queue: "queue.Queue", stats: Dict[str, Any]) -> None:
+        """写入阶段：写入新块、更新已存在块的元数据，文件完成后删除失效块并更新清单"""
+        failed = set()
+        counts: Dict[str, int] = {}
+        while True:
+            item = input_queue.get()
+            if item is None:
+                return
+            kind, source = item[0], item[1]
+            if source in failed:
+                continue
+            try:
+                if kind == "chunks":
+                    _, _, batch, new_ids, embeddings, existing = item
+                    if new_ids:
+                        texts = [batch[chunk_id][0] for chunk_id in new_ids]
+                        self.collection.upsert(
+                            ids=new_ids,
+                            embeddings=embeddings,
+                            documents=texts,
+                            metadatas=[batch[chunk_id][1] for chunk_id in new_ids]
+                        )
+                        for listener in self.listeners:
+                            listener.add(new_ids, texts)
+                    if existing:
+                        self.collection.update(
+                            ids=existing,
+                            metadatas=[batch[chunk_id][1] for chunk_id in existing]
+                        )
+                    counts[source] = counts.get(source, 0) + len(batch)
+                    stats["chunks_total"] += len(batch)
+                    stats["chunks_embedded"] += len(new_ids)
+                elif kind == "done":
+                    stats["chunks_deleted"] += self._delete_stale(source, item[2])
+                    self.manifest.update(source, item[2], counts.pop(source, 0))
+                    stats["files_indexed"] += 1
+                else:
+                    failed.add(source)
+                    stats["errors"].append({"file": source, "error": item[2]})
+            except Exception as e:
+                failed.add(source)
+                stats["errors"].append({"file": source, "error": str(e)})
+    
+    def remove_sources(self, sources: Iterable[str]) -> int:
+        """从向量库和清单中移除文件的全部块（文件已删除时使用），返回删除的块数；需随后调用 save_index"""
+        deleted = 0
+        with self.manifest.write_lock:
+            for source in sources:
+                deleted += self._delete_where({"source": source})
+                self.manifest.remove(source)
+        return deleted
+    
+    def delete_files(self, paths: Iterable[str]) -> int:
+        """删除文件并从向量库和清单中移除其全部块，返回删除的块数
+        
+        与同一集合的导入依次执行：正在导入时等待其完成，避免导入线程在文件删除后重新写入其块和清单记录。
+        """
+        paths = list(paths)
+        with self.manifest.write_lock:
+            self.manifest.refresh()
+            for path in paths:
+                os.remove(path)
+            deleted = self.remove_sources(paths)
+            self.save_index()
+        return deleted
+    
+    def save_index(self) -> None:
+        """保存清单和附加索引"""
+        self.manifest.save()
+        for listener in self.listeners:
+            listener.save()
+    
+    def _missing_sources(self, paths: Iterable[str]) -> List[str]:
+        """清单中位于待导入目录下、但文件已不存在的来源"""
+        directories = [os.path.join(os.path.abspath(path), "") for path in paths if os.path.isdir(path)]
+        if not directories:
+            return []
+        return [
+            source for source in self.manifest.sources()
+            if any(source.startswith(directory) for directory in directories) and not os.path.exists(source)
+        ]
+    
+    @staticmethod
+    def new_stats() -> Dict[str, Any]:
+        return {
+            "files_total": 0, "files_skipped": 0, "files_indexed": 0, "files_removed": 0,
+            "chunks_total": 0, "chunks_embedded": 0, "chunks_deleted": 0, "errors": []
+        }
+    
+    def ingest(self, paths: Iterable[str], force: bool = False,
+               stats: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """增量导入文件或目录，返回统计信息
+        
+        加载/切分和写入各在一个后台线程中执行，向量化在当前线程中执行，三者通过容量为
+        ingest_max_inflight_batches 的队列衔接，下游较慢时上游阻塞等待。
+        force 为真时忽略内容哈希重新处理全部块；传入 stats 时在导入过程中实时更新，供后台任务查询进度。
+        paths 中的目录下已被删除的文件在导入结束后从向量库和清单中移除。
+        同一集合的导入和文件移除依次执行，后提交的等待前一个完成。
+        """
+        with self.manifest.write_lock:
+            self.manifest.refresh()
+            return self._ingest(list(paths), force, stats)
+    
+    def _ingest(self, paths: List[str], force: bool, stats: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        start = time.perf_counter()
+        stats = stats if stats is not None else self.new_stats()
+        chunk_queue: "queue.Queue" = queue.Queue(maxsize=self.max_inflight_batches)
+        write_queue: "queue.Queue" = queue.Queue(maxsize=self.max_inflight_batches)
+        stop = threading.Event()
+        
+        def produce() -> None:
+            try:
+                self._produce(self._pending(paths, force, stats), chunk_queue, stop)
+            except Exception as e:
+                logger.exception("知识库导入加载阶段失败")
+                stats["errors"].append({"file": None, "error": str(e)})
+            finally:
+                _put(chunk_queue, None, stop)
+        
+        producer = threading.Thread(target=produce, name="ingest-load", daemon=True)
+        writer = threading.Thread(target=self._write, args=(write_queue, stats),
+                                  name="ingest-write", daemon=True)
+        producer.start()
+        writer.start()
+        failed = set()
+        try:
+            while True:
+                item = chunk_queue.get()
+                if item is None:
+                    break
+                kind, source = item[0], item[1]
+                if source in failed:
+                    continue
+                if kind == "chunks":
+                    try:
+                        item = (*item, *self._embed(item[2], force))
+                    except Exception as e:
+                        failed.add(source)
+                        item = ("error", source, str(e))
+                write_queue.put(item)
+            write_queue.put(None)
+            writer.join()
+        finally:
+            stop.set()
+            producer.join()
+        
+        missing = self._missing_sources(paths)
+        if missing:
+            try:
+                stats["chunks_deleted"] += self.remove_sources(missing)
+                stats["files_removed"] += len(missing)
+            except Exception as e:
+                logger.exception("移除已删除文件的块失败")
+                stats["errors"].append({"file": None, "error": str(e)})
+        self.save_index()
+        stats["elapsed_s"] = time.perf_counter() - start
+        logger.info(
+            "知识库导入完成: 文件 %d（跳过 %d，处理 %d，移除 %d），新增块 %d，删除块 %d，失败 %d，耗时 %.1fs",
+            stats["files_total"], stats["files_skipped"], stats["files_indexed"], stats["files_removed"],
+            stats["chunks_embedded"], stats["chunks_deleted"], len(stats["errors"]), stats["elapsed_s"]
+        )
+        return stats
+
+def ingest(retriever_name: str, paths: Iterable[str], force: bool = False) -> Dict[str, Any]:
+    """向共享检索服务中的检索器导入文件，有变化时清除结果缓存"""
+    from app.services.retrieval_service import get_retrieval_service
+    
+    service = get_retrieval_service()
+    stats = IngestionService.for_retriever(service.get_retriever(retriever_name)).ingest(paths, force=force)
+    if stats["chunks_embedded"] or stats["chunks_deleted"]:
+        # 共用同一向量库的检索器（如 hybrid）缓存一并清除
+        service.invalidate_cache()
+    return stats
+
+if __name__ == "__main__":
+    import argparse
+    from dotenv import load_dotenv
+    
+    load_dotenv()
+    parser = argparse.ArgumentParser(
+        description="知识库增量导入",
+        epilog="""
+使用示例:
+    python -m app.services.ingestion_service ./docs
+    python -m app.services.ingestion_service --retriever langchain_rag a.pdf b.txt --force
+        """,
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("paths", nargs="+", help="要导入的文件或目录")
+    parser.add_argument("--retriever", type=str, default="langchain_rag", help="目标检索器名称")
+    parser.add_argument("--force", action="store_true", help="忽略内容哈希，重新处理全部文件")
+    args = parser.parse_args()
+    
+    result = ingest(args.retriever, args.paths, force=args.force)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
@@ -0,0 +1,179 @@
+import asyncio
+import json
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Optional
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from app.models.hash_embeddings import HashEmbeddings
+
+# 模拟回答按字逐个作为token输出，循环使用
+MOCK_ANSWER = "这是本地模拟模型生成的回答，内容与问题无关，仅用于性能测试。"
+
+class MockLLM:
+    """OpenAI 兼容接口的本地模拟模型
+    
+    chat/completions 在 ttft_ms 后输出第一个token，之后按 tokens_per_s 的速度输出其余 answer_tokens-1 个，
+    流式和非流式的总耗时相同；等待使用 asyncio.sleep，大量并发请求不占用线程。
+    embeddings 返回确定性的哈希向量（HashEmbeddings）。
+    call_tools 为真时，请求带有 tools 且消息中还没有工具结果时返回对第一个工具的调用，
+    必填的字符串参数填入最后一条用户消息，用于测试工具调用流程（如 MCPClient）。
+    """
+    
+    def __init__(self, ttft_ms: float = 200, tokens_per_s: float = 50, answer_tokens: int = 64,
+                 embed_dim: int = 256, call_tools: bool = False):
+        self.ttft_ms = ttft_ms
+        self.tokens_per_s = tokens_per_s
+        self.answer_tokens = answer_tokens
+        self.call_tools = call_tools
+        self.embeddings = HashEmbeddings(embed_dim)
+    
+    def tokens(self) -> List[str]:
+        return [MOCK_ANSWER[i % len(MOCK_ANSWER)] for i in range(self.answer_tokens)]
+    
+    def token_interval(self) -> float:
+        return 1 / self.tokens_per_s if self.tokens_per_s > 0 else 0.0
+    
+    def tool_call(self, request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """按 call_tools 决定是否返回工具调用"""
+        messages = request.get("messages", [])
+        if not self.call_tools or not request.get("tools") or any(m.get("role") == "tool" for m in messages):
+            return None
+        function = request["tools"][0].get("function", {})
+        # OpenAI 格式为 parameters，MCPClient 传入的是 MCP 工具的 input_schema
+        schema = function.get("parameters") or function.get("input_schema") or {}
+        query = next((_text(m) for m in reversed(messages) if m.get("role") == "user"), "")
+        arguments = {
+            name: query for name in schema.get("required", [])
+            if schema.get("properties", {}).get(name, {}).get("type", "string") == "string"
+        }
+        return {
+            "id": f"call_{uuid.uuid4().hex[:24]}",
+            "type": "function",
+            "function": {"name": function.get("name", ""), "arguments": json.dumps(arguments, ensure_ascii=False)}
+        }
+
+def _text(message: Dict[str, Any]) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content
+
+def _usage(request: Dict[str, Any], completion_tokens: int) -> Dict[str, int]:
+    # 按字符数近似估计 prompt token 数
+    prompt_tokens = sum(len(_text(message)) for message in request.get("messages", []))
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens
+    }
+
+def create_app(llm: Optional[MockLLM] = None) -> FastAPI:
+    """创建模拟服务应用，可在测试中直接用 uvicorn 或 ASGI 客户端运行"""
+    llm = llm or MockLLM()
+    app = FastAPI(title="Mock OpenAI-compatible API")
+    
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "agent-service"}]}
+    
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Dict[str, Any]):
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        model = request.get("model") or "mock"
+        created = int(time.time())
+        tool_call = llm.tool_call(request)
+        tokens = [] if tool_call else llm.tokens()
+        if request.get("stream"):
+            include_usage = (request.get("stream_options") or {}).get("include_usage", False)
+            return StreamingResponse(
+                _stream(llm, request, completion_id, model, created, tokens, tool_call, include_usage),
+                media_type="text/event-stream"
+            )
+        await asyncio.sleep(llm.ttft_ms / 1000 + llm.token_interval() * max(len(tokens) - 1, 0))
+        message: Dict[str, Any] = {"role": "assistant", "content": None if tool_call else "".join(tokens)}
+        if tool_call:
+            message["tool_calls"] = [tool_call]
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": message,
+                "finish_reason": "tool_calls" if tool_call else "stop"
+            }],
+            "usage": _usage(request, len(tokens))
+        }
+    
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Dict[str, Any]):
+        texts = request.get("input")
+        if isinstance(texts, str):
+            texts = [texts]
+        if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+            raise HTTPException(status_code=400, detail="input must be a string or a list of strings")
+        vectors = llm.embeddings.embed_documents(texts)
+        chars = sum(len(text) for text in texts)
+        return {
+            "object": "list",
+            "model": request.get("model") or "mock",
+            "data": [{"object": "embedding", "index": i, "embedding": vector} for i, vector in enumerate(vectors)],
+            "usage": {"prompt_tokens": chars, "total_tokens": chars}
+        }
+    
+    return app
+
+async def _stream(llm: MockLLM, request: Dict[str, Any], completion_id: str, model: str, created: int,
+                  tokens: List[str], tool_call: Optional[Dict[str, Any]], include_usage: bool) -> AsyncIterator[str]:
+    """按 OpenAI 流式格式（SSE）逐token输出"""
+    def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None, **extra: Any) -> str:
+        body = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else [],
+            **extra
+        }
+        return f"data: {json.dumps(body, ensure_ascii=False)}\n\n"
+    
+    await asyncio.sleep(llm.ttft_ms / 1000)
+    if tool_call:
+        yield chunk({"role": "assistant", "content": None, "tool_calls": [{"index": 0, **tool_call}]})
+    for i, token in enumerate(tokens):
+        if i:
+            await asyncio.sleep(llm.token_interval())
+        yield chunk({"role": "assistant", "content": token} if i == 0 else {"content": token})
+    yield chunk({}, "tool_calls" if tool_call else "stop")
+    if include_usage:
+        yield chunk(None, usage=_usage(request, len(tokens)))
+    yield "data: [DONE]\n\n"
+
+if __name__ == "__main__":
+    import argparse
+    import uvicorn
+    
+    parser = argparse.ArgumentParser(
+        description="本地模拟的 OpenAI 兼容模型服务（chat/completions、embeddings），用于离线性能测试",
+        epilog="""
+使用示例:
+    python -m app.services.mock_llm --port 8001 --ttft-ms 300 --tokens-per-s 40
+    服务、RAGSystem 和 MCPClient 通过环境变量指向模拟服务，嵌入模型使用确定性的哈希向量:
+    BASE_URL=http://127.0.0.1:8001/v1 API_KEY=mock MODEL=mock EMBED_BACKEND=hash python run.py
+    MCPClient 需要工具调用时加 --call-tools
+        """,
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8001, help="监听端口")
+    parser.add_argument("--ttft-ms", type=float, default=200, help="首token延迟")
+    parser.add_argument("--tokens-per-s", type=float, default=50, help="生成速度，0 表示不限")
+    parser.add_argument("--answer-tokens", type=int, default=64, help="每次回答的token数")
+    parser.add_argument("--embed-dim", type=int, default=256, help="embeddings 接口返回的向量维度")
+    parser.add_argument("--call-tools", action="store_true", help="请求带 tools 时先返回一次工具调用")
+    args = parser.parse_args()
+    
+    mock = MockLLM(args.ttft_ms, args.tokens_per_s, args.answer_tokens, args.embed_dim, args.call_tools)
+    uvicorn.run(create_app(mock), host=args.host, port=args.port, log_level="warning")
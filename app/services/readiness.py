@@ -0,0 +1,156 @@
+import asyncio
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from app.utils.config import get_service_config
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+class Readiness:
+    """服务就绪状态
+    
+    存活（进程能响应请求）与就绪（检索器已预热）分开报告：后台预热期间服务已开始监听端口，
+    /healthz 正常返回，/readyz 在预热完成前返回503，负载均衡据此只把流量转发到已预热的实例。
+    状态：starting（未开始预热）-> warming -> ready（预热结束）。单个检索器预热失败只记录在
+    retrievers 中，并在后台按指数退避重试，成功后状态随之更新，不会让整个服务永久不就绪。
+    """
+    
+    def __init__(self, retry_initial_s: float = 5.0, retry_max_s: float = 300.0):
+        self.state = "starting"
+        self.created_at = time.time()
+        self._created = time.perf_counter()
+        self.ready_seconds: Optional[float] = None
+        # 检索器名 -> {"status", "timings", "error"}
+        self.retrievers: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        # 只在事件循环线程中设置和等待
+        self._event = asyncio.Event()
+        self.retry_initial_s = retry_initial_s
+        self.retry_max_s = retry_max_s
+        self._retry_task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+    
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+    
+    @property
+    def warming(self) -> bool:
+        return self.state in ("starting", "warming")
+    
+    def begin(self, names: List[str]) -> None:
+        with self._lock:
+            self.state = "warming"
+            for name in names:
+                self.retrievers[name] = {"status": "pending", "timings": {}, "error": None}
+    
+    def record(self, name: str, status: str, timings: Dict[str, float], error: Optional[str] = None) -> None:
+        """记录单个检索器的预热结果，可在预热线程中调用"""
+        with self._lock:
+            self.retrievers[name] = {
+                "status": status,
+                "timings": {key: round(value, 3) for key, value in timings.items()},
+                "error": error
+            }
+    
+    def failed(self) -> List[str]:
+        """预热失败、尚未重试成功的检索器"""
+        with self._lock:
+            return [name for name, item in self.retrievers.items() if item["status"] != "ready"]
+    
+    def finish(self) -> None:
+        """预热结束，在事件循环线程中调用"""
+        failed = self.failed()
+        with self._lock:
+            self.state = "ready"
+            self.ready_seconds = time.perf_counter() - self._created
+        self._event.set()
+        if failed:
+            logger.warning("预热结束，以下检索器未就绪，将在后台重试: %s", failed)
+        else:
+            logger.info("服务已就绪，自启动起耗时 %.2fs", self.ready_seconds)
+    
+    def mark_ready(self) -> None:
+        """不预热时直接标记为就绪，检索器在首次请求时加载"""
+        with self._lock:
+            self.state = "ready"
+            self.ready_seconds = time.perf_counter() - self._created
+        self._event.set()
+    
+    async def run_warmup(self, service: Any, names: Optional[List[str]] = None) -> None:
+        """在线程中预热检索器，完成后更新就绪状态"""
+        names = names or list(service.list_retrievers())
+        self.begin(names)
+        try:
+            await asyncio.to_thread(service.warmup, names, self)
+        finally:
+            self.finish()
+        if self.failed() and not self._stopping.is_set():
+            self._retry_task = asyncio.create_task(self._retry_failed(service))
+    
+    async def _retry_failed(self, service: Any) -> None:
+        """按指数退避重试预热失败的检索器，直到全部成功或服务关闭"""
+        delay = self.retry_initial_s
+        while True:
+            try:
+                await asyncio.wait_for(self._stopping.wait(), delay)
+                return
+            except asyncio.TimeoutError:
+                pass
+            failed = self.failed()
+            if not failed:
+                return
+            # 预热线程无法中断，关闭时等待本轮结束
+            await asyncio.to_thread(service.warmup, failed, self)
+            recovered = [name for name in failed if name not in self.failed()]
+            if recovered:
+                logger.info("检索器重试预热成功: %s", recovered)
+            delay = min(delay * 2, self.retry_max_s)
+    
+    async def stop(self) -> None:
+        """停止后台重试，服务关闭时在释放检索器之前调用"""
+        self._stopping.set()
+        if self._retry_task is not None:
+            await asyncio.wait([self._retry_task])
+            self._retry_task = None
+    
+    async def wait(self, timeout: float) -> bool:
+        """等待预热结束，超时返回False"""
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+    
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "uptime_s": round(time.time() - self.created_at, 3),
+                "ready_s": round(self.ready_seconds, 3) if self.ready_seconds is not None else None,
+                "retrievers": {name: dict(item) for name, item in self.retrievers.items()}
+            }
+
+# 进程内共享的就绪状态
+_readiness: Optional[Readiness] = None
+_readiness_lock = threading.Lock()
+
+def get_readiness() -> Readiness:
+    """获取进程内共享的就绪状态"""
+    global _readiness
+    if _readiness is None:
+        with _readiness_lock:
+            if _readiness is None:
+                service_config = get_service_config()
+                _readiness = Readiness(
+                    retry_initial_s=service_config.warmup_retry_initial_s,
+                    retry_max_s=service_config.warmup_retry_max_s
+                )
+    return _readiness
+
+def reset_readiness() -> None:
+    """服务关闭时重置就绪状态，下次启动重新计时"""
+    global _readiness
+    with _readiness_lock:
+        _readiness = None
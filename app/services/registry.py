@@ -0,0 +1,113 @@
+import threading
+from importlib.metadata import entry_points
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+from app.models.embeddings import embedding_backend_modules
+from app.models.retrieval import RetrievalInterface
+from app.utils.config import (
+    GraphRAGConfig, HybridConfig, LangChainRAGConfig, RetrieverInstanceConfig
+)
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 第三方包通过该入口点组注册检索器类型，入口点名为类型名，值为工厂函数
+RETRIEVER_ENTRY_POINT_GROUP = "agent_service.retrievers"
+
+# 工厂函数签名：factory(name, config, service) -> RetrievalInterface
+# name 为实例名，config 为合并默认值后的实例配置，service 为检索服务（用于获取依赖的其他实例）
+RetrieverFactory = Callable[[str, Dict[str, Any], Any], RetrievalInterface]
+
+def _create_langchain_rag(name: str, config: Dict[str, Any], service: Any) -> RetrievalInterface:
+    from app.models.retrieval import LangChainRetriever
+    return LangChainRetriever(config, name=name)
+
+def _create_graphrag(name: str, config: Dict[str, Any], service: Any) -> RetrievalInterface:
+    from app.models.graphrag import GraphRAGRetriever
+    return GraphRAGRetriever(config, name=name)
+
+def _create_hybrid(name: str, config: Dict[str, Any], service: Any) -> RetrievalInterface:
+    # 共用 dense 实例的向量库、嵌入模型和LLM
+    from app.models.hybrid import HybridRetriever
+    return HybridRetriever(service.get_retriever(config.get("dense", "langchain_rag")), config, name=name)
+
+class RetrieverRegistry:
+    """检索器类型注册表
+    
+    类型名 -> (工厂函数, 默认配置, 依赖的重量级模块)。内置类型直接注册，其他类型在首次使用时从
+    agent_service.retrievers 入口点加载；实例的配置在该类型默认配置的基础上覆盖。
+    """
+    
+    def __init__(self):
+        self._factories: Dict[str, RetrieverFactory] = {}
+        self._defaults: Dict[str, Dict[str, Any]] = {}
+        self._imports: Dict[str, Tuple[str, ...]] = {}
+        self._lock = threading.Lock()
+    
+    def register(self, type_name: str, factory: RetrieverFactory,
+                 defaults: Optional[Dict[str, Any]] = None, imports: Sequence[str] = ()) -> None:
+        """注册检索器类型，已存在时覆盖；imports 为创建时需要导入的模块，预热时提前导入并计时"""
+        with self._lock:
+            self._factories[type_name] = factory
+            self._defaults[type_name] = dict(defaults or {})
+            self._imports[type_name] = tuple(imports)
+    
+    def _load_entry_point(self, type_name: str) -> Optional[RetrieverFactory]:
+        for entry_point in entry_points(group=RETRIEVER_ENTRY_POINT_GROUP):
+            if entry_point.name == type_name:
+                factory = entry_point.load()
+                self.register(type_name, factory, getattr(factory, "default_config", None),
+                              getattr(factory, "imports", ()))
+                logger.info("已从入口点 %s 加载检索器类型 %s", entry_point.value, type_name)
+                return factory
+        return None
+    
+    def factory(self, type_name: str) -> RetrieverFactory:
+        """返回类型对应的工厂函数，未注册时查找入口点，仍不存在时抛出 ValueError"""
+        factory = self._factories.get(type_name) or self._load_entry_point(type_name)
+        if factory is None:
+            raise ValueError(f"Unknown retriever type: {type_name}")
+        return factory
+    
+    def config(self, instance: RetrieverInstanceConfig) -> Dict[str, Any]:
+        """合并类型默认配置和实例配置"""
+        self.factory(instance.type)
+        return {**self._defaults.get(instance.type, {}), **instance.config}
+    
+    def imports(self, instance: RetrieverInstanceConfig) -> Tuple[str, ...]:
+        """实例创建时需要导入的模块：类型声明的模块和所用嵌入后端的模块"""
+        config = self.config(instance)
+        modules = self._imports.get(instance.type, ())
+        if "embed_backend" in config:
+            modules += embedding_backend_modules(config["embed_backend"])
+        return modules
+    
+    def create(self, name: str, instance: RetrieverInstanceConfig, service: Any) -> RetrievalInterface:
+        """按实例配置创建检索器"""
+        return self.factory(instance.type)(name, self.config(instance), service)
+
+def _default_config(config_class) -> Dict[str, Any]:
+    # 取类型声明的默认配置，不读取环境变量
+    return config_class.model_fields["config"].default
+
+# 进程内共享的检索器类型注册表
+_retriever_registry = RetrieverRegistry()
+_retriever_registry.register(
+    "langchain_rag", _create_langchain_rag, _default_config(LangChainRAGConfig),
+    imports=("langchain_openai", "langchain_classic.chains.question_answering.stuff_prompt",
+             "langchain_community.vectorstores", "chromadb")
+)
+_retriever_registry.register(
+    "graphrag", _create_graphrag, _default_config(GraphRAGConfig),
+    imports=("langchain_openai", "langchain_classic.chains.question_answering.stuff_prompt",
+             "lancedb", "pyarrow")
+)
+_retriever_registry.register("hybrid", _create_hybrid, _default_config(HybridConfig), imports=("jieba",))
+
+def get_retriever_registry() -> RetrieverRegistry:
+    """获取进程内共享的检索器类型注册表"""
+    return _retriever_registry
+
+def register_retriever_type(type_name: str, factory: RetrieverFactory,
+                            defaults: Optional[Dict[str, Any]] = None, imports: Sequence[str] = ()) -> None:
+    """在代码中注册检索器类型，效果与声明入口点相同"""
+    _retriever_registry.register(type_name, factory, defaults, imports)
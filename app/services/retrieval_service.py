@@ -1,50 +1,439 @@
-from typing import Dict, Any
-from app.models.retrieval import RetrievalInterface, LangChainRetriever
-from app.utils.config import get_retrieval_config
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
+from app.models.embeddings import embedding_pool_stats
+from app.models.retrieval import RetrievalInterface
+from app.services.answer_cache import AnswerCache
+from app.services.registry import get_retriever_registry
+from app.utils.concurrency import query_activity, run_in_threadpool
+from app.utils.config import get_retrieval_config, get_service_config
+from app.utils.logger import get_logger
+from app.utils.metrics import count_request, observe_stages, stage, track_request
+from app.utils.tracing import span
+
+logger = get_logger(__name__)
 
 class RetrievalService:
-    """检索服务，管理不同的检索器"""
+    """检索服务，管理不同的检索器
+    
+    进程内只保留一个实例（见 get_retrieval_service），检索器按需创建后在所有请求间共享，
+    避免每个请求重复加载嵌入模型、打开向量库和创建LLM客户端。
+    """
     
     def __init__(self):
         self.retrievers: Dict[str, RetrievalInterface] = {}
         self.config = get_retrieval_config()
+        # 每个检索器一把创建锁，保证并发请求下同一检索器只初始化一次
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
         # 延迟初始化检索器，只有在需要时才创建
+        self.answer_cache = self._create_answer_cache()
+        # 各检索器最近一次成功请求的 (耗时ms, 完成时间)，以及缓存的状态探测结果
+        self._latency: Dict[str, Tuple[float, float]] = {}
+        self._probes: Dict[str, Dict[str, Any]] = {}
+        self._probed_at = 0.0
+        self._probe_lock = threading.Lock()
+    
+    @staticmethod
+    def _create_answer_cache() -> Optional[AnswerCache]:
+        service_config = get_service_config()
+        if not service_config.answer_cache_enabled:
+            return None
+        return AnswerCache(
+            max_entries=service_config.answer_cache_max_entries,
+            ttl_seconds=service_config.answer_cache_ttl_seconds,
+            semantic_threshold=(
+                service_config.answer_cache_semantic_threshold
+                if service_config.answer_cache_semantic_enabled else None
+            )
+        )
     
-    def _init_retrievers(self):
-        """初始化所有配置的检索器"""
-        if not self.retrievers:
-            # 初始化LangChain RAG检索器
-            if self.config.langchain_rag.enabled:
-                self.retrievers["langchain_rag"] = LangChainRetriever(self.config.langchain_rag.config)
-            
-            # 初始化GraphRAG检索器（待实现）
-            # if self.config.graphrag.enabled:
-            #     from app.models.retrieval import GraphRAGRetriever
-            #     self.retrievers["graphrag"] = GraphRAGRetriever(self.config.graphrag.config)
+    def _create_retriever(self, retriever_name: str) -> Optional[RetrievalInterface]:
+        """按配置中声明的同名实例创建检索器，未启用或不存在时返回None"""
+        instance = self.config.instances().get(retriever_name)
+        if instance is None or not instance.enabled:
+            return None
+        return get_retriever_registry().create(retriever_name, instance, self)
+    
+    def _get_lock(self, retriever_name: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(retriever_name, threading.Lock())
     
     def get_retriever(self, retriever_name: str) -> RetrievalInterface:
-        """获取指定名称的检索器"""
-        if retriever_name not in self.retrievers:
-            # 延迟初始化所有检索器
-            self._init_retrievers()
+        """获取指定名称的检索器，首次访问时创建"""
+        retriever = self.retrievers.get(retriever_name)
+        if retriever is not None:
+            return retriever
+        
+        with self._get_lock(retriever_name):
+            # 双重检查，其他线程可能已经完成初始化
             if retriever_name not in self.retrievers:
-                raise ValueError(f"Retriever {retriever_name} not found")
+                start = time.perf_counter()
+                retriever = self._create_retriever(retriever_name)
+                if retriever is None:
+                    raise ValueError(f"Retriever {retriever_name} not found")
+                self.retrievers[retriever_name] = retriever
+                # 新加载的检索器在下次状态查询时立即探测
+                self._probed_at = 0.0
+                logger.info("检索器 %s 初始化完成，耗时 %.2fs",
+                            retriever_name, time.perf_counter() - start)
         return self.retrievers[retriever_name]
     
+    def _cache_lookup(self, retriever: RetrievalInterface, retriever_name: str,
+                      query: str, kwargs: Dict[str, Any], query_embedding: Any = None):
+        """查询结果缓存，返回 (作用域, 缓存结果, 查询向量)；已有查询向量时直接复用"""
+        with stage("cache_lookup"):
+            scope = AnswerCache.make_scope(retriever_name, kwargs, retriever.get_collection_version())
+            result, hit, embedding = self.answer_cache.get(
+                scope, query,
+                embed_fn=(lambda: query_embedding) if query_embedding is not None
+                else (lambda: retriever.embed_query(query))
+            )
+        if hit is not None:
+            # 返回副本并标记命中方式，避免调用方修改缓存内容
+            result = {**result, "cache": hit}
+        return scope, result, embedding
+    
+    @staticmethod
+    def _prefetched(query_embedding: Any, vector_hits: Any) -> Dict[str, Any]:
+        """传给检索器的预计算结果关键字参数；vector_hits 只传给支持批量预查询的检索器"""
+        prefetched = {"query_embedding": query_embedding}
+        if vector_hits is not None:
+            prefetched["vector_hits"] = vector_hits
+        return prefetched
+    
+    @contextmanager
+    def _track(self, retriever_name: str, operation: str, query: str):
+        """登记进行中的前台请求并记录各阶段耗时和追踪span，成功结束时记录该检索器最近一次请求耗时
+        
+        返回一个字典，调用方放入检索结果后，span 会记录缓存命中方式和来源数。
+        """
+        # 检索器名来自请求，未知名称合并为一个指标标签
+        known = retriever_name in self.retrievers or retriever_name in self.list_retrievers()
+        outcome: Dict[str, Any] = {}
+        with query_activity.track(), span(f"RetrievalService.{operation}", **{
+            "retriever": retriever_name, "query_chars": len(query)
+        }) as service_span, track_request(retriever_name if known else "unknown") as timings:
+            yield outcome
+            result = outcome.get("result") or {}
+            service_span.set_attributes({
+                "cache": result.get("cache"),
+                "sources": len(result.get("sources", [])),
+                "documents": len(result["documents"]) if "documents" in result else None
+            })
+        self._latency[retriever_name] = (timings["total"], time.time())
+    
     def retrieve(self, retriever_name: str, query: str, **kwargs) -> Dict[str, Any]:
-        """调用指定检索器执行检索"""
+        """调用指定检索器执行检索，启用缓存时优先返回缓存结果"""
+        with self._track(retriever_name, "retrieve", query) as outcome:
+            outcome["result"] = self._retrieve(retriever_name, query, **kwargs)
+        return outcome["result"]
+    
+    def _retrieve(self, retriever_name: str, query: str, **kwargs) -> Dict[str, Any]:
         retriever = self.get_retriever(retriever_name)
-        return retriever.retrieve(query, **kwargs)
+        if self.answer_cache is None:
+            return retriever.retrieve(query, **kwargs)
+        
+        scope, cached, embedding = self._cache_lookup(retriever, retriever_name, query, kwargs)
+        if cached is not None:
+            return cached
+        result = retriever.retrieve(query, query_embedding=embedding, **kwargs)
+        self.answer_cache.put(scope, query, result, embedding)
+        return result
+    
+    async def aget_retriever(self, retriever_name: str) -> RetrievalInterface:
+        """异步获取指定名称的检索器，首次创建（加载模型）在线程池中执行"""
+        retriever = self.retrievers.get(retriever_name)
+        if retriever is None:
+            retriever = await run_in_threadpool(self.get_retriever, retriever_name)
+        return retriever
+    
+    async def aretrieve(self, retriever_name: str, query: str, *, query_embedding: Any = None,
+                        vector_hits: Any = None, **kwargs) -> Dict[str, Any]:
+        """异步调用指定检索器执行检索，不阻塞事件循环，启用缓存时优先返回缓存结果
+        
+        query_embedding 为预先计算的查询向量，vector_hits 为预先查询的向量库结果（如批量检索），
+        提供时不再重复向量化和查询向量库；二者只由服务内部传入，请求的 kwargs 中不允许出现（见 RESERVED_KWARGS）。
+        """
+        with self._track(retriever_name, "aretrieve", query) as outcome:
+            outcome["result"] = await self._aretrieve(retriever_name, query, query_embedding, vector_hits, **kwargs)
+        return outcome["result"]
+    
+    async def _aretrieve(self, retriever_name: str, query: str, query_embedding: Any = None,
+                         vector_hits: Any = None, **kwargs) -> Dict[str, Any]:
+        retriever = await self.aget_retriever(retriever_name)
+        if self.answer_cache is None:
+            return await retriever.aretrieve(query, **self._prefetched(query_embedding, vector_hits), **kwargs)
+        
+        # 查询向量化在线程池中执行
+        scope, cached, embedding = await run_in_threadpool(
+            self._cache_lookup, retriever, retriever_name, query, kwargs, query_embedding
+        )
+        if cached is not None:
+            return cached
+        result = await retriever.aretrieve(query, **self._prefetched(embedding, vector_hits), **kwargs)
+        self.answer_cache.put(scope, query, result, embedding)
+        return result
+    
+    def search(self, retriever_name: str, query: str, **kwargs) -> Dict[str, Any]:
+        """调用指定检索器仅执行检索，不调用LLM"""
+        with self._track(retriever_name, "search", query) as outcome:
+            outcome["result"] = self.get_retriever(retriever_name).search(query, **kwargs)
+        return outcome["result"]
+    
+    async def asearch(self, retriever_name: str, query: str, *, query_embedding: Any = None,
+                      vector_hits: Any = None, **kwargs) -> Dict[str, Any]:
+        """异步调用指定检索器仅执行检索，不调用LLM"""
+        with self._track(retriever_name, "asearch", query) as outcome:
+            retriever = await self.aget_retriever(retriever_name)
+            outcome["result"] = await retriever.asearch(
+                query, **self._prefetched(query_embedding, vector_hits), **kwargs
+            )
+        return outcome["result"]
+    
+    async def abatch_retrieve(self, items: List[Dict[str, Any]],
+                              max_concurrency: int = 8) -> List[Dict[str, Any]]:
+        """批量检索
+        
+        items 为 {"retriever_name", "query", "kwargs", "retrieval_only"} 列表。同一检索器的查询
+        先一次批量向量化，再一次查询向量库（检索器支持时），之后以不超过 max_concurrency 的并发
+        执行重排和生成，retrieval_only 为真的条目不调用LLM生成。结果与输入顺序一致，
+        单条失败以 error 字段返回，不影响其他条目。
+        """
+        outcomes: List[Dict[str, Any]] = [{"result": None, "error": None} for _ in items]
+        embeddings: List[Any] = [None] * len(items)
+        vector_hits: List[Any] = [None] * len(items)
+        
+        # 按检索器分组批量向量化
+        groups: Dict[str, List[int]] = {}
+        for index, item in enumerate(items):
+            groups.setdefault(item["retriever_name"], []).append(index)
+        for retriever_name, indices in groups.items():
+            try:
+                retriever = await self.aget_retriever(retriever_name)
+            except Exception as e:
+                for index in indices:
+                    outcomes[index]["error"] = str(e)
+                continue
+            try:
+                vectors = await run_in_threadpool(
+                    retriever.embed_queries, [items[index]["query"] for index in indices]
+                )
+            except Exception as e:
+                # 批量向量化失败时退回逐条检索
+                logger.warning("检索器 %s 批量向量化失败: %s", retriever_name, e)
+                vectors = None
+            for index, vector in zip(indices, vectors or []):
+                embeddings[index] = vector
+            if not vectors:
+                continue
+            try:
+                hits = await run_in_threadpool(
+                    retriever.vector_search_batch,
+                    [items[index]["query"] for index in indices],
+                    [items[index].get("kwargs", {}) for index in indices],
+                    vectors
+                )
+            except Exception as e:
+                # 批量查询向量库失败时由各条目分别查询
+                logger.warning("检索器 %s 批量查询向量库失败: %s", retriever_name, e)
+                hits = None
+            for index, item_hits in zip(indices, hits or []):
+                vector_hits[index] = item_hits
+        
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def run_one(index: int) -> None:
+            item = items[index]
+            async with semaphore:
+                run = self.asearch if item.get("retrieval_only") else self.aretrieve
+                try:
+                    outcomes[index]["result"] = await run(
+                        item["retriever_name"], item["query"],
+                        query_embedding=embeddings[index], vector_hits=vector_hits[index],
+                        **item.get("kwargs", {})
+                    )
+                except Exception as e:
+                    outcomes[index]["error"] = str(e)
+        
+        await asyncio.gather(*(
+            run_one(index) for index, outcome in enumerate(outcomes) if outcome["error"] is None
+        ))
+        return outcomes
+    
+    async def astream(self, retriever_name: str, query: str, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """流式调用指定检索器，在检索器事件之后追加带耗时信息的 done 事件
+        
+        生成器在响应任务中逐步执行，不使用上下文计时，按事件到达时间记录检索、首token和总耗时。
+        """
+        start = time.perf_counter()
+        timings: Dict[str, float] = {}
+        status = "error"
+        try:
+            with span("RetrievalService.astream", **{
+                "retriever": retriever_name, "query_chars": len(query)
+            }) as stream_span:
+                retriever = await self.aget_retriever(retriever_name)
+                async for event in retriever.astream(query, **kwargs):
+                    elapsed_ms = (time.perf_counter() - start) * 1000
+                    if event["event"] == "sources":
+                        timings.setdefault("sources_ms", elapsed_ms)
+                        stream_span.set_attribute("sources", len(event["data"]))
+                    elif event["event"] == "token":
+                        timings.setdefault("first_token_ms", elapsed_ms)
+                    yield event
+            status = "ok"
+        finally:
+            timings["total_ms"] = (time.perf_counter() - start) * 1000
+            count_request(retriever_name, status)
+            observe_stages(retriever_name, {
+                stage_name: timings[key] for key, stage_name in (
+                    ("sources_ms", "retrieval"), ("first_token_ms", "llm_first_token"), ("total_ms", "total")
+                ) if key in timings
+            })
+        self._latency[retriever_name] = (timings["total_ms"], time.time())
+        yield {"event": "done", "data": {"retriever": retriever_name, "timings": timings}}
     
     def list_retrievers(self) -> Dict[str, str]:
-        """列出所有可用的检索器"""
-        # 基于配置返回可用检索器，不实际初始化
+        """列出所有可用的检索器实例及其类型"""
+        # 基于配置返回可用检索器，不实际初始化；依赖的实例未启用时不可用
+        instances = self.config.instances()
         available_retrievers = {}
+        for name, instance in instances.items():
+            if not instance.enabled:
+                continue
+            dense = instance.config.get("dense", "langchain_rag") if instance.type == "hybrid" else None
+            if dense is not None and not (dense in instances and instances[dense].enabled):
+                continue
+            available_retrievers[name] = instance.type
+        return available_retrievers
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """返回结果缓存和各检索器缓存的命中统计"""
+        stats: Dict[str, Any] = (
+            {"enabled": True, **self.answer_cache.stats()}
+            if self.answer_cache is not None else {"enabled": False}
+        )
+        # 已创建检索器自身的缓存统计（如查询向量缓存命中率）
+        stats["retrievers"] = {
+            name: retriever.get_stats() for name, retriever in list(self.retrievers.items())
+        }
+        # 进程内共享的嵌入模型及引用数
+        stats["embedding_models"] = embedding_pool_stats()
+        return stats
+    
+    def _probe(self) -> Dict[str, Dict[str, Any]]:
+        probes = {}
+        for name, type_name in self.list_retrievers().items():
+            retriever = self.retrievers.get(name)
+            probe: Dict[str, Any] = {"type": type_name, "loaded": retriever is not None}
+            if retriever is not None:
+                try:
+                    probe.update(retriever.probe())
+                    probe["status"] = "ok"
+                except Exception as e:
+                    # 向量库等依赖不可用
+                    probe["status"] = "error"
+                    probe["error"] = str(e)
+            probes[name] = probe
+        return probes
+    
+    def health(self, max_age_s: float = 10.0) -> Dict[str, Dict[str, Any]]:
+        """各检索器状态：是否已加载、依赖探测结果（文档数、嵌入模型加载耗时）和最近一次请求耗时
         
-        if self.config.langchain_rag.enabled:
-            available_retrievers["langchain_rag"] = "langchain_rag"
+        探测结果缓存 max_age_s 秒，期间的调用只读取缓存；未加载的检索器不会因探测而被创建。
+        """
+        with self._probe_lock:
+            if time.monotonic() - self._probed_at >= max_age_s:
+                self._probes = self._probe()
+                self._probed_at = time.monotonic()
+            probes = self._probes
+        health = {}
+        for name, probe in probes.items():
+            item = dict(probe)
+            latency = self._latency.get(name)
+            if latency is not None:
+                item["last_query_ms"] = round(latency[0], 1)
+                item["last_query_at"] = latency[1]
+            health[name] = item
+        return health
+    
+    def invalidate_cache(self, retriever_name: Optional[str] = None) -> int:
+        """清除结果缓存，知识库更新后调用；返回清除的条目数"""
+        if self.answer_cache is None:
+            return 0
+        return self.answer_cache.invalidate(retriever_name)
+    
+    def _preload(self, retriever_name: str) -> None:
+        """导入检索器依赖的重量级模块（LLM客户端、嵌入后端、向量库），单独计时"""
+        import importlib
         
-        if self.config.graphrag.enabled:
-            available_retrievers["graphrag"] = "graphrag"
+        instance = self.config.instances().get(retriever_name)
+        if instance is None:
+            return
+        for module in get_retriever_registry().imports(instance):
+            try:
+                importlib.import_module(module)
+            except ImportError as e:
+                # 缺少可选依赖时交给检索器初始化报告具体错误
+                logger.debug("预导入模块 %s 失败: %s", module, e)
+    
+    def warmup(self, retriever_names: Optional[List[str]] = None, readiness: Any = None) -> None:
+        """预热检索器，未指定名称时预热所有已启用的检索器
         
-        return available_retrievers
+        每个检索器分三步计时：导入依赖模块、初始化（加载嵌入模型、打开向量库）、执行一次查询向量化；
+        提供 readiness 时记录每个检索器的预热结果和耗时。
+        """
+        for name in retriever_names or list(self.list_retrievers()):
+            timings: Dict[str, float] = {}
+            start = time.perf_counter()
+            try:
+                self._preload(name)
+                timings["import_s"] = time.perf_counter() - start
+                retriever = self.get_retriever(name)
+                timings["init_s"] = time.perf_counter() - start - timings["import_s"]
+                retriever.warmup()
+                timings["warmup_s"] = time.perf_counter() - start - timings["import_s"] - timings["init_s"]
+            except Exception as e:
+                # 预热失败不阻止服务启动：就绪状态在后台按退避重试，首次请求时也会再次尝试初始化
+                logger.warning("检索器 %s 预热失败: %s", name, e)
+                if readiness is not None:
+                    readiness.record(name, "failed", timings, str(e))
+                continue
+            timings["total_s"] = time.perf_counter() - start
+            if readiness is not None:
+                readiness.record(name, "ready", timings)
+            logger.info("检索器 %s 预热完成，耗时 %.2fs（导入 %.2fs，初始化 %.2fs，预热 %.2fs）",
+                        name, timings["total_s"], timings["import_s"], timings["init_s"], timings["warmup_s"])
+    
+    def shutdown(self) -> None:
+        """关闭所有已创建的检索器并释放资源"""
+        for name, retriever in list(self.retrievers.items()):
+            try:
+                retriever.close()
+            except Exception as e:
+                logger.warning("检索器 %s 关闭失败: %s", name, e)
+        self.retrievers.clear()
+
+# 进程内共享的检索服务实例
+_retrieval_service: Optional[RetrievalService] = None
+_retrieval_service_lock = threading.Lock()
+
+def get_retrieval_service() -> RetrievalService:
+    """获取进程内共享的检索服务实例，可直接用作FastAPI依赖"""
+    global _retrieval_service
+    if _retrieval_service is None:
+        with _retrieval_service_lock:
+            if _retrieval_service is None:
+                _retrieval_service = RetrievalService()
+    return _retrieval_service
+
+def shutdown_retrieval_service() -> None:
+    """关闭共享的检索服务，下次获取时重新创建"""
+    global _retrieval_service
+    with _retrieval_service_lock:
+        if _retrieval_service is not None:
+            _retrieval_service.shutdown()
+            _retrieval_service = None
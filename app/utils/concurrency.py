@@ -0,0 +1,70 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Optional, TypeVar
+from app.utils.config import get_service_config
+
+T = TypeVar("T")
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+def get_executor() -> ThreadPoolExecutor:
+    """获取进程内共享的有界线程池，用于运行同步的检索/模型调用"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=get_service_config().retrieval_threads,
+                    thread_name_prefix="retrieval"
+                )
+    return _executor
+
+async def run_in_threadpool(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """在共享线程池中执行同步函数，不阻塞事件循环；函数在调用方上下文的副本中运行（保留请求计时等上下文变量）"""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_executor(), functools.partial(context.run, func, *args, **kwargs))
+
+def shutdown_executor() -> None:
+    """关闭共享线程池，下次使用时重新创建"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+class ActivityGauge:
+    """统计进行中的前台请求数，后台任务（如知识库导入）在前台繁忙时让路"""
+    
+    def __init__(self):
+        self._active = 0
+        self._condition = threading.Condition()
+    
+    @property
+    def active(self) -> int:
+        return self._active
+    
+    @contextmanager
+    def track(self):
+        with self._condition:
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._active -= 1
+                if self._active == 0:
+                    self._condition.notify_all()
+    
+    def wait_idle(self, timeout: float) -> bool:
+        """等待前台空闲，最多等待 timeout 秒；返回是否已空闲"""
+        with self._condition:
+            return self._condition.wait_for(lambda: self._active == 0, timeout)
+
+# 进行中的检索请求
+query_activity = ActivityGauge()
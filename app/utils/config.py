@@ -1,5 +1,6 @@
+from pydantic import BaseModel
 from pydantic_settings import BaseSettings
-from typing import Dict, Any
+from typing import Dict, Any, List, Literal, Optional
 
 class LangChainRAGConfig(BaseSettings):
     """LangChain RAG检索器配置"""
@@ -7,9 +8,35 @@ class LangChainRAGConfig(BaseSettings):
     config: Dict[str, Any] = {
         "persist_dir": "./data/rag_db",
         "collection_name": "rag",
+        # 嵌入模型、后端（huggingface/onnx/hash）和LLM，为空时使用环境变量 EMBED_MODEL_PATH、EMBED_BACKEND /
+        # MODEL、BASE_URL；嵌入模型相同的检索器实例共用进程内已加载的模型
+        "embed_model": None,
+        "embed_backend": None,
+        "llm_model": None,
+        "llm_base_url": None,
         "chunk_size": 500,
         "chunk_overlap": 50,
-        "top_k": 5
+        "top_k": 5,
+        # 默认搜索参数，可被请求的 kwargs 按次覆盖（见 SearchOptions）
+        "search_type": "mmr",
+        "fetch_k": 20,
+        "lambda_mult": 0.5,
+        "score_threshold": 0.5,
+        # 查询向量LRU缓存容量，0表示关闭；配置路径后关闭服务时持久化，重启后加载
+        "embedding_cache_size": 10000,
+        "embedding_cache_path": None,
+        # 查询向量化微批：并发查询凑满 batch_size 条或最多再等待 batch_wait_ms 后一次计算，单独的查询立即计算
+        "embedding_batching": True,
+        "embedding_batch_size": 32,
+        "embedding_batch_wait_ms": 5.0,
+        # 交叉编码器重排（RERANK_MODEL_PATH 指定模型）：默认关闭，可按请求开启；
+        # 召回 rerank_candidates 个候选分批打分，超出 rerank_budget_ms 后其余候选保持向量检索顺序
+        "rerank": False,
+        "rerank_candidates": 20,
+        "rerank_budget_ms": 300,
+        "rerank_batch_size": 16,
+        "rerank_max_length": 512,
+        "rerank_max_concurrency": 1
     }
 
 class GraphRAGConfig(BaseSettings):
@@ -17,17 +44,143 @@ class GraphRAGConfig(BaseSettings):
     enabled: bool = False
     config: Dict[str, Any] = {
         "data_dir": "./data/graphrag",
-        "lancedb_uri": "./data/graphrag/lancedb"
+        "lancedb_uri": "./data/graphrag/lancedb",
+        # LanceDB 中的实体、关系和社区报告表名；实体表（和可选的社区表）需包含描述向量列 vector
+        "entity_table": "entities",
+        "relationship_table": "relationships",
+        "community_table": "communities",
+        "embed_model": None,
+        "embed_backend": None,
+        "llm_model": None,
+        "llm_base_url": None,
+        # 默认检索参数，可按请求覆盖
+        "search_mode": "local",
+        "top_k": 10,
+        "max_neighbors": 10,
+        "max_relationships": 30,
+        "top_k_communities": 5,
+        "community_level": None,
+        "embedding_cache_size": 10000,
+        "embedding_batching": True
     }
 
+class HybridConfig(BaseSettings):
+    """混合检索器配置，与 dense 指定的向量检索器共用向量库、嵌入模型和LLM"""
+    enabled: bool = True
+    config: Dict[str, Any] = {
+        # 提供向量检索、嵌入模型和LLM的 langchain_rag 类型实例名
+        "dense": "langchain_rag",
+        # BM25索引：分词器（auto/jieba/bigram）、参数和保存路径（为空时保存在向量库目录中）
+        "tokenizer": "auto",
+        "bm25_k1": 1.5,
+        "bm25_b": 0.75,
+        "index_path": None,
+        # 稠密和稀疏检索各召回 fetch_k 个候选，RRF融合后返回 top_k 个
+        "top_k": 5,
+        "fetch_k": 20,
+        "rrf_k": 60
+    }
+
+class RetrieverInstanceConfig(BaseModel):
+    """命名检索器实例配置：type 为检索器类型，config 只需填写与该类型默认配置不同的项"""
+    type: str
+    enabled: bool = True
+    config: Dict[str, Any] = {}
+
 class RetrievalConfig(BaseSettings):
-    """检索器配置"""
+    """检索器配置
+    
+    langchain_rag、graphrag、hybrid 三项是同名的内置实例；retrievers 可声明任意多个命名实例
+    （环境变量 RETRIEVERS 为 JSON），同名时覆盖内置实例。例如：
+    RETRIEVERS='{"manual": {"type": "langchain_rag", "config": {"collection_name": "manual",
+    "embed_model": "bge-small-zh-v1.5"}}, "manual_hybrid": {"type": "hybrid", "config": {"dense": "manual"}}}'
+    """
     langchain_rag: LangChainRAGConfig = LangChainRAGConfig()
     graphrag: GraphRAGConfig = GraphRAGConfig()
+    hybrid: HybridConfig = HybridConfig()
+    retrievers: Dict[str, RetrieverInstanceConfig] = {}
+    
+    def instances(self) -> Dict[str, RetrieverInstanceConfig]:
+        """返回全部命名实例（含内置实例），不做初始化"""
+        instances = {
+            "langchain_rag": RetrieverInstanceConfig(
+                type="langchain_rag", enabled=self.langchain_rag.enabled, config=self.langchain_rag.config
+            ),
+            "graphrag": RetrieverInstanceConfig(
+                type="graphrag", enabled=self.graphrag.enabled, config=self.graphrag.config
+            ),
+            "hybrid": RetrieverInstanceConfig(
+                type="hybrid", enabled=self.hybrid.enabled, config=self.hybrid.config
+            )
+        }
+        instances.update(self.retrievers)
+        return instances
+
+class ServiceConfig(BaseSettings):
+    """服务运行配置"""
+    # 启动时是否预热检索器（加载嵌入模型、打开向量库），关闭时在首次请求时懒加载
+    warmup_on_startup: bool = False
+    # 需要预热的检索器，为空表示预热所有已启用的检索器
+    warmup_retrievers: List[str] = []
+    # 预热方式：background 先开始监听端口，在后台任务中预热，完成前 /readyz 返回503；
+    # blocking 预热完成后才开始监听
+    warmup_mode: Literal["background", "blocking"] = "background"
+    # 预热失败的检索器在后台重试，间隔从 warmup_retry_initial_s 秒开始按倍数增加，最长 warmup_retry_max_s 秒
+    warmup_retry_initial_s: float = 5
+    warmup_retry_max_s: float = 300
+    # 后台预热完成前收到的 /api 请求：allow 直接处理（首个请求承担加载耗时），reject 返回503，
+    # queue 等待预热完成，最长 not_ready_queue_timeout_s 秒，超时返回503
+    not_ready_policy: Literal["allow", "reject", "queue"] = "allow"
+    not_ready_queue_timeout_s: float = 30
+    # /readyz 中检索器状态探测（文档数、向量库可用性）的缓存时间
+    health_probe_ttl_s: float = 10
+    # /readyz 只在这些检索器预热成功且探测正常时返回200；其余检索器视为可选，
+    # 不可用时只在各自的 ready 字段中报告，不影响整体就绪。为空表示没有必需的检索器
+    ready_required_retrievers: List[str] = []
+    # 链路追踪：none 关闭（几乎无开销），jsonl 逐行写入本地文件，otlp 发送到 OpenTelemetry Collector
+    # （需安装 opentelemetry-sdk 和 opentelemetry-exporter-otlp-proto-grpc）；按链路以 sample_ratio 比例采样
+    tracing_exporter: Literal["none", "jsonl", "otlp"] = "none"
+    tracing_file: str = "./logs/traces.jsonl"
+    # 为空时使用 OTEL_EXPORTER_OTLP_ENDPOINT
+    tracing_otlp_endpoint: Optional[str] = None
+    tracing_service_name: str = "agent-service"
+    tracing_sample_ratio: float = 1.0
+    # 非流式接口是否以流式方式调用LLM以记录首token耗时（llm_first_token）；关闭时直接 invoke，
+    # 开启追踪时被采样的请求总是流式调用
+    llm_first_token_timing: bool = False
+    # 同步检索器在异步接口中使用的线程池大小，限制同时占用的线程数
+    retrieval_threads: int = 8
+    # 检索结果缓存：精确匹配，可选语义相似（查询向量余弦相似度不低于阈值时复用答案）
+    answer_cache_enabled: bool = True
+    answer_cache_max_entries: int = 1000
+    answer_cache_ttl_seconds: float = 600
+    # 语义相似匹配默认关闭：相似但不同的问题可能得到错误的答案，开启前应按业务数据评估阈值
+    answer_cache_semantic_enabled: bool = False
+    answer_cache_semantic_threshold: float = 0.95
+    # 缓存作用域中的向量库文档数缓存秒数：本进程导入后立即失效，其他进程写入后最迟在此时间后失效
+    answer_cache_version_ttl_s: float = 5
+    # 知识库导入：加载/切分进程数（0表示在当前进程中串行执行）和文档向量化批大小
+    ingest_workers: int = 2
+    ingest_embed_batch_size: int = 64
+    # 导入每批向量化前等待进行中检索请求的最长时间，保证查询优先
+    ingest_yield_max_ms: float = 200
+    # 导入流水线各级之间在途批次数上限；超过该大小（MB）的文件在当前进程中流式切分
+    ingest_max_inflight_batches: int = 4
+    ingest_stream_threshold_mb: float = 16
+    # 后台导入任务：执行线程数、排队上限（超出时接口返回429）、允许导入的目录和上传文件保存目录
+    ingest_job_workers: int = 1
+    ingest_queue_size: int = 16
+    ingest_allowed_dirs: List[str] = ["./data"]
+    ingest_upload_dir: str = "./data/uploads"
 
 # 全局配置实例
 _retrieval_config = RetrievalConfig()
+_service_config = ServiceConfig()
 
 def get_retrieval_config() -> RetrievalConfig:
     """获取检索器配置"""
     return _retrieval_config
+
+def get_service_config() -> ServiceConfig:
+    """获取服务运行配置"""
+    return _service_config
@@ -0,0 +1,20 @@
+import logging
+import os
+
+_configured = False
+
+def get_logger(name: str) -> logging.Logger:
+    """获取日志记录器，首次调用时为 app 命名空间配置输出格式"""
+    global _configured
+    if not _configured:
+        root = logging.getLogger("app")
+        if not root.handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter(
+                "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+            ))
+            root.addHandler(handler)
+        root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+        root.propagate = False
+        _configured = True
+    return logging.getLogger(name)
@@ -0,0 +1,117 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+from fastapi.responses import Response
+from prometheus_client import Counter, Histogram
+from pydantic import BaseModel
+from app.utils.tracing import span
+
+# 阶段耗时（秒）分桶：覆盖毫秒级的向量检索到数十秒的LLM生成
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGE_SECONDS = Histogram(
+    "agent_service_stage_seconds",
+    "Time spent in each stage of a retrieval request",
+    ["endpoint", "retriever", "stage"],
+    buckets=STAGE_BUCKETS
+)
+REQUESTS = Counter(
+    "agent_service_requests",
+    "Retrieval requests by outcome",
+    ["endpoint", "retriever", "status"]
+)
+
+# 阶段名：embed（查询向量化）、cache_lookup（结果缓存查找，未命中时包含 embed）、vector_search、mmr、
+# bm25_search、graph_search、rerank、prompt（拼接上下文）、llm_first_token（非流式接口只在开启追踪或
+# llm_first_token_timing 时记录）、llm、total（检索服务内总耗时）、serialize（响应序列化，只进入直方图）；
+# 流式接口记录 retrieval（推送来源前）、llm_first_token 和 total
+
+# 当前请求的端点标签（由API层设置，直接调用检索服务时为 internal）
+_endpoint: ContextVar[str] = ContextVar("metrics_endpoint", default="internal")
+# 当前检索的阶段耗时（ms），不在计时范围内时为None
+_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("stage_timings", default=None)
+
+def add_stage(name: str, elapsed_ms: float) -> None:
+    """把一段耗时累加到当前检索的阶段计时中，不在计时范围内时忽略"""
+    timings = _timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + elapsed_ms
+
+@contextmanager
+def stage(name: str, **attributes: Any) -> Iterator[Any]:
+    """记录代码块的耗时为一个阶段（同名阶段多次执行时累加），开启追踪时同时创建同名span
+    
+    返回span，可在代码块中补充属性（如返回的文档数）；追踪关闭时为空span。
+    """
+    with span(name, **attributes) as current:
+        if _timings.get() is None:
+            yield current
+            return
+        start = time.perf_counter()
+        try:
+            yield current
+        finally:
+            add_stage(name, (time.perf_counter() - start) * 1000)
+
+def count_request(retriever: str, status: str, endpoint: Optional[str] = None) -> None:
+    REQUESTS.labels(endpoint or _endpoint.get(), retriever, status).inc()
+
+def observe_stages(retriever: str, timings: Dict[str, float], endpoint: Optional[str] = None) -> None:
+    """把阶段耗时（ms）写入直方图"""
+    endpoint = endpoint or _endpoint.get()
+    for name, elapsed_ms in timings.items():
+        STAGE_SECONDS.labels(endpoint, retriever, name).observe(elapsed_ms / 1000)
+
+@contextmanager
+def request_scope(endpoint: str, collect: bool = False) -> Iterator[Dict[str, float]]:
+    """API层：为请求内的检索设置端点标签
+    
+    collect 为真时把请求内检索的阶段耗时合并到返回的字典中，用于在响应中返回 timings；
+    并发执行多条检索的请求（如批量检索）不应开启。
+    """
+    timings: Dict[str, float] = {}
+    endpoint_token = _endpoint.set(endpoint)
+    timings_token = _timings.set(timings if collect else None)
+    try:
+        yield timings
+    finally:
+        _timings.reset(timings_token)
+        _endpoint.reset(endpoint_token)
+
+@contextmanager
+def track_request(retriever: str) -> Iterator[Dict[str, float]]:
+    """服务层：为一次检索单独计时，结束时记录总耗时并写入直方图和请求计数
+    
+    在线程池中执行的阶段同样会被记录（run_in_threadpool 会复制上下文）；
+    外层有 request_scope(collect=True) 时结果同时合并到外层字典。
+    """
+    parent = _timings.get()
+    timings: Dict[str, float] = {}
+    token = _timings.set(timings)
+    start = time.perf_counter()
+    status = "error"
+    try:
+        yield timings
+        status = "ok"
+    finally:
+        _timings.reset(token)
+        timings["total"] = (time.perf_counter() - start) * 1000
+        count_request(retriever, status)
+        observe_stages(retriever, timings)
+        if parent is not None:
+            parent.update(timings)
+
+def rounded(timings: Dict[str, float]) -> Dict[str, float]:
+    """保留两位小数，用于响应中的 timings"""
+    return {name: round(elapsed_ms, 2) for name, elapsed_ms in timings.items()}
+
+def serialize_response(response: BaseModel, retriever: str, endpoint: str) -> Response:
+    """序列化响应并把耗时记录为 serialize 阶段
+    
+    返回的 Response 不再经过 FastAPI 的响应模型序列化；该阶段发生在构造响应之后，只进入直方图，不在响应的 timings 中。
+    """
+    start = time.perf_counter()
+    body = response.model_dump_json()
+    observe_stages(retriever, {"serialize": (time.perf_counter() - start) * 1000}, endpoint)
+    return Response(body, media_type="application/json")
@@ -0,0 +1,265 @@
+import json
+import os
+import random
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+def _clean(attributes: Dict[str, Any]) -> Dict[str, Any]:
+    """只保留 OpenTelemetry 支持的属性类型，其他值转为字符串，None 丢弃"""
+    return {
+        key: value if isinstance(value, (str, bool, int, float)) else str(value)
+        for key, value in attributes.items() if value is not None
+    }
+
+class _NoopSpan:
+    """追踪关闭或未被采样时使用的空span，所有操作都不做任何事"""
+    trace_id = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        return False
+    
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+    
+    def set_attributes(self, attributes: Dict[str, Any]) -> None:
+        pass
+    
+    def is_recording(self) -> bool:
+        return False
+
+NOOP_SPAN = _NoopSpan()
+
+# 未被采样的链路：子span看到该标记时直接返回空span
+_UNSAMPLED = object()
+# 当前线程/协程中正在执行的span（jsonl 导出时使用）
+_current_span: ContextVar[Any] = ContextVar("current_span", default=None)
+
+class _UnsampledRoot(_NoopSpan):
+    """未被采样的根span，执行期间标记整条链路不记录"""
+    
+    def __enter__(self):
+        self._token = _current_span.set(_UNSAMPLED)
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # 在其他上下文中结束（如异步生成器被回收），无需恢复
+            pass
+        return False
+
+class _JsonlSpan:
+    """写入本地 JSONL 文件的span，结束时追加一行记录"""
+    
+    def __init__(self, tracer: "_JsonlTracer", name: str, attributes: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = _clean(attributes)
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id: Optional[str] = None
+        self.trace_id: Optional[str] = None
+    
+    def __enter__(self):
+        parent = _current_span.get()
+        if isinstance(parent, _JsonlSpan):
+            self.trace_id, self.parent_id = parent.trace_id, parent.span_id
+        else:
+            self.trace_id = f"{random.getrandbits(128):032x}"
+        self._token = _current_span.set(self)
+        self.start_ns = time.time_ns()
+        self._start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        duration_ms = (time.perf_counter() - self._start) * 1000
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            pass
+        record = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "duration_ms": round(duration_ms, 3),
+            "status": "error" if exc_type is not None else "ok",
+            "attributes": self.attributes
+        }
+        if exc is not None:
+            record["error"] = f"{exc_type.__name__}: {exc}"
+        self.tracer.write(record)
+        return False
+    
+    def set_attribute(self, key: str, value: Any) -> None:
+        if value is not None:
+            self.attributes.update(_clean({key: value}))
+    
+    def set_attributes(self, attributes: Dict[str, Any]) -> None:
+        self.attributes.update(_clean(attributes))
+    
+    def is_recording(self) -> bool:
+        return True
+
+class _JsonlTracer:
+    """把span逐行写入本地文件，按根span以 sample_ratio 的比例采样整条链路"""
+    
+    def __init__(self, path: str, sample_ratio: float = 1.0):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.sample_ratio = sample_ratio
+        # 行缓冲，每个span结束时写入一行
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+        self._lock = threading.Lock()
+    
+    def span(self, name: str, attributes: Dict[str, Any]):
+        parent = _current_span.get()
+        if parent is _UNSAMPLED:
+            return NOOP_SPAN
+        if parent is None and self.sample_ratio < 1.0 and random.random() >= self.sample_ratio:
+            return _UnsampledRoot()
+        return _JsonlSpan(self, name, attributes)
+    
+    def write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line + "\n")
+    
+    def shutdown(self) -> None:
+        with self._lock:
+            self._file.close()
+
+class _OtelSpan:
+    """OpenTelemetry span 的适配，与 jsonl span 提供相同的接口"""
+    
+    def __init__(self, tracer: Any, name: str, attributes: Dict[str, Any]):
+        self._manager = tracer.start_as_current_span(name, attributes=_clean(attributes))
+        self._span: Any = None
+    
+    def __enter__(self):
+        self._span = self._manager.__enter__()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        return self._manager.__exit__(exc_type, exc, tb)
+    
+    @property
+    def trace_id(self) -> Optional[str]:
+        context = self._span.get_span_context()
+        return f"{context.trace_id:032x}" if context.is_valid else None
+    
+    def set_attribute(self, key: str, value: Any) -> None:
+        if value is not None:
+            self._span.set_attributes(_clean({key: value}))
+    
+    def set_attributes(self, attributes: Dict[str, Any]) -> None:
+        self._span.set_attributes(_clean(attributes))
+    
+    def is_recording(self) -> bool:
+        return self._span.is_recording()
+
+class _OtelTracer:
+    """通过 OTLP（gRPC）把span发送到 OpenTelemetry Collector，批量异步导出"""
+    
+    def __init__(self, endpoint: Optional[str], service_name: str, sample_ratio: float = 1.0):
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+        
+        self.provider = TracerProvider(
+            resource=Resource.create({"service.name": service_name}),
+            sampler=ParentBased(TraceIdRatioBased(sample_ratio))
+        )
+        # endpoint 为空时导出器读取 OTEL_EXPORTER_OTLP_ENDPOINT，默认 localhost:4317
+        self.provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=endpoint)))
+        self.tracer = self.provider.get_tracer("agent_service")
+    
+    def span(self, name: str, attributes: Dict[str, Any]):
+        return _OtelSpan(self.tracer, name, attributes)
+    
+    def shutdown(self) -> None:
+        self.provider.shutdown()
+
+_tracer: Any = None
+_configured = False
+_configure_lock = threading.Lock()
+
+def _configure() -> Any:
+    """按服务配置创建追踪导出器，只执行一次；导出器不可用时记录警告并关闭追踪"""
+    global _tracer, _configured
+    from app.utils.config import get_service_config
+    
+    with _configure_lock:
+        if _configured:
+            return _tracer
+        service_config = get_service_config()
+        try:
+            if service_config.tracing_exporter == "jsonl":
+                _tracer = _JsonlTracer(service_config.tracing_file, service_config.tracing_sample_ratio)
+            elif service_config.tracing_exporter == "otlp":
+                _tracer = _OtelTracer(
+                    service_config.tracing_otlp_endpoint,
+                    service_config.tracing_service_name,
+                    service_config.tracing_sample_ratio
+                )
+        except Exception as e:
+            logger.warning("链路追踪初始化失败，已关闭追踪: %s", e)
+            _tracer = None
+        if _tracer is not None:
+            logger.info("链路追踪已开启，导出方式: %s", service_config.tracing_exporter)
+        _configured = True
+        return _tracer
+
+def tracing_enabled() -> bool:
+    return (_tracer if _configured else _configure()) is not None
+
+def span(name: str, **attributes: Any):
+    """创建一个span，用作上下文管理器，返回的对象支持 set_attribute/set_attributes
+    
+    追踪关闭时返回共享的空span，开销只有一次全局变量判断。在 run_in_threadpool 中执行的代码
+    会继承调用方的当前span（线程池复制上下文）。
+    """
+    tracer = _tracer if _configured else _configure()
+    if tracer is None:
+        return NOOP_SPAN
+    return tracer.span(name, attributes)
+
+def shutdown_tracing() -> None:
+    """导出剩余的span并关闭导出器，下次使用时按配置重新创建"""
+    global _tracer, _configured
+    with _configure_lock:
+        if _tracer is not None:
+            _tracer.shutdown()
+        _tracer = None
+        _configured = False
+
+async def trace_requests(request: Any, call_next: Any):
+    """HTTP中间件：为每个请求创建根span，记录路由和状态码，并在响应头 X-Trace-Id 中返回链路ID
+    
+    流式响应的span在响应头发送时结束，逐token推送的耗时记录在检索服务的span中。
+    """
+    if not tracing_enabled():
+        return await call_next(request)
+    with span(f"HTTP {request.method} {request.url.path}", **{
+        "http.method": request.method,
+        "http.target": request.url.path
+    }) as request_span:
+        response = await call_next(request)
+        request_span.set_attribute("http.status_code", response.status_code)
+        if request_span.trace_id:
+            response.headers["X-Trace-Id"] = request_span.trace_id
+        return response
@@ -0,0 +1 @@
+"""Agent Service 性能基准脚本"""
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+QA链构建开销微基准
+
+对比几种调用方式的单次耗时，LLM和检索器均为本地假实现，只测框架自身的开销：
+    rebuild:      每次查询调用 RetrievalQA.from_chain_type 后 invoke（旧实现）
+    prebuilt:     复用 LangChainRetriever 构建的流水线（generate_chain_for），经 generate_answer 直接 invoke（默认）
+    stream:       同 prebuilt，开启 llm_first_token_timing，以流式方式调用以记录首token耗时
+    params:       同 prebuilt，请求带 temperature/max_tokens，调用时绑定到LLM步骤
+    build:        仅构建 RetrievalQA，不执行调用
+
+使用示例:
+    python -m benchmarks.chain_overhead_bench --iterations 500 --answer-chars 100
+"""
+import argparse
+import time
+from typing import List, Optional
+
+from langchain_classic.chains import RetrievalQA
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.retrievers import BaseRetriever
+
+from app.models.retrieval import LangChainRetriever, generate_answer, generate_chain_for, llm_invoke_params
+from app.utils.config import get_service_config
+from benchmarks.utils import print_table, summarize
+
+class FakeChatModel(FakeListChatModel):
+    """带 temperature/max_tokens 字段的假模型，与 ChatOpenAI 一样接受按请求绑定的LLM参数"""
+    temperature: Optional[float] = None
+    max_tokens: Optional[int] = None
+
+class StaticRetriever(BaseRetriever):
+    """固定返回同一批文档的检索器"""
+    docs: List[Document]
+    
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.docs
+
+def timed(func, iterations: int) -> List[float]:
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser(description="QA链构建开销微基准")
+    parser.add_argument("--iterations", type=int, default=500, help="每种方式的调用次数")
+    parser.add_argument("--docs", type=int, default=5, help="每次检索返回的文档数")
+    parser.add_argument("--answer-chars", type=int, default=100, help="假模型回答的字数（流式调用时的chunk数）")
+    args = parser.parse_args()
+    
+    # 假模型流式输出时每个字符一个chunk，近似真实LLM逐token返回；invoke 一次返回完整答案
+    llm = FakeChatModel(responses=["答" * args.answer_chars])
+    retriever = StaticRetriever(docs=[
+        Document(page_content=f"文档内容 {i}", metadata={"source": f"{i}.txt"}) for i in range(args.docs)
+    ])
+    query = "萧炎的女性朋友有那些?"
+    
+    def rebuild():
+        RetrievalQA.from_chain_type(
+            llm=llm, retriever=retriever, return_source_documents=True
+        ).invoke({"query": query})
+    
+    _, generate_chain = generate_chain_for(llm)
+    service_config = get_service_config()
+    service_config.llm_first_token_timing = False
+    
+    def prebuilt(kwargs=None):
+        docs = retriever.invoke(query)
+        generate_answer(generate_chain, LangChainRetriever._prompt_inputs(query, docs), llm_invoke_params(kwargs or {}))
+    
+    def stream():
+        service_config.llm_first_token_timing = True
+        try:
+            prebuilt()
+        finally:
+            service_config.llm_first_token_timing = False
+    
+    def params():
+        prebuilt({"temperature": 0.1, "max_tokens": 256})
+    
+    def build():
+        RetrievalQA.from_chain_type(llm=llm, retriever=retriever, return_source_documents=True)
+    
+    rows = []
+    for name, func in (("rebuild", rebuild), ("prebuilt", prebuilt), ("stream", stream), ("params", params), ("build", build)):
+        timed(func, min(20, args.iterations))  # 预热
+        latencies = timed(func, args.iterations)
+        rows.append({"mode": name, **summarize(latencies, sum(latencies))})
+    print(f"iterations={args.iterations} docs={args.docs} answer_chars={args.answer_chars}")
+    print_table(rows, ["mode", "requests", "mean_ms", "p50_ms", "p99_ms"])
+
+if __name__ == "__main__":
+    main()
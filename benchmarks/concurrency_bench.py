@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+同步检索与异步检索在并发请求下的延迟对比
+
+before: 在 async 路由中直接调用同步 retrieve（旧实现），阻塞事件循环
+after:  在 async 路由中 await aretrieve，同步检索器退化到有界线程池
+native: 在 async 路由中 await 原生异步的 aretrieve（如 LangChainRetriever 的 ainvoke），不占用线程
+
+检索器用 time.sleep / asyncio.sleep 模拟阻塞和异步的LLM调用，不依赖模型和外部网络；
+服务通过 uvicorn 在本机端口上运行，客户端使用独立线程发起真实HTTP请求。
+
+使用示例:
+    python -m benchmarks.concurrency_bench --clients 16 --requests 4 --latency-ms 200
+"""
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+import httpx
+from fastapi import FastAPI
+
+from app.models.retrieval import RetrievalInterface
+from benchmarks.utils import free_port, print_table, start_server, summarize
+
+class SleepRetriever(RetrievalInterface):
+    """用固定耗时模拟阻塞调用的检索器"""
+    
+    def __init__(self, latency: float):
+        self.latency = latency
+    
+    def retrieve(self, query: str, **kwargs) -> Dict[str, Any]:
+        time.sleep(self.latency)
+        return {"answer": query, "sources": []}
+    
+    def get_name(self) -> str:
+        return "sleep"
+
+class AsyncSleepRetriever(SleepRetriever):
+    """同时实现原生异步接口的检索器，aretrieve 等待期间不占用线程"""
+    
+    async def aretrieve(self, query: str, **kwargs) -> Dict[str, Any]:
+        await asyncio.sleep(self.latency)
+        return {"answer": query, "sources": []}
+
+def build_app(retriever: RetrievalInterface, async_retriever: RetrievalInterface) -> FastAPI:
+    app = FastAPI()
+    
+    @app.get("/before")
+    async def before(q: str = "q"):
+        return retriever.retrieve(q)
+    
+    @app.get("/after")
+    async def after(q: str = "q"):
+        return await retriever.aretrieve(q)
+    
+    @app.get("/native")
+    async def native(q: str = "q"):
+        return await async_retriever.aretrieve(q)
+    
+    return app
+
+def run_clients(base_url: str, path: str, clients: int, requests: int) -> Dict[str, float]:
+    latencies: List[float] = []
+    
+    def worker():
+        with httpx.Client(base_url=base_url, timeout=300) as client:
+            for _ in range(requests):
+                start = time.perf_counter()
+                client.get(path).raise_for_status()
+                latencies.append(time.perf_counter() - start)
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        for future in [pool.submit(worker) for _ in range(clients)]:
+            future.result()
+    return summarize(latencies, time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description="同步/异步检索并发延迟对比")
+    parser.add_argument("--clients", type=int, default=16, help="并发客户端数")
+    parser.add_argument("--requests", type=int, default=4, help="每个客户端的请求数")
+    parser.add_argument("--latency-ms", type=float, default=200, help="模拟的单次检索耗时")
+    args = parser.parse_args()
+    
+    port = free_port()
+    latency = args.latency_ms / 1000
+    server = start_server(build_app(SleepRetriever(latency), AsyncSleepRetriever(latency)), port)
+    rows = []
+    try:
+        for mode in ("before", "after", "native"):
+            stats = run_clients(f"http://127.0.0.1:{port}", f"/{mode}", args.clients, args.requests)
+            rows.append({"mode": mode, **stats})
+    finally:
+        server.should_exit = True
+    print(f"clients={args.clients} requests/client={args.requests} latency={args.latency_ms}ms")
+    print_table(rows, ["mode", "requests", "throughput", "p50_ms", "p99_ms"])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+嵌入后端对比压测
+
+在固定评测集（benchmarks/data/retrieval_eval.json）上对比 HuggingFace 全精度模型与 ONNX（全精度 / int8 量化）
+后端：模型加载耗时和内存、文档向量化吞吐、单条查询延迟、recall@k（按标注的相关文档），
+以及与第一个后端（基准）相比的 top-k 重合率和查询向量余弦相似度。
+每个后端在独立子进程中运行，峰值RSS互不影响。ONNX 模型目录由 python -m app.models.onnx_embeddings 导出。
+
+使用示例:
+    python -m benchmarks.embedding_backend_bench --hf-model /models/bge-large-zh-v1.5 \\
+        --onnx-dir /models/bge-large-zh-v1.5-onnx --threads 1 4
+    python -m benchmarks.embedding_backend_bench --onnx-dir /models/bge-onnx --backends onnx onnx-int8
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+from benchmarks.utils import peak_rss_mb, print_table, summarize
+
+DEFAULT_EVAL_FILE = os.path.join(os.path.dirname(__file__), "data", "retrieval_eval.json")
+
+def load_backend(backend: str, args: argparse.Namespace, threads: int):
+    if backend == "hf":
+        import torch
+        from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+        
+        if threads > 0:
+            torch.set_num_threads(threads)
+        return HuggingFaceEmbeddings(
+            model_name=args.hf_model,
+            model_kwargs={'device': 'cpu'},
+            encode_kwargs={'normalize_embeddings': True, 'batch_size': args.batch_size}
+        )
+    from app.models.onnx_embeddings import ONNX_MODEL_FILE, ONNX_QUANTIZED_FILE, OnnxEmbeddings
+    
+    model_file = ONNX_QUANTIZED_FILE if backend == "onnx-int8" else ONNX_MODEL_FILE
+    return OnnxEmbeddings(args.onnx_dir, model_file, batch_size=args.batch_size, intra_op_threads=threads)
+
+def run_child(backend: str, threads: int, args: argparse.Namespace) -> Dict[str, Any]:
+    """在当前进程中测试一个后端，返回指标、各查询的 top-k 文档和查询向量"""
+    import numpy as np
+    
+    with open(args.eval_file, encoding="utf-8") as f:
+        data = json.load(f)
+    doc_ids = [doc["id"] for doc in data["documents"]]
+    texts = [doc["text"] for doc in data["documents"]]
+    queries = [item["query"] for item in data["queries"]]
+    
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    embedding = load_backend(backend, args, threads)
+    embedding.embed_query("warmup")
+    load_s = time.perf_counter() - start
+    
+    # 文档向量化吞吐：语料重复 corpus_repeat 次，取整体耗时
+    corpus = texts * args.corpus_repeat
+    start = time.perf_counter()
+    embedding.embed_documents(corpus)
+    docs_per_s = len(corpus) / (time.perf_counter() - start)
+    doc_vectors = np.asarray(embedding.embed_documents(texts), dtype=np.float32)
+    
+    latencies: List[float] = []
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for query in queries:
+            t0 = time.perf_counter()
+            embedding.embed_query(query)
+            latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+    query_vectors = np.asarray([embedding.embed_query(query) for query in queries], dtype=np.float32)
+    
+    scores = query_vectors @ doc_vectors.T
+    rankings = [[doc_ids[i] for i in np.argsort(-row)[:args.k]] for row in scores]
+    stats = summarize(latencies, elapsed)
+    return {
+        "load_s": load_s,
+        "rss_mb": peak_rss_mb() - baseline,
+        "docs_per_s": docs_per_s,
+        "query_p50_ms": stats["p50_ms"],
+        "query_p95_ms": stats["p95_ms"],
+        "rankings": rankings,
+        "query_vectors": query_vectors.tolist()
+    }
+
+def compare(result: Dict[str, Any], reference: Dict[str, Any], relevant: List[List[str]], k: int) -> Dict[str, float]:
+    """recall@k（标注）、与基准后端的 top-k 重合率和查询向量余弦相似度"""
+    import numpy as np
+    
+    recall = np.mean([
+        len(set(ranking[:k]) & set(labels)) / min(len(labels), k)
+        for ranking, labels in zip(result["rankings"], relevant)
+    ])
+    overlap = np.mean([
+        len(set(a[:k]) & set(b[:k])) / k for a, b in zip(result["rankings"], reference["rankings"])
+    ])
+    vectors, base = np.asarray(result["query_vectors"]), np.asarray(reference["query_vectors"])
+    cosine = float(np.mean(np.sum(vectors * base, axis=1) / (
+        np.linalg.norm(vectors, axis=1) * np.linalg.norm(base, axis=1)
+    ))) if vectors.shape == base.shape else float("nan")
+    return {"recall_at_k": float(recall), "overlap_at_k": float(overlap), "cosine_vs_ref": cosine}
+
+def main():
+    parser = argparse.ArgumentParser(description="嵌入后端吞吐、延迟和召回对比")
+    parser.add_argument("--backends", nargs="+", choices=["hf", "onnx", "onnx-int8"], default=None,
+                        help="参与对比的后端，第一个作为基准；默认按提供的模型路径选择")
+    parser.add_argument("--hf-model", type=str, default=os.getenv("EMBED_MODEL_PATH"), help="HuggingFace 模型路径")
+    parser.add_argument("--onnx-dir", type=str, default=None, help="ONNX 导出目录")
+    parser.add_argument("--threads", type=int, nargs="+", default=[0], help="推理线程数，0 表示默认值")
+    parser.add_argument("--batch-size", type=int, default=32, help="文档向量化批大小")
+    parser.add_argument("--eval-file", type=str, default=DEFAULT_EVAL_FILE, help="评测集")
+    parser.add_argument("--k", type=int, default=5, help="recall@k 的 k")
+    parser.add_argument("--repeat", type=int, default=5, help="查询重复次数")
+    parser.add_argument("--corpus-repeat", type=int, default=10, help="吞吐测试中语料重复次数")
+    parser.add_argument("--child", type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.child:
+        backend, threads = args.child.split(":")
+        print(json.dumps(run_child(backend, int(threads), args)))
+        return
+    
+    backends = args.backends or (["hf"] if args.hf_model else []) + (
+        ["onnx", "onnx-int8"] if args.onnx_dir else []
+    )
+    if not backends:
+        parser.error("specify --hf-model and/or --onnx-dir")
+    with open(args.eval_file, encoding="utf-8") as f:
+        relevant = [item["relevant"] for item in json.load(f)["queries"]]
+    
+    child_args = [
+        "--batch-size", str(args.batch_size), "--eval-file", args.eval_file, "--k", str(args.k),
+        "--repeat", str(args.repeat), "--corpus-repeat", str(args.corpus_repeat)
+    ]
+    if args.hf_model:
+        child_args += ["--hf-model", args.hf_model]
+    if args.onnx_dir:
+        child_args += ["--onnx-dir", args.onnx_dir]
+    
+    rows = []
+    reference = None
+    for backend in backends:
+        for threads in args.threads:
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.embedding_backend_bench", "--child", f"{backend}:{threads}",
+                 *child_args],
+                check=True, capture_output=True, text=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            reference = reference or result
+            rows.append({
+                "backend": backend,
+                "threads": threads,
+                **{key: value for key, value in result.items() if key not in ("rankings", "query_vectors")},
+                **compare(result, reference, relevant, args.k)
+            })
+            print(f"{backend} threads={threads}: {rows[-1]['docs_per_s']:.1f} docs/s", flush=True)
+    
+    print(f"eval={args.eval_file} k={args.k} reference={backends[0]}:{args.threads[0]}")
+    print_table(rows, ["backend", "threads", "load_s", "rss_mb", "docs_per_s", "query_p50_ms",
+                       "query_p95_ms", "recall_at_k", "overlap_at_k", "cosine_vs_ref"])
+
+if __name__ == "__main__":
+    main()
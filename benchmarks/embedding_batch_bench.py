@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+查询向量化微批调度压测
+
+N 个线程并发调用 embed_query，对比逐条计算（direct）与微批调度（batched）的吞吐和延迟。
+默认使用模拟模型：单次前向耗时 = 固定开销 + 每条耗时 × 条数（sleep 释放GIL，与torch推理类似）；
+指定 --model 时加载真实的 HuggingFace 模型。
+
+使用示例:
+    python -m benchmarks.embedding_batch_bench --clients 32 --requests 20
+    python -m benchmarks.embedding_batch_bench --model /models/bge-large-zh-v1.5
+"""
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from langchain_core.embeddings import Embeddings
+
+from app.models.embeddings import BatchingEmbeddings
+from benchmarks.utils import print_table, summarize
+
+class SimulatedModel(Embeddings):
+    """模拟批量推理耗时的嵌入模型，同一时刻只执行一次前向计算"""
+    
+    def __init__(self, overhead_ms: float, per_item_ms: float, dim: int = 8):
+        self.overhead = overhead_ms / 1000
+        self.per_item = per_item_ms / 1000
+        self.dim = dim
+        self._lock = threading.Lock()
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with self._lock:
+            time.sleep(self.overhead + self.per_item * len(texts))
+        return [[float(len(text))] * self.dim for text in texts]
+    
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+def run(embedding: Embeddings, clients: int, requests: int) -> Dict[str, float]:
+    latencies: List[float] = []
+    
+    def worker(client_id: int):
+        for i in range(requests):
+            start = time.perf_counter()
+            embedding.embed_query(f"client {client_id} query {i}")
+            latencies.append(time.perf_counter() - start)
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(worker, range(clients)))
+    return summarize(latencies, time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description="查询向量化微批调度压测")
+    parser.add_argument("--clients", type=int, default=32, help="并发调用线程数")
+    parser.add_argument("--requests", type=int, default=20, help="每个线程的调用次数")
+    parser.add_argument("--batch-size", type=int, default=32, help="最大批大小")
+    parser.add_argument("--wait-ms", type=float, default=5.0, help="凑批最长等待时间")
+    parser.add_argument("--overhead-ms", type=float, default=20.0, help="模拟模型单次前向固定开销")
+    parser.add_argument("--per-item-ms", type=float, default=1.0, help="模拟模型每条文本的耗时")
+    parser.add_argument("--model", type=str, default=None, help="真实的 HuggingFace 模型路径")
+    args = parser.parse_args()
+    
+    if args.model:
+        from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+        model = HuggingFaceEmbeddings(
+            model_name=args.model,
+            model_kwargs={'device': 'cpu'},
+            encode_kwargs={'normalize_embeddings': True}
+        )
+        model.embed_query("warmup")
+    else:
+        model = SimulatedModel(args.overhead_ms, args.per_item_ms)
+    
+    batched = BatchingEmbeddings(model, max_batch_size=args.batch_size, max_wait_ms=args.wait_ms)
+    rows = [
+        {"mode": "direct", **run(model, args.clients, args.requests)},
+        {"mode": "batched", **run(batched, args.clients, args.requests)},
+    ]
+    rows[1]["avg_batch"] = batched.stats()["avg_batch_size"]
+    batched.close()
+    
+    print(f"clients={args.clients} requests/client={args.requests} "
+          f"batch_size={args.batch_size} wait_ms={args.wait_ms}")
+    print_table(rows, ["mode", "requests", "throughput", "p50_ms", "p99_ms", "avg_batch"])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+知识库导入内存压测
+
+生成不同大小的合成文本语料，每种规模在独立子进程中导入一次，记录进程峰值RSS随语料规模的变化。
+对比一次性加载切分（full，旧实现：TextLoader.load + split_documents 后再向量化）与
+流式流水线（stream，IngestionService）。向量化使用按文本哈希生成的假向量；
+默认写入丢弃数据的空集合，只衡量导入流水线本身，指定 --sink chroma 时写入临时 Chroma 库
+（向量索引本身的内存会随数据量增长）。
+
+使用示例:
+    python -m benchmarks.ingest_memory_bench --sizes-mb 10 50 200
+    python -m benchmarks.ingest_memory_bench --sizes-mb 20 --sink chroma --modes stream
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from app.models.hash_embeddings import HashEmbeddings
+from benchmarks.utils import peak_rss_mb, print_table
+
+class NullCollection:
+    """丢弃写入数据的集合，实现导入流水线用到的 Chroma 集合接口"""
+    
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+            limit: Optional[int] = None, include: Optional[List[str]] = None) -> Dict[str, Any]:
+        return {"ids": []}
+    
+    def upsert(self, **kwargs) -> None:
+        pass
+    
+    def update(self, **kwargs) -> None:
+        pass
+    
+    def delete(self, **kwargs) -> None:
+        pass
+
+def make_corpus(path: str, size_mb: float, seed: int = 0) -> None:
+    """流式生成指定大小的合成中文语料，段落之间以空行分隔"""
+    rng = random.Random(seed)
+    alphabet = "天地玄黄宇宙洪荒日月盈昃辰宿列张寒来暑往秋收冬藏闰余成岁律吕调阳云腾致雨露结为霜"
+    target = int(size_mb * (1 << 20))
+    written = 0
+    with open(path, "w", encoding="utf-8") as f:
+        while written < target:
+            paragraph = "".join(rng.choice(alphabet) for _ in range(rng.randint(50, 800))) + "\n\n"
+            f.write(paragraph)
+            written += len(paragraph.encode("utf-8"))
+
+def run_child(path: str, mode: str, sink: str, batch_size: int) -> Dict[str, Any]:
+    """在当前进程中导入一个文件，返回峰值RSS和耗时"""
+    # 两种方式用到的模块都在记录基线前导入，增长量只反映导入过程本身
+    from langchain_community.document_loaders import TextLoader
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    from app.services.ingestion_service import IngestionService
+    
+    # 低维向量，--sink chroma 时向量索引的内存不掩盖流水线本身的变化
+    embedding = HashEmbeddings(dim=8)
+    baseline = peak_rss_mb()
+    workdir = tempfile.mkdtemp(prefix="ingest_bench_")
+    if sink == "chroma":
+        import chromadb
+        collection = chromadb.PersistentClient(path=workdir).get_or_create_collection("bench")
+    else:
+        collection = NullCollection()
+    
+    start = time.perf_counter()
+    if mode == "full":
+        splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50, length_function=len)
+        chunks = splitter.split_documents(TextLoader(path, encoding="utf-8").load())
+        for i in range(0, len(chunks), batch_size):
+            batch = chunks[i:i + batch_size]
+            texts = [chunk.page_content for chunk in batch]
+            collection.upsert(
+                ids=[f"{i + j}" for j in range(len(batch))],
+                embeddings=embedding.embed_documents(texts),
+                documents=texts,
+                metadatas=[chunk.metadata for chunk in batch]
+            )
+        total = len(chunks)
+    else:
+        ingestion = IngestionService(
+            embedding, collection, os.path.join(workdir, "manifest.json"),
+            workers=0, embed_batch_size=batch_size
+        )
+        total = ingestion.ingest([path])["chunks_total"]
+    return {
+        "chunks": total,
+        "elapsed_s": time.perf_counter() - start,
+        "baseline_mb": baseline,
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="知识库导入内存压测")
+    parser.add_argument("--sizes-mb", type=float, nargs="+", default=[10, 50, 200], help="语料大小（MB）")
+    parser.add_argument("--modes", nargs="+", choices=["full", "stream"], default=["full", "stream"],
+                        help="导入方式")
+    parser.add_argument("--sink", choices=["null", "chroma"], default="null", help="写入目标")
+    parser.add_argument("--batch-size", type=int, default=64, help="向量化批大小")
+    parser.add_argument("--workdir", type=str, default=None, help="语料生成目录，默认使用临时目录")
+    parser.add_argument("--child", type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.child:
+        print(json.dumps(run_child(args.child, args.modes[0], args.sink, args.batch_size)))
+        return
+    
+    workdir = args.workdir or tempfile.mkdtemp(prefix="ingest_corpus_")
+    os.makedirs(workdir, exist_ok=True)
+    rows = []
+    for size_mb in args.sizes_mb:
+        path = os.path.join(workdir, f"corpus_{size_mb:g}mb.txt")
+        if not os.path.exists(path):
+            make_corpus(path, size_mb)
+        for mode in args.modes:
+            # 每次导入使用独立子进程，峰值RSS互不影响
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.ingest_memory_bench", "--child", path,
+                 "--modes", mode, "--sink", args.sink, "--batch-size", str(args.batch_size)],
+                check=True, capture_output=True, text=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            rows.append({
+                "size_mb": size_mb,
+                "mode": mode,
+                **result,
+                "growth_mb": result["peak_rss_mb"] - result["baseline_mb"]
+            })
+            print(f"{size_mb:g}MB {mode}: peak_rss={result['peak_rss_mb']:.1f}MB", flush=True)
+    
+    print(f"sink={args.sink} batch_size={args.batch_size} workdir={workdir}")
+    print_table(rows, ["size_mb", "mode", "chunks", "elapsed_s", "peak_rss_mb", "growth_mb"])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""
+服务端到端压测：导入、检索和Agent查询的吞吐、延迟、内存和阶段耗时
+
+默认完全离线运行：LLM 使用本地模拟的 OpenAI 兼容服务（app.services.mock_llm，在后台线程中运行，
+按首token延迟和生成速度逐token返回），嵌入模型使用确定性的哈希向量后端（EMBED_BACKEND=hash），
+向量库、缓存、线程池、LLM客户端和API层均为真实实现。语料由固定评测集
+（benchmarks/data/retrieval_eval.json）复制 --ingest-copies 份生成，写入临时目录后通过导入接口建库。
+
+场景：ingest（POST /api/v1/ingest/files 并轮询任务，记录向量化速度）、search（/retrieval/query 仅检索）、
+retrieval（/retrieval/query 检索+生成）、agent（/agent/query），每个查询场景按 --concurrency 的各档并发执行。
+--mode inproc 通过 ASGI 直接在进程内调用应用，http 在本机端口上用 uvicorn 运行应用并发起真实HTTP请求，
+--url 压测已经运行的服务（不替换模型，导入场景要求 --corpus-dir 位于服务允许导入的目录中）。
+
+结果可用 --save 保存为基线，之后用 --compare 与基线对比吞吐和延迟，超出 --tolerance 的变化标记为回退。
+
+使用示例:
+    python -m benchmarks.service_bench --concurrency 1 4 16 --requests 64
+    python benchmarks/service_bench.py --scenarios search --requests 32
+    python -m benchmarks.service_bench --mode http --scenarios retrieval agent --llm-ttft-ms 500
+    python -m benchmarks.service_bench --save benchmarks/baselines/service.json
+    python -m benchmarks.service_bench --compare benchmarks/baselines/service.json --fail-on-regression
+    python -m benchmarks.service_bench --url http://127.0.0.1:8000 --corpus-dir ./data/bench_corpus
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import httpx
+
+# 直接以 python benchmarks/service_bench.py 运行时，把仓库根目录加入导入路径
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.utils import free_port, peak_rss_mb, percentile, print_table, start_server, summarize
+
+DEFAULT_EVAL_FILE = os.path.join(os.path.dirname(__file__), "data", "retrieval_eval.json")
+SCENARIOS = ["ingest", "search", "retrieval", "agent"]
+# --cold-queries 时附加到查询后的全局编号，各场景、各档并发之间不重复
+_query_ids = itertools.count()
+
+def write_corpus(eval_file: str, directory: str, copies: int) -> int:
+    """把评测集语料复制 copies 份写成 txt 文件（每份一个文件，段落加副本编号避免完全重复），返回文件数"""
+    with open(eval_file, encoding="utf-8") as f:
+        documents = json.load(f)["documents"]
+    os.makedirs(directory, exist_ok=True)
+    for copy in range(copies):
+        with open(os.path.join(directory, f"corpus_{copy:04d}.txt"), "w", encoding="utf-8") as f:
+            f.write("\n\n".join(f"[{doc['id']}-{copy}] {doc['text']}" for doc in documents))
+    return copies
+
+def configure_env(args: argparse.Namespace, workdir: str, corpus_dir: str, llm_url: str) -> None:
+    """服务配置在导入时读取环境变量，需在导入 run 之前调用；检索器指向临时向量库和模拟模型服务"""
+    os.environ.update({
+        "RETRIEVERS": json.dumps({
+            "langchain_rag": {"type": "langchain_rag", "config": {
+                "persist_dir": os.path.join(workdir, "rag_db"), "collection_name": "bench"
+            }},
+            "graphrag": {"type": "graphrag", "enabled": False}
+        }),
+        "ANSWER_CACHE_ENABLED": "true" if args.answer_cache else "false",
+        "INGEST_ALLOWED_DIRS": json.dumps([corpus_dir]),
+        "WARMUP_ON_STARTUP": "false",
+        "TRACING_EXPORTER": "none",
+        "BASE_URL": llm_url,
+        "API_KEY": "mock",
+        "MODEL": "mock",
+        "EMBED_BACKEND": "hash",
+        "EMBED_MODEL_PATH": "hash",
+        "EMBED_HASH_LATENCY_MS": str(args.embed_ms),
+        "EMBED_WORKER_ADDRESS": ""
+    })
+
+async def run_ingest(client: httpx.AsyncClient, retriever: str, corpus_dir: str) -> Dict[str, Any]:
+    start = time.perf_counter()
+    response = await client.post("/api/v1/ingest/files", json={
+        "retriever_name": retriever, "paths": [corpus_dir], "force": True
+    })
+    response.raise_for_status()
+    job_id = response.json()["job_id"]
+    while True:
+        job = (await client.get(f"/api/v1/ingest/jobs/{job_id}")).json()
+        if job["status"] in ("completed", "failed"):
+            break
+        await asyncio.sleep(0.05)
+    if job["status"] == "failed":
+        raise RuntimeError(f"ingest failed: {job['error']}")
+    progress = job["progress"]
+    return {
+        "requests": progress["chunks_embedded"],
+        "throughput": progress["embeddings_per_sec"],
+        "elapsed_s": time.perf_counter() - start,
+        "errors": len(job["errors"])
+    }
+
+def build_request(scenario: str, retriever: str, query: str) -> Dict[str, Any]:
+    if scenario == "agent":
+        return {"path": "/api/v1/agent/query", "json": {
+            "query": query, "retriever_name": retriever, "include_timings": True
+        }}
+    return {"path": "/api/v1/retrieval/query", "json": {
+        "query": query, "retriever_name": retriever, "retrieval_only": scenario == "search", "include_timings": True
+    }}
+
+async def run_load(client: httpx.AsyncClient, scenario: str, retriever: str, queries: List[str],
+                   concurrency: int, total: int, warmup: int, cold_queries: bool) -> Dict[str, Any]:
+    """concurrency 个协程共同完成 total 个请求，返回延迟统计和各阶段耗时的 p50/p95"""
+    def query_at(i: int) -> str:
+        query = queries[i % len(queries)]
+        # 给查询加上编号，使查询向量缓存和答案缓存都不命中
+        return f"{query} #{next(_query_ids)}" if cold_queries else query
+    
+    for i in range(warmup):
+        request = build_request(scenario, retriever, query_at(i))
+        await client.post(request["path"], json=request["json"])
+    
+    latencies: List[float] = []
+    stages: Dict[str, List[float]] = {}
+    errors = 0
+    counter = iter(range(total))
+    
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            request = build_request(scenario, retriever, query_at(i))
+            start = time.perf_counter()
+            try:
+                response = await client.post(request["path"], json=request["json"])
+                response.raise_for_status()
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            for name, elapsed_ms in (response.json().get("timings") or {}).items():
+                stages.setdefault(name, []).append(elapsed_ms)
+    
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return {
+        **summarize(latencies, time.perf_counter() - start),
+        "errors": errors,
+        "stages": {
+            name: {"p50_ms": percentile(values, 50), "p95_ms": percentile(values, 95)}
+            for name, values in stages.items()
+        }
+    }
+
+async def run_scenarios(client: httpx.AsyncClient, args: argparse.Namespace, corpus_dir: str,
+                        queries: List[str], measure_rss: bool) -> Dict[str, Dict[str, Any]]:
+    results: Dict[str, Dict[str, Any]] = {}
+    # 本地运行时导入同时负责建库，未选择 ingest 场景也会执行，只是不报告
+    if "ingest" in args.scenarios or not args.url:
+        ingest = await run_ingest(client, args.retriever, corpus_dir)
+        if "ingest" in args.scenarios:
+            results["ingest@1"] = {"scenario": "ingest", "concurrency": 1, **ingest}
+            if measure_rss:
+                results["ingest@1"]["rss_mb"] = peak_rss_mb()
+            print(f"ingest: {ingest['requests']} chunks, {ingest['throughput']:.1f} chunks/s", flush=True)
+    for scenario in [name for name in args.scenarios if name != "ingest"]:
+        for concurrency in args.concurrency:
+            result = await run_load(client, scenario, args.retriever, queries, concurrency,
+                                    args.requests, args.warmup, args.cold_queries)
+            result.update(scenario=scenario, concurrency=concurrency)
+            if measure_rss:
+                result["rss_mb"] = peak_rss_mb()
+            results[f"{scenario}@{concurrency}"] = result
+            print(f"{scenario} concurrency={concurrency}: {result['throughput']:.1f} req/s, "
+                  f"p95 {result['p95_ms']:.1f}ms, errors {result['errors']}", flush=True)
+    return results
+
+async def run_inproc(args: argparse.Namespace, corpus_dir: str, queries: List[str]) -> Dict[str, Dict[str, Any]]:
+    import run
+    
+    # ASGITransport 不触发 lifespan，手动进入应用生命周期
+    async with run.lifespan(run.app):
+        transport = httpx.ASGITransport(app=run.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+            return await run_scenarios(client, args, corpus_dir, queries, measure_rss=True)
+
+async def run_http(args: argparse.Namespace, base_url: str, corpus_dir: str,
+                   queries: List[str], measure_rss: bool) -> Dict[str, Dict[str, Any]]:
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=limits) as client:
+        return await run_scenarios(client, args, corpus_dir, queries, measure_rss)
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+            tolerance: float) -> List[Dict[str, object]]:
+    """按 scenario@concurrency 对比吞吐和延迟，吞吐下降或延迟上升超过 tolerance 的记为回退"""
+    rows = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        metrics = ["throughput"] if result["scenario"] == "ingest" else ["throughput", "p50_ms", "p95_ms"]
+        for metric in metrics:
+            before, after = baseline[key].get(metric), result.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            worse = -change if metric == "throughput" else change
+            rows.append({
+                "case": key, "metric": metric, "baseline": float(before), "current": float(after),
+                "change_pct": change * 100, "regression": "yes" if worse > tolerance else ""
+            })
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="服务端到端吞吐、延迟、内存和阶段耗时压测")
+    parser.add_argument("--mode", choices=["inproc", "http"], default="inproc",
+                        help="inproc 进程内ASGI调用，http 在本机端口上运行 uvicorn")
+    parser.add_argument("--url", type=str, default=None, help="压测已运行的服务，不替换模型")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS, help="执行的场景")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="各档并发数")
+    parser.add_argument("--requests", type=int, default=64, help="每档并发的请求总数")
+    parser.add_argument("--warmup", type=int, default=4, help="每档开始前串行发送、不计入统计的请求数")
+    parser.add_argument("--retriever", type=str, default="langchain_rag", help="检索器名称")
+    parser.add_argument("--cold-queries", action="store_true", help="给查询加编号，使查询向量缓存不命中")
+    parser.add_argument("--answer-cache", action="store_true", help="开启答案缓存（默认关闭，每次都调用LLM）")
+    parser.add_argument("--eval-file", type=str, default=DEFAULT_EVAL_FILE, help="语料和查询")
+    parser.add_argument("--ingest-copies", type=int, default=20, help="语料复制份数（每份一个文件）")
+    parser.add_argument("--corpus-dir", type=str, default=None, help="在该目录下生成语料，默认使用临时目录")
+    parser.add_argument("--llm-ttft-ms", type=float, default=200, help="模拟LLM首token延迟")
+    parser.add_argument("--llm-tokens-per-s", type=float, default=50, help="模拟LLM生成速度")
+    parser.add_argument("--llm-tokens", type=int, default=32, help="模拟LLM答案token数")
+    parser.add_argument("--embed-ms", type=float, default=0.0, help="哈希嵌入模型每次调用的模拟耗时")
+    parser.add_argument("--save", type=str, default=None, help="把结果保存为基线JSON")
+    parser.add_argument("--compare", type=str, default=None, help="与基线JSON对比")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="对比时允许的相对变化")
+    parser.add_argument("--fail-on-regression", action="store_true", help="存在回退时以非零状态退出")
+    args = parser.parse_args()
+    
+    with open(args.eval_file, encoding="utf-8") as f:
+        queries = [item["query"] for item in json.load(f)["queries"]]
+    workdir = tempfile.mkdtemp(prefix="service_bench_")
+    # 指定 --corpus-dir 时在其中新建子目录，结束后只删除该子目录
+    if args.corpus_dir:
+        os.makedirs(args.corpus_dir, exist_ok=True)
+        corpus_dir = os.path.abspath(tempfile.mkdtemp(prefix="service_bench_", dir=args.corpus_dir))
+    else:
+        corpus_dir = os.path.join(workdir, "corpus")
+    write_corpus(args.eval_file, corpus_dir, args.ingest_copies)
+    try:
+        if args.url:
+            results = asyncio.run(run_http(args, args.url, corpus_dir, queries, measure_rss=False))
+        else:
+            # 导入 app 下的模块会创建配置实例，需先设置环境变量
+            mock_port = free_port()
+            configure_env(args, workdir, corpus_dir, f"http://127.0.0.1:{mock_port}/v1")
+            from app.services.mock_llm import MockLLM, create_app
+            
+            mock = MockLLM(args.llm_ttft_ms, args.llm_tokens_per_s, args.llm_tokens)
+            mock_server = start_server(create_app(mock), mock_port)
+            if args.mode == "inproc":
+                results = asyncio.run(run_inproc(args, corpus_dir, queries))
+            else:
+                import run
+                
+                server = start_server(run.app, free_port())
+                try:
+                    base_url = f"http://127.0.0.1:{server.config.port}"
+                    results = asyncio.run(run_http(args, base_url, corpus_dir, queries, measure_rss=True))
+                finally:
+                    server.should_exit = True
+            mock_server.should_exit = True
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        if args.corpus_dir:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+    
+    print(f"mode={args.url or args.mode} requests={args.requests} llm_ttft={args.llm_ttft_ms}ms "
+          f"llm_tps={args.llm_tokens_per_s} llm_tokens={args.llm_tokens}")
+    print_table(list(results.values()), ["scenario", "concurrency", "requests", "throughput", "mean_ms",
+                                         "p50_ms", "p95_ms", "p99_ms", "errors", "rss_mb"])
+    stage_rows = [
+        {"case": key, "stage": name, **values}
+        for key, result in results.items() for name, values in result.get("stages", {}).items()
+    ]
+    if stage_rows:
+        print()
+        print_table(stage_rows, ["case", "stage", "p50_ms", "p95_ms"])
+    
+    if args.save:
+        directory = os.path.dirname(args.save)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        meta = {key: value for key, value in vars(args).items() if key not in ("save", "compare")}
+        meta.update(python=sys.version.split()[0], platform=platform.platform(), created_at=time.time())
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"meta": meta, "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"baseline saved to {args.save}")
+    
+    regressions = 0
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        # 运行参数不同时结果不可直接比较，提示差异项
+        differs = [
+            key for key, value in vars(args).items()
+            if key in baseline["meta"] and key not in ("compare", "tolerance", "fail_on_regression", "scenarios", "concurrency")
+            and baseline["meta"][key] != value
+        ]
+        if differs:
+            print(f"warning: options differ from baseline: {', '.join(differs)}")
+        rows = compare(results, baseline["results"], args.tolerance)
+        regressions = sum(1 for row in rows if row["regression"])
+        print()
+        print(f"compared with {args.compare} (tolerance {args.tolerance:.0%}): {regressions} regression(s)")
+        if rows:
+            print_table(rows, ["case", "metric", "baseline", "current", "change_pct", "regression"])
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
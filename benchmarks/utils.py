@@ -0,0 +1,58 @@
+import resource
+import socket
+import statistics
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Sequence
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """计算百分位数（最近秩法），values 为空时返回 0"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+def peak_rss_mb() -> float:
+    """当前进程的峰值RSS（MB）"""
+    # Linux 上 ru_maxrss 单位为KB，macOS 上为字节
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+def summarize(latencies: List[float], elapsed: float) -> Dict[str, float]:
+    """汇总一组请求延迟（秒），返回毫秒级统计和吞吐"""
+    return {
+        "requests": len(latencies),
+        "throughput": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "mean_ms": statistics.fmean(latencies) * 1000 if latencies else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+def print_table(rows: List[Dict[str, object]], columns: List[str]) -> None:
+    """以对齐的文本表格打印结果"""
+    def fmt(value: object) -> str:
+        return f"{value:.2f}" if isinstance(value, float) else str(value)
+    
+    widths = {c: max(len(c), *(len(fmt(r.get(c, ""))) for r in rows)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    print("  ".join("-" * widths[c] for c in columns))
+    for row in rows:
+        print("  ".join(fmt(row.get(c, "")).ljust(widths[c]) for c in columns))
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(app: Any, port: int) -> Any:
+    """在后台线程中用 uvicorn 运行应用，启动完成（含 lifespan）后返回 Server，设置 should_exit 停止"""
+    import uvicorn
+    
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
@@ -22,6 +22,22 @@ load_dotenv()
 import traceback
 
 from openai import OpenAI
+try:
+    # 在服务仓库中运行时记录链路追踪（TRACING_EXPORTER 配置导出方式，见 .env.example）
+    from app.utils.tracing import span
+except ImportError:
+    class _NoopSpan:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def set_attribute(self, key, value):
+            pass
+
+    def span(name, **attributes):
+        return _NoopSpan()
 
 
 class MCPClient(object):
@@ -59,9 +75,25 @@ class MCPClient(object):
         response = await self.session.list_tools()
         print("链接服务器成功，服务段支持一下工具:", [tool.name for tool in response.tools])
 
+    def _chat_completion(self, **kwargs):
+        # 记录每次LLM调用的耗时和token用量
+        with span("llm", **{"llm.model": self.model, "llm.messages": len(kwargs["messages"])}) as llm_span:
+            response = self.client.chat.completions.create(model=self.model, **kwargs)
+            if response.usage is not None:
+                llm_span.set_attribute("llm.input_tokens", response.usage.prompt_tokens)
+                llm_span.set_attribute("llm.output_tokens", response.usage.completion_tokens)
+            llm_span.set_attribute("llm.finish_reason", response.choices[0].finish_reason)
+            return response
+
     async def process_query(self, query):
+        with span("mcp.process_query", query_chars=len(query)):
+            return await self._process_query(query)
+
+    async def _process_query(self, query):
         messages = [{"role": "user", "content": query}]
-        tools_info = await self.session.list_tools()
+        with span("mcp.list_tools") as list_span:
+            tools_info = await self.session.list_tools()
+            list_span.set_attribute("mcp.tools", len(tools_info.tools))
 
 
         available_tools = [{
@@ -73,8 +105,7 @@ class MCPClient(object):
             }
         } for tool in tools_info.tools]
 
-        response = self.client.chat.completions.create(
-            model=self.model,
+        response = self._chat_completion(
             messages=messages,
             tools=available_tools
         )
@@ -86,7 +117,10 @@ class MCPClient(object):
             tool_args = json.loads(tool_call.function.arguments)
 
             # 执行工具
-            result = await self.session.call_tool(tool_name, tool_args)
+            with span("mcp.call_tool", **{"mcp.tool": tool_name}) as tool_span:
+                result = await self.session.call_tool(tool_name, tool_args)
+                tool_span.set_attribute("mcp.is_error", bool(result.isError))
+                tool_span.set_attribute("mcp.result_chars", len(result.content[0].text) if result.content else 0)
             print(f"执行的工具名: {tool_name}, 参数: {tool_args}")
 
             messages.append(message.model_dump())
@@ -95,8 +129,7 @@ class MCPClient(object):
                 "content": result.content[0].text,
                 "tool_call_id": tool_call.id
             })
-            response = self.client.chat.completions.create(
-                model=self.model,
+            response = self._chat_completion(
                 messages=messages
             )
             return response.choices[0].message.content
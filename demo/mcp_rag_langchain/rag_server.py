@@ -10,14 +10,19 @@
 
 
 import asyncio
-from langchain_community.document_loaders import PyPDFLoader, TextLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import Chroma
 from langchain_openai import ChatOpenAI
 # from langchain_community.chains import RetrievalQA
 from langchain_classic.chains import RetrievalQA
 from langchain_huggingface.embeddings import HuggingFaceEmbeddings
 import os
+try:
+    # 在服务仓库中运行时，与同进程的检索器共用嵌入模型池（也支持独立嵌入进程）
+    from app.models.embeddings import acquire_embedding_model
+    from app.services.ingestion_service import IngestionService
+except ImportError:
+    acquire_embedding_model = None
+    IngestionService = None
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -32,11 +37,14 @@ class RAGSystem(object):
         )
         # 优先从环境变量获取本地模型路径，否则使用默认本地路径
         embed_model_path = os.getenv("EMBED_MODEL_PATH", "e:/github_project/models/bge-large-zh-v1.5")
-        self.embedding = HuggingFaceEmbeddings(
-            model_name=embed_model_path,
-            model_kwargs={'device': 'cpu'},
-            encode_kwargs={'normalize_embeddings': True}
-        )
+        if acquire_embedding_model is not None:
+            self.embedding = acquire_embedding_model(embed_model_path)
+        else:
+            self.embedding = HuggingFaceEmbeddings(
+                model_name=embed_model_path,
+                model_kwargs={'device': 'cpu'},
+                encode_kwargs={'normalize_embeddings': True}
+            )
         self.vectorstore=Chroma(
             collection_name=self.config["collection_name"],
             embedding_function=self.embedding,
@@ -49,38 +57,23 @@ class RAGSystem(object):
                 "k":self.config.get("top_k", 5)
             }
         )
-    def _load_documents(self, file_paths):
-        docs=[]
-        for path in file_paths:
-            if path.endswith(".pdf"):
-                loader = PyPDFLoader(path)
-            elif path.endswith(".txt"):
-                loader = TextLoader(path, encoding="utf-8")
-            else:
-                raise ValueError(f"跳过不支持的文件格式: {path}")
-            docs.extend(loader.load())
-        return docs
-
-    def _chunk_documents(self, docs):
-        text_splitter = RecursiveCharacterTextSplitter(
+    def build_knowledge(self, file_paths):
+        # 由服务的导入流程加载、切分并写入向量库：块ID由来源路径、块内容和前一个块的内容决定，
+        # 内容未变化的文件按清单跳过，修改后的文件只重新向量化变化的块，不会留下旧版本的文档块
+        if IngestionService is None:
+            raise RuntimeError("构建知识库需要在服务仓库根目录下运行（依赖 app.services.ingestion_service）")
+        ingestion = IngestionService(
+            self.embedding,
+            self.vectorstore._collection,
+            os.path.join(self.config["persist_dir"], f"ingest_manifest_{self.config['collection_name']}.json"),
             chunk_size=self.config.get("chunk_size", 500),
             chunk_overlap=self.config.get("chunk_overlap", 50),
-            length_function=len,
-            is_separator_regex=True
+            workers=0  # 本模块在导入时构建知识库，不使用 spawn 子进程（子进程会重新执行模块）
         )
-        return text_splitter.split_documents(docs)
-
-    def build_knowledge(self, file_paths):
-        #1.加载文档
-        raw_docs = self._load_documents(file_paths)
-
-        #2.切分文档-切块
-        chunks = self._chunk_documents(docs = raw_docs)
-
-        #3.生成向量并存储
-        self.vectorstore.add_documents(chunks)
-        self.vectorstore.persist()
-        print(f"知识库构建完成,文档块数为:{len(chunks)}")
+        stats = ingestion.ingest(file_paths)
+        for error in stats["errors"]:
+            print(f"导入失败: {error['file']}: {error['error']}")
+        print(f"知识库构建完成,新增文档块数为:{stats['chunks_embedded']},跳过未变化的文件数为:{stats['files_skipped']}")
 
     def query(self, question):
         qa_chain=RetrievalQA.from_chain_type(
@@ -1,21 +1,81 @@
-from fastapi import FastAPI
-from app.api.v1 import agent_router, retrieval_router
-from app.utils.config import get_retrieval_config
+import time
+
+# 记录应用模块导入耗时
+_import_start = time.perf_counter()
+
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-import os
 
-# 加载环境变量
+# 加载环境变量（需在导入配置模块之前，配置实例在导入时读取环境变量）
 load_dotenv()
 
+from fastapi import FastAPI
+from app.api.health import router as health_router, readiness_middleware
+from app.api.metrics import router as metrics_router
+from app.api.v1 import agent_router, retrieval_router, ingest_router
+from app.services.ingestion_jobs import shutdown_ingestion_manager
+from app.services.readiness import get_readiness, reset_readiness
+from app.services.retrieval_service import get_retrieval_service, shutdown_retrieval_service
+from app.utils.concurrency import shutdown_executor
+from app.utils.config import get_service_config
+from app.utils.logger import get_logger
+from app.utils.tracing import shutdown_tracing, trace_requests
+import asyncio
+import os
+
+logger = get_logger(__name__)
+logger.info("应用模块导入耗时 %.2fs", time.perf_counter() - _import_start)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动时创建共享检索服务并按需预热，关闭时释放检索器资源
+    
+    warmup_mode 为 background 时先开始监听端口，在后台任务中预热（/readyz 报告进度），
+    blocking 时预热完成后才开始监听；未开启预热时直接就绪，检索器在首次请求时加载。
+    """
+    service = get_retrieval_service()
+    service_config = get_service_config()
+    readiness = get_readiness()
+    warmup_task = None
+    if not service_config.warmup_on_startup:
+        readiness.mark_ready()
+    elif service_config.warmup_mode == "background":
+        warmup_task = asyncio.create_task(
+            readiness.run_warmup(service, service_config.warmup_retrievers or None)
+        )
+    else:
+        # 预热会加载嵌入模型，放到线程中执行避免阻塞事件循环
+        await readiness.run_warmup(service, service_config.warmup_retrievers or None)
+    logger.info("服务开始接收请求，自导入起耗时 %.2fs", time.perf_counter() - _import_start)
+    yield
+    if warmup_task is not None and not warmup_task.done():
+        # 预热线程无法中断，等待其结束后再释放资源
+        await asyncio.wait([warmup_task])
+    await readiness.stop()
+    shutdown_ingestion_manager()
+    shutdown_retrieval_service()
+    shutdown_executor()
+    reset_readiness()
+    shutdown_tracing()
+
 app = FastAPI(
     title="Agent Service API",
     description="基于FastAPI的MVC架构Agent服务",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# 预热完成前按配置拒绝或排队 /api 请求
+app.middleware("http")(readiness_middleware)
+# 链路追踪（后注册的中间件在外层，被拒绝的请求同样有span）
+app.middleware("http")(trace_requests)
+
 # 注册路由
+app.include_router(health_router)
+app.include_router(metrics_router)
 app.include_router(agent_router, prefix="/api/v1")
 app.include_router(retrieval_router, prefix="/api/v1")
+app.include_router(ingest_router, prefix="/api/v1")
 
 @app.get("/")
 async def root():
@@ -23,7 +83,7 @@ async def root():
     return {
         "message": "Agent Service is running",
         "version": "1.0.0",
-        "retrievers": list(get_retrieval_config().dict().keys())
+        "retrievers": list(get_retrieval_service().list_retrievers())
     }
 
 if __name__ == "__main__":
@@ -0,0 +1,94 @@
+import types
+import pytest
+from app.services import answer_cache
+from app.services.answer_cache import AnswerCache
+
+class FakeClock:
+    """可手动推进的 monotonic 时钟"""
+    
+    def __init__(self):
+        self.now = 1000.0
+    
+    def monotonic(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(answer_cache, "time", types.SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+def test_exact_hit_uses_normalized_query():
+    cache = AnswerCache(semantic_threshold=None)
+    scope = AnswerCache.make_scope("rag", {})
+    cache.put(scope, "萧炎是谁？", {"answer": "a"})
+    
+    assert cache.get(scope, " 萧炎是谁 ")[:2] == ({"answer": "a"}, "exact")
+    assert cache.get(scope, "ＡＢＣ")[1] is None
+
+def test_entries_expire_after_ttl(clock):
+    cache = AnswerCache(ttl_seconds=10, semantic_threshold=None)
+    scope = AnswerCache.make_scope("rag", {})
+    cache.put(scope, "q", {"answer": "a"})
+    
+    clock.now += 9.9
+    assert cache.get(scope, "q")[1] == "exact"
+    clock.now += 0.2
+    assert cache.get(scope, "q") == (None, None, None)
+    assert cache.stats()["entries"] == 0
+
+def test_lru_evicts_least_recently_used():
+    cache = AnswerCache(max_entries=2, semantic_threshold=None)
+    scope = AnswerCache.make_scope("rag", {})
+    cache.put(scope, "a", {"answer": "a"})
+    cache.put(scope, "b", {"answer": "b"})
+    # 访问 a 后 b 成为最久未使用的条目
+    cache.get(scope, "a")
+    cache.put(scope, "c", {"answer": "c"})
+    
+    assert cache.get(scope, "a")[1] == "exact"
+    assert cache.get(scope, "b")[1] is None
+    assert cache.get(scope, "c")[1] == "exact"
+    assert cache.stats()["evictions"] == 1
+
+def test_scope_separates_retriever_options_and_version():
+    cache = AnswerCache(semantic_threshold=None)
+    scope = AnswerCache.make_scope("rag", {"top_k": 3, "search_type": "mmr"}, (1, 10))
+    cache.put(scope, "q", {"answer": "a"})
+    
+    # 参数顺序不影响作用域
+    assert cache.get(AnswerCache.make_scope("rag", {"search_type": "mmr", "top_k": 3}, (1, 10)), "q")[1] == "exact"
+    assert cache.get(AnswerCache.make_scope("rag", {"top_k": 5, "search_type": "mmr"}, (1, 10)), "q")[1] is None
+    assert cache.get(AnswerCache.make_scope("rag", {"top_k": 3, "search_type": "mmr"}, (2, 10)), "q")[1] is None
+    assert cache.get(AnswerCache.make_scope("hybrid", {"top_k": 3, "search_type": "mmr"}, (1, 10)), "q")[1] is None
+
+def test_invalidate_by_retriever():
+    cache = AnswerCache(semantic_threshold=None)
+    rag, hybrid = AnswerCache.make_scope("rag", {}), AnswerCache.make_scope("hybrid", {})
+    cache.put(rag, "q", {"answer": "a"})
+    cache.put(hybrid, "q", {"answer": "b"})
+    
+    assert cache.invalidate("rag") == 1
+    assert cache.get(rag, "q")[1] is None
+    assert cache.get(hybrid, "q")[1] == "exact"
+
+def test_semantic_hit_within_scope_only():
+    cache = AnswerCache(semantic_threshold=0.9)
+    scope = AnswerCache.make_scope("rag", {})
+    cache.put(scope, "萧炎的朋友", {"answer": "a"}, embedding=[1.0, 0.0])
+    
+    result, hit, embedding = cache.get(scope, "萧炎有哪些朋友", embed_fn=lambda: [0.99, 0.1])
+    assert (result, hit) == ({"answer": "a"}, "semantic")
+    assert embedding == [0.99, 0.1]
+    assert cache.get(scope, "药老", embed_fn=lambda: [0.0, 1.0])[1] is None
+    assert cache.get(AnswerCache.make_scope("hybrid", {}), "萧炎有哪些朋友", embed_fn=lambda: [0.99, 0.1])[1] is None
+
+def test_exact_hit_skips_embedding():
+    cache = AnswerCache(semantic_threshold=0.9)
+    scope = AnswerCache.make_scope("rag", {})
+    cache.put(scope, "q", {"answer": "a"}, embedding=[1.0, 0.0])
+    
+    def embed():
+        raise AssertionError("exact hit must not embed the query")
+    
+    assert cache.get(scope, "q", embed_fn=embed)[1] == "exact"
@@ -0,0 +1,83 @@
+import asyncio
+import threading
+import time
+import pytest
+from app.models.embeddings import BatchingEmbeddings
+from app.models.hash_embeddings import HashEmbeddings
+
+class RecordingEmbeddings(HashEmbeddings):
+    """记录每次批量调用的文本数，release 未设置时阻塞计算"""
+    
+    def __init__(self):
+        super().__init__(dim=16)
+        self.batches = []
+        self.release = threading.Event()
+        self.release.set()
+        self.fail = False
+    
+    def embed_documents(self, texts):
+        self.release.wait(5)
+        self.batches.append(len(texts))
+        if self.fail:
+            raise RuntimeError("model error")
+        return super().embed_documents(texts)
+
+@pytest.fixture
+def inner():
+    return RecordingEmbeddings()
+
+@pytest.fixture
+def batcher(inner):
+    batcher = BatchingEmbeddings(inner, max_batch_size=8, max_wait_ms=200)
+    yield batcher
+    inner.release.set()
+    batcher.close()
+
+def test_lone_query_does_not_wait_for_batch_window(batcher, inner):
+    start = time.perf_counter()
+    vector = batcher.embed_query("萧炎")
+    
+    # 单独的查询立即计算，不等待 200ms 的凑批窗口
+    assert time.perf_counter() - start < 0.1
+    assert vector == HashEmbeddings(dim=16).embed_query("萧炎")
+    assert inner.batches == [1]
+
+def test_queued_queries_are_embedded_together(batcher, inner):
+    # 第一批计算期间到达的请求在队列中累积，由下一批一并处理
+    inner.release.clear()
+    results = {}
+    
+    def query(i):
+        results[i] = batcher.embed_query(f"q{i}")
+    
+    threads = [threading.Thread(target=query, args=(i,)) for i in range(12)]
+    threads[0].start()
+    time.sleep(0.1)
+    for thread in threads[1:]:
+        thread.start()
+    time.sleep(0.1)
+    inner.release.set()
+    for thread in threads:
+        thread.join(5)
+    
+    assert inner.batches[0] == 1
+    assert sum(inner.batches) == 12 and max(inner.batches) == 8
+    expected = HashEmbeddings(dim=16)
+    assert all(results[i] == expected.embed_query(f"q{i}") for i in range(12))
+    assert batcher.stats()["items"] == 12
+
+def test_errors_propagate_to_caller(batcher, inner):
+    inner.fail = True
+    
+    with pytest.raises(RuntimeError, match="model error"):
+        batcher.embed_query("q")
+    inner.fail = False
+    assert len(batcher.embed_query("q")) == 16
+
+def test_async_query(batcher):
+    async def main():
+        return await asyncio.gather(*(batcher.aembed_query(f"q{i}") for i in range(3)))
+    
+    vectors = asyncio.run(main())
+    expected = HashEmbeddings(dim=16)
+    assert vectors == [expected.embed_query(f"q{i}") for i in range(3)]
@@ -0,0 +1,86 @@
+import pytest
+from app.models.bm25 import BM25Index, resolve_tokenizer, tokenize
+
+DOCS = {
+    "a": "萧炎在迦南学院修炼斗气",
+    "b": "药老传授萧炎炼药术",
+    "c": "型号 SKU-1024 的产品说明",
+    "d": "云岚宗宗主云韵"
+}
+
+def build(**kwargs) -> BM25Index:
+    index = BM25Index("bigram", **kwargs)
+    index.add(list(DOCS), list(DOCS.values()))
+    return index
+
+def test_tokenize_words_and_codes():
+    assert tokenize("Version v2.1 of SKU-1024") == ["version", "v2.1", "v2", "1", "of", "sku-1024", "sku", "1024"]
+
+def test_tokenize_cjk_bigrams():
+    assert tokenize("萧炎修炼") == ["萧炎", "炎修", "修炼"]
+    assert tokenize("炎 a") == ["a", "炎"]
+
+def test_resolve_tokenizer_rejects_unknown():
+    assert resolve_tokenizer("bigram") == "bigram"
+    with pytest.raises(ValueError):
+        resolve_tokenizer("char")
+
+def test_search_ranks_matching_documents():
+    index = build()
+    
+    hits = index.search("萧炎修炼", k=2)
+    assert [doc_id for doc_id, _ in hits] == ["a", "b"]
+    assert hits[0][1] > hits[1][1] > 0
+    assert index.search("sku-1024", k=5)[0][0] == "c"
+    assert index.search("不存在的词语", k=5) == []
+
+def test_remove_and_replace_documents():
+    index = build()
+    index.remove(["a"])
+    
+    assert [doc_id for doc_id, _ in index.search("修炼斗气", k=5)] == []
+    index.add(["b"], ["修炼斗气"])
+    assert [doc_id for doc_id, _ in index.search("修炼斗气", k=5)] == ["b"]
+    assert len(index) == 3
+
+def test_compact_keeps_results():
+    index = build()
+    index.remove(["b"])
+    before = index.search("萧炎", k=5)
+    
+    index.compact()
+    assert index.search("萧炎", k=5) == before
+    assert index.doc_ids == ["a", "c", "d"]
+
+def test_save_and_load_roundtrip(tmp_path):
+    path = str(tmp_path / "bm25.npz")
+    index = build(k1=1.2, b=0.5)
+    index.remove(["d"])
+    index.save(path)
+    
+    loaded = BM25Index.load(path, "bigram", k1=1.2, b=0.5)
+    assert loaded is not None and not loaded.dirty
+    assert len(loaded) == 3
+    for query in ("萧炎", "sku-1024", "炼药"):
+        assert loaded.search(query, k=5) == index.search(query, k=5)
+
+def test_load_applies_configured_params(tmp_path):
+    path = str(tmp_path / "bm25.npz")
+    build().save(path)
+    
+    loaded = BM25Index.load(path, "bigram", k1=0.9, b=0.3)
+    assert (loaded.k1, loaded.b) == (0.9, 0.3)
+    # 参数变化后标记为待保存，得分与按新参数构建的索引一致
+    assert loaded.dirty
+    assert loaded.search("萧炎修炼", k=5) == build(k1=0.9, b=0.3).search("萧炎修炼", k=5)
+    
+    loaded.save()
+    assert not BM25Index.load(path, "bigram", k1=0.9, b=0.3).dirty
+
+def test_load_rejects_other_tokenizer_or_missing_file(tmp_path):
+    pytest.importorskip("jieba")
+    path = str(tmp_path / "bm25.npz")
+    build().save(path)
+    
+    assert BM25Index.load(path, "jieba") is None
+    assert BM25Index.load(str(tmp_path / "missing.npz"), "bigram") is None
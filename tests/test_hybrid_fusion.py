@@ -0,0 +1,75 @@
+from langchain_core.documents import Document
+from app.models.hybrid import HybridRetriever
+from app.schemas.retrieval import HybridSearchOptions
+
+class FakeCollection:
+    """按ID返回正文和元数据的向量库集合，只支持 where 的单字段等值过滤"""
+    
+    def __init__(self, docs):
+        self.docs = docs
+        self.requested = []
+    
+    def get(self, ids, where=None, include=None):
+        self.requested.append(list(ids))
+        hits = [
+            doc_id for doc_id in ids
+            if doc_id in self.docs and all(self.docs[doc_id][1].get(key) == value for key, value in (where or {}).items())
+        ]
+        return {
+            "ids": hits,
+            "documents": [self.docs[doc_id][0] for doc_id in hits],
+            "metadatas": [self.docs[doc_id][1] for doc_id in hits]
+        }
+
+def make_retriever(docs=None) -> HybridRetriever:
+    # 只测试融合逻辑，不打开向量库和BM25索引
+    retriever = HybridRetriever.__new__(HybridRetriever)
+    retriever.collection = FakeCollection(docs or {})
+    return retriever
+
+def dense(*ids):
+    return [(Document(id=doc_id, page_content=doc_id), 1.0 - i / 10) for i, doc_id in enumerate(ids)]
+
+def sparse(*ids):
+    return [(doc_id, 10.0 - i) for i, doc_id in enumerate(ids)]
+
+def test_rrf_scores_sum_reciprocal_ranks():
+    retriever = make_retriever({"c": ("c", {})})
+    options = HybridSearchOptions(top_k=5, rrf_k=60)
+    
+    fused = retriever._fuse(dense("a", "b"), sparse("b", "c"), options)
+    scores = {doc.id: score for doc, score in fused}
+    assert [doc.id for doc, _ in fused] == ["b", "a", "c"]
+    assert scores["b"] == 1 / 62 + 1 / 61
+    assert scores["a"] == 1 / 61
+    assert scores["c"] == 1 / 62
+
+def test_rrf_truncates_to_top_k():
+    retriever = make_retriever()
+    fused = retriever._fuse(dense("a", "b", "c"), sparse("c", "b"), HybridSearchOptions(top_k=2))
+    
+    # c: 1/63 + 1/61 略高于 b: 1/62 + 1/62
+    assert [doc.id for doc, _ in fused] == ["c", "b"]
+
+def test_sparse_only_hits_are_fetched_once_and_filtered():
+    retriever = make_retriever({
+        "x": ("正文x", {"source": "keep.txt"}),
+        "y": ("正文y", {"source": "drop.txt"})
+    })
+    options = HybridSearchOptions(top_k=5, filter={"source": "keep.txt"})
+    
+    fused = retriever._fuse(dense("a"), sparse("a", "x", "y"), options)
+    assert [doc.id for doc, _ in fused] == ["a", "x"]
+    assert fused[1][0].page_content == "正文x"
+    # 稠密检索已返回的文档不再从向量库读取
+    assert retriever.collection.requested == [["x", "y"]]
+
+def test_rrf_k_controls_rank_weight():
+    retriever = make_retriever({doc_id: (doc_id, {}) for doc_id in "pqr"})
+    dense_hits, sparse_hits = dense("a", "x", "y", "b"), sparse("p", "q", "r", "b")
+    
+    # rrf_k 较小时单路第1名（a）胜过两路都排第4的文档（b），较大时两路都召回的文档胜出
+    top = retriever._fuse(dense_hits, sparse_hits, HybridSearchOptions(top_k=1, rrf_k=1))
+    assert top[0][0].id == "a"
+    top = retriever._fuse(dense_hits, sparse_hits, HybridSearchOptions(top_k=1, rrf_k=60))
+    assert top[0][0].id == "b"
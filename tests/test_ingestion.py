@@ -0,0 +1,118 @@
+import json
+import os
+import pytest
+from app.models.hash_embeddings import HashEmbeddings
+from app.services.ingestion_service import ChunkIdSequence, IngestionManifest, IngestionService
+
+PARAGRAPHS = [f"第{i}段：萧炎在迦南学院修炼斗气，药老在旁指点。" for i in range(8)]
+
+def ids_for(source, chunks):
+    sequence = ChunkIdSequence(source)
+    return [sequence.next(text) for text in chunks]
+
+def test_chunk_ids_are_deterministic_and_content_chained():
+    chunks = ["甲", "乙", "丙", "丁"]
+    
+    assert ids_for("a.txt", chunks) == ids_for("a.txt", chunks)
+    assert set(ids_for("a.txt", chunks)).isdisjoint(ids_for("b.txt", chunks))
+    # 修改第2块只影响该块和紧随其后的块
+    edited = ids_for("a.txt", ["甲", "乙2", "丙", "丁"])
+    original = ids_for("a.txt", chunks)
+    assert [x == y for x, y in zip(edited, original)] == [True, False, False, True]
+    # 插入新块后，插入点之后第二个块起恢复原ID
+    inserted = ids_for("a.txt", ["甲", "新", "乙", "丙", "丁"])
+    assert inserted[3:] == original[2:]
+
+@pytest.fixture
+def collection(tmp_path):
+    chromadb = pytest.importorskip("chromadb")
+    return chromadb.PersistentClient(path=str(tmp_path / "db")).get_or_create_collection("test")
+
+@pytest.fixture
+def docs(tmp_path):
+    directory = tmp_path / "docs"
+    directory.mkdir()
+    for name in ("a", "b"):
+        (directory / f"{name}.txt").write_text("\n\n".join(PARAGRAPHS), encoding="utf-8")
+    return directory
+
+def make_service(collection, tmp_path, **kwargs):
+    return IngestionService(
+        HashEmbeddings(dim=16), collection, str(tmp_path / "db" / "manifest.json"),
+        chunk_size=40, chunk_overlap=0, workers=0, **kwargs
+    )
+
+def sources(collection):
+    return sorted(os.path.basename(meta["source"]) for meta in collection.get(include=["metadatas"])["metadatas"])
+
+def test_reingest_skips_unchanged_files(collection, docs, tmp_path):
+    first = make_service(collection, tmp_path).ingest([str(docs)])
+    assert first["files_indexed"] == 2 and first["chunks_embedded"] == collection.count() > 2
+    
+    second = make_service(collection, tmp_path).ingest([str(docs)])
+    assert second["files_skipped"] == 2
+    assert second["chunks_embedded"] == second["chunks_deleted"] == 0
+
+def test_changed_file_only_replaces_stale_chunks(collection, docs, tmp_path):
+    make_service(collection, tmp_path).ingest([str(docs)])
+    before = set(collection.get(include=[])["ids"])
+    
+    edited = list(PARAGRAPHS)
+    edited[3] = "第3段：内容已经修改。"
+    (docs / "a.txt").write_text("\n\n".join(edited), encoding="utf-8")
+    stats = make_service(collection, tmp_path).ingest([str(docs)])
+    after = set(collection.get(include=[])["ids"])
+    
+    assert stats["files_indexed"] == 1 and stats["files_skipped"] == 1
+    assert stats["chunks_deleted"] == len(before - after) > 0
+    assert stats["chunks_embedded"] == len(after - before) > 0
+    # 未变化的块保持原ID，不重新向量化
+    assert stats["chunks_embedded"] < stats["chunks_total"]
+
+def test_deleted_files_are_removed_from_collection_and_manifest(collection, docs, tmp_path):
+    service = make_service(collection, tmp_path)
+    service.ingest([str(docs)])
+    os.remove(docs / "b.txt")
+    
+    stats = make_service(collection, tmp_path).ingest([str(docs)])
+    assert stats["files_removed"] == 1 and stats["chunks_deleted"] > 0
+    assert set(sources(collection)) == {"a.txt"}
+    manifest = json.loads((tmp_path / "db" / "manifest.json").read_text(encoding="utf-8"))
+    assert [os.path.basename(source) for source in manifest] == ["a.txt"]
+
+def test_delete_files_removes_chunks_and_listener_entries(collection, docs, tmp_path):
+    class Listener:
+        def __init__(self):
+            self.ids = set()
+        
+        def add(self, ids, texts):
+            self.ids.update(ids)
+        
+        def remove(self, ids):
+            self.ids.difference_update(ids)
+        
+        def save(self):
+            pass
+    
+    listener = Listener()
+    service = make_service(collection, tmp_path, listeners=[listener])
+    service.ingest([str(docs)])
+    
+    deleted = service.delete_files([str(docs / "a.txt")])
+    assert deleted > 0 and not (docs / "a.txt").exists()
+    assert set(sources(collection)) == {"b.txt"}
+    assert listener.ids == set(collection.get(include=[])["ids"])
+
+def test_manifest_is_shared_and_refreshed(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    first, second = IngestionManifest.shared(path), IngestionManifest.shared(str(tmp_path / "." / "manifest.json"))
+    assert first is second
+    
+    first.update("a.txt", "h1", 3)
+    first.save()
+    # 其他进程写入的修改在下次 refresh 时读入
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"a.txt": {"hash": "h1", "chunks": 3}, "b.txt": {"hash": "h2", "chunks": 1}}, f)
+    os.utime(path, (0, 0))
+    first.refresh()
+    assert sorted(first.sources()) == ["a.txt", "b.txt"]